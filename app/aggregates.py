@@ -0,0 +1,92 @@
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.history import HistoryBuffer
+
+
+class Aggregates:
+    """Agregados acumulados do CSV (atualizados linha a linha no modo incremental)."""
+
+    def __init__(self):
+        self.total_vendas = 0
+        self.vendas_por_produto: Dict[str, int] = {}
+        self.estoque_por_produto: Dict[str, int] = {}
+        self.linhas = 0
+        self.ultimo_timestamp: Optional[str] = None
+        # Timestamp da linha que definiu o estoque atual de cada produto
+        self.estoque_ts: Dict[str, str] = {}
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            'total_vendas': self.total_vendas,
+            'vendas_por_produto': dict(self.vendas_por_produto),
+            'estoque_por_produto': dict(self.estoque_por_produto),
+            'linhas': self.linhas,
+            'ultimo_timestamp': self.ultimo_timestamp,
+            'estoque_ts': dict(self.estoque_ts),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Aggregates":
+        agg = cls()
+        agg.total_vendas = state['total_vendas']
+        agg.vendas_por_produto = dict(state['vendas_por_produto'])
+        agg.estoque_por_produto = dict(state['estoque_por_produto'])
+        agg.linhas = state['linhas']
+        agg.ultimo_timestamp = state['ultimo_timestamp']
+        agg.estoque_ts = dict(state.get('estoque_ts') or {})
+        return agg
+
+    def merge(self, other: "Aggregates"):
+        """Soma outro agregado parcial; o estoque mais recente (por timestamp) prevalece."""
+        self.total_vendas += other.total_vendas
+        for produto, vendas in other.vendas_por_produto.items():
+            self.vendas_por_produto[produto] = self.vendas_por_produto.get(produto, 0) + vendas
+        for produto, estoque in other.estoque_por_produto.items():
+            ts = other.estoque_ts.get(produto, '')
+            if produto not in self.estoque_por_produto or ts >= self.estoque_ts.get(produto, ''):
+                self.estoque_por_produto[produto] = estoque
+                self.estoque_ts[produto] = ts
+        self.linhas += other.linhas
+        if other.ultimo_timestamp and (self.ultimo_timestamp is None or other.ultimo_timestamp > self.ultimo_timestamp):
+            self.ultimo_timestamp = other.ultimo_timestamp
+
+    def fold(self, chunks, history: Optional[HistoryBuffer] = None, sinks=()) -> int:
+        """Acumula blocos colunares (ver app.csv_columns). Retorna quantas linhas foram lidas.
+
+        Núcleo comum aos caminhos stdlib e pandas. Cada bloco também é
+        repassado, como linhas tipadas, a ``sinks`` (rollups, janelas, índice de produtos),
+        que só precisam de um método ``extend``.
+        """
+        count = 0
+        # Só as últimas linhas interessam ao buffer
+        recent = deque(maxlen=history.capacity) if history is not None else None
+        vendas_por_produto = self.vendas_por_produto
+        get = vendas_por_produto.get
+        for timestamps, produtos, vendas, estoque in chunks:
+            if not produtos:
+                continue
+            self.total_vendas += sum(vendas)
+            for produto, v in zip(produtos, vendas):
+                vendas_por_produto[produto] = get(produto, 0) + v
+            # Último estoque (em ordem de arquivo) prevalece
+            self.estoque_por_produto.update(zip(produtos, estoque))
+            self.estoque_ts.update(zip(produtos, timestamps))
+            ts = max(timestamps)
+            if ts and (self.ultimo_timestamp is None or ts > self.ultimo_timestamp):
+                self.ultimo_timestamp = ts
+            count += len(produtos)
+            if history is not None:
+                keep = max(0, len(produtos) - history.capacity)
+                recent.extend(zip(timestamps[keep:], produtos[keep:], vendas[keep:], estoque[keep:]))
+            if sinks:
+                rows = list(zip(timestamps, produtos, vendas, estoque))
+                for sink in sinks:
+                    sink.extend(rows)
+        self.linhas += count
+        if history is not None:
+            history.extend(recent)
+        return count
+
+
+__all__ = ["Aggregates"]
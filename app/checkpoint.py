@@ -0,0 +1,346 @@
+"""Compactação do CSV append-only: segmentos de arquivo + checkpoint.
+
+Linhas de períodos fechados (timestamp anterior a ``ate``) saem do CSV vivo
+para segmentos em ``<stem>.archive/`` e seus agregados (totais, último
+estoque por produto, rollups e as linhas mais recentes do histórico) vão
+para ``<csv>.checkpoint.json``. O DataManager parte do checkpoint e lê
+apenas o CSV vivo, então o custo da carga acompanha o tamanho da cauda e
+não o do histórico.
+
+Os segmentos são a fonte da verdade; o checkpoint é derivado deles e pode
+ser reconstruído (``rebuild``). Ele registra o prefixo do CSV vivo que
+acompanha (sha1 dos primeiros bytes, estáveis sob append): se o CSV for
+trocado por outro, o checkpoint é ignorado.
+
+Ordem das gravações na compactação: segmento, novo CSV vivo em ``.tmp``,
+checkpoint, troca do CSV. O checkpoint novo também registra o prefixo do CSV
+que substitui (``origem``); enquanto o CSV no disco ainda for esse, a troca
+está pendente e ``Checkpoint.load`` levanta ``CompactionPending`` em vez de
+deixar a carga publicar o CSV antigo sem os períodos já arquivados. Uma
+compactação interrompida antes da troca é concluída pela próxima chamada de
+``compact`` ou ``rebuild``, a partir do ``.tmp``.
+
+A cópia final dos bytes acrescentados e a troca acontecem com uma trava
+exclusiva (``flock``) no CSV antigo. Quem acrescenta linhas (``lock_live``,
+ver app.ingest) pega a mesma trava e confere, com ela na mão, se o arquivo
+aberto ainda é o do caminho; se a troca aconteceu no meio, reabre. Assim
+nenhuma linha cai no arquivo antigo depois da última cópia.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, acréscimo e troca não são coordenados
+    fcntl = None  # type: ignore
+
+from app.aggregates import Aggregates
+from app.csv_columns import COLUMNS, iter_chunks
+from app.history import HistoryBuffer
+from app.rollups import TimeRollups, format_bucket, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+PREFIX_BYTES = 4096
+
+
+def checkpoint_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name + '.checkpoint.json')
+
+
+def archive_dir(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.stem + '.archive')
+
+
+def _live_tmp(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.name + '.tmp')
+
+
+class CompactionPending(RuntimeError):
+    """Checkpoint já gravado para um CSV vivo que ainda não substituiu o atual."""
+
+
+def _identity(data: bytes) -> Dict[str, Any]:
+    length = min(PREFIX_BYTES, len(data))
+    return {'bytes': length, 'sha1': hashlib.sha1(data[:length]).hexdigest()}
+
+
+def _same_file(identity: Dict[str, Any], prefix: bytes) -> bool:
+    length = identity['bytes']
+    return len(prefix) >= length and hashlib.sha1(prefix[:length]).hexdigest() == identity['sha1']
+
+
+def _opened_identity(f) -> Tuple[bytes, int]:
+    """Prefixo e inode do arquivo aberto ``f`` (a posição de leitura é preservada)."""
+    pos = f.tell()
+    f.seek(0)
+    prefix = f.read(PREFIX_BYTES)
+    f.seek(pos)
+    return prefix, os.fstat(f.fileno()).st_ino
+
+
+def lock_live(f):
+    """Trava exclusiva no arquivo aberto ``f`` (liberada ao fechá-lo)."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def open_live(csv_path: Path, mode: str = 'a+b'):
+    """Abre o CSV vivo com a trava de ``lock_live``, reabrindo se ele foi trocado durante a espera."""
+    while True:
+        f = open(csv_path, mode)
+        lock_live(f)
+        try:
+            if os.stat(csv_path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """Estado agregado das linhas arquivadas."""
+
+    def __init__(self, state: Dict[str, Any]):
+        self.state = state
+
+    @property
+    def segmentos(self) -> List[str]:
+        return list(self.state['segmentos'])
+
+    @property
+    def ate(self) -> Optional[str]:
+        return self.state.get('ate')
+
+    def aggregates(self) -> Aggregates:
+        return Aggregates.from_state(self.state['agregados'])
+
+    def history(self, capacity: int) -> HistoryBuffer:
+        history = HistoryBuffer(capacity)
+        history.extend(tuple(r) for r in self.state['historico'])
+        return history
+
+    def rollups(self, resolutions: Optional[Dict[str, int]] = None) -> TimeRollups:
+        rollups = TimeRollups(resolutions)
+        rollups.apply_state(self.state['rollups'], replace=True)
+        return rollups
+
+    def matches(self, prefix: bytes) -> bool:
+        """``prefix``: primeiros ``PREFIX_BYTES`` do CSV vivo."""
+        return _same_file(self.state['vivo'], prefix)
+
+    def pending(self, prefix: bytes, inode: int) -> bool:
+        """O arquivo é o CSV que a compactação deste checkpoint ainda vai substituir.
+
+        Compara também o inode: o CSV antigo e o novo podem ter o mesmo
+        prefixo (linhas arquivadas só depois dos primeiros bytes).
+        """
+        origem = self.state.get('origem')
+        return origem is not None and inode == origem['inode'] and _same_file(origem, prefix)
+
+    @classmethod
+    def load(cls, csv_path: Path, f=None) -> Optional["Checkpoint"]:
+        """Checkpoint do CSV, ou None se não existe, é inválido ou é de outro CSV.
+
+        ``f`` é o CSV já aberto pelo chamador, para comparar com o mesmo
+        arquivo que ele vai carregar mesmo que o caminho seja trocado no meio.
+        Levanta ``CompactionPending`` se a troca do CSV vivo ainda não ocorreu.
+        """
+        path = checkpoint_path(csv_path)
+        if not path.exists():
+            return None
+        try:
+            state = json.loads(path.read_text(encoding='utf-8'))
+            if state.get('formato') != FORMAT_VERSION:
+                return None
+            checkpoint = cls(state)
+            if f is None:
+                with open(csv_path, 'rb') as own:
+                    prefix, inode = _opened_identity(own)
+            else:
+                prefix, inode = _opened_identity(f)
+            if checkpoint.pending(prefix, inode):
+                raise CompactionPending(f"compactação de {csv_path} aguardando a troca do CSV vivo")
+            if not checkpoint.matches(prefix):
+                logger.warning(
+                    "checkpoint_incompativel",
+                    extra={"csv": str(csv_path), "dica": "python src/compact_csv.py --reconstruir"},
+                )
+                return None
+            return checkpoint
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("checkpoint_invalido", extra={"erro": str(e)})
+            return None
+
+
+def _save(csv_path: Path, agg: Aggregates, rollups: TimeRollups, history: HistoryBuffer,
+          segmentos: List[str], ate: Optional[str], live: bytes, origem: Optional[Dict[str, Any]] = None):
+    state = {
+        'formato': FORMAT_VERSION,
+        'ate': ate,
+        'segmentos': segmentos,
+        'vivo': _identity(live),
+        'agregados': agg.to_state(),
+        'rollups': rollups.to_state(),
+        'historico': [list(r) for r in history.rows()],
+    }
+    if origem is not None:
+        state['origem'] = origem
+    _write_atomic(checkpoint_path(csv_path), json.dumps(state, separators=(',', ':')).encode('utf-8'))
+
+
+def _split_complete(data: bytes):
+    cut = data.rfind(b'\n') + 1
+    return data[:cut], data[cut:]
+
+
+def _append_from(csv_path: Path, offset: int, f) -> int:
+    """Copia para ``f`` o que foi acrescentado ao CSV a partir de ``offset``. Retorna o novo offset."""
+    with open(csv_path, 'rb') as src:
+        src.seek(offset)
+        data = src.read()
+    f.write(data)
+    return offset + len(data)
+
+
+def _finish_swap(csv_path: Path):
+    """Conclui uma compactação interrompida entre o checkpoint e a troca do CSV vivo."""
+    tmp = _live_tmp(csv_path)
+    origem = json.loads(checkpoint_path(csv_path).read_text(encoding='utf-8'))['origem']
+    if not tmp.exists():
+        raise RuntimeError(f"compactação interrompida e {tmp} não encontrado; restaure o CSV ou o checkpoint")
+    with open(tmp, 'r+b') as f, open_live(csv_path, 'rb'):
+        f.truncate(origem['tmp_bytes'])
+        f.seek(0, os.SEEK_END)
+        _append_from(csv_path, origem['lidos'], f)
+        f.flush()
+        os.fsync(f.fileno())
+        os.replace(tmp, csv_path)
+    logger.warning("compactacao_concluida", extra={"csv": str(csv_path)})
+
+
+def _load_previous(csv_path: Path) -> Optional[Checkpoint]:
+    try:
+        return Checkpoint.load(csv_path)
+    except CompactionPending:
+        _finish_swap(csv_path)
+        return Checkpoint.load(csv_path)
+
+
+def compact(csv_path: Path, ate: Optional[str] = None, history_size: int = 1000,
+            resolutions: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Arquiva as linhas com timestamp anterior a ``ate``.
+
+    Sem ``ate``, arquiva os dias completos: tudo antes da meia-noite (UTC) do
+    dia do maior timestamp do arquivo. Retorna um resumo da operação.
+    """
+    previous = None
+    if checkpoint_path(csv_path).exists():
+        previous = _load_previous(csv_path)
+        if previous is None:
+            raise RuntimeError("checkpoint não corresponde ao CSV; rode com --reconstruir antes de compactar")
+    archive = archive_dir(csv_path)
+    known = set(previous.segmentos) if previous else set()
+    # Segmentos fora do checkpoint: compactação interrompida antes de gravar o checkpoint
+    for orphan in sorted(archive.glob('*.csv')) if archive.exists() else ():
+        if orphan.name not in known:
+            logger.warning("segmento_orfao_removido", extra={"segmento": orphan.name})
+            orphan.unlink()
+
+    with open(csv_path, 'rb') as f:
+        data = f.read()
+        inode = os.fstat(f.fileno()).st_ino
+    complete, partial = _split_complete(data)
+    header_end = complete.find(b'\n') + 1
+    header, body = complete[:header_end], complete[header_end:]
+    lines = body.splitlines(keepends=True)
+    fieldnames = next(csv.reader([header.decode('utf-8')]))
+    ts_pos = fieldnames.index(COLUMNS[0]) if COLUMNS[0] in fieldnames else None
+    if ts_pos is None or not lines:
+        return {'arquivadas': 0, 'mantidas': len(lines)}
+    rows = csv.reader(io.StringIO(body.decode('utf-8')))
+    epochs = [parse_timestamp(r[ts_pos]) if len(r) > ts_pos else None for r in rows]
+    if len(epochs) != len(lines):
+        # Registro com quebra de linha entre aspas: linhas e registros não se alinham
+        raise ValueError("CSV com quebra de linha dentro de um campo; corrija-o antes de compactar")
+    if ate is None:
+        latest = max((e for e in epochs if e is not None), default=None)
+        if latest is None:
+            return {'arquivadas': 0, 'mantidas': len(lines)}
+        cutoff = latest // 86400 * 86400
+        ate = format_bucket(int(cutoff))
+    else:
+        cutoff = parse_timestamp(ate)
+        if cutoff is None:
+            raise ValueError(f"timestamp inválido: {ate}")
+    archived, kept = [], []
+    for line, epoch in zip(lines, epochs):
+        (archived if epoch is not None and epoch < cutoff else kept).append(line)
+    if not archived:
+        return {'arquivadas': 0, 'mantidas': len(kept), 'ate': ate}
+
+    agg = previous.aggregates() if previous else Aggregates()
+    history = previous.history(history_size) if previous else HistoryBuffer(history_size)
+    rollups = previous.rollups(resolutions) if previous else TimeRollups(resolutions)
+    segment_data = header + b''.join(archived)
+    agg.fold(iter_chunks(segment_data), history, (rollups,))
+
+    archive.mkdir(exist_ok=True)
+    segmentos = (previous.segmentos if previous else []) + [f"{csv_path.stem}-{len(known) + 1:05d}.csv"]
+    _write_atomic(archive / segmentos[-1], segment_data)
+
+    live = header + b''.join(kept) + partial
+    with open(_live_tmp(csv_path), 'wb') as f:
+        f.write(live)
+        # Linhas acrescentadas enquanto compactávamos vão junto para o novo CSV
+        copied = _append_from(csv_path, len(data), f)
+        f.flush()
+        os.fsync(f.fileno())
+        # Checkpoint antes da troca: o CSV novo nunca fica visível sem ele. Até a troca,
+        # ``origem`` identifica o CSV antigo (carga adiada) e permite concluí-la se interrompida
+        origem = dict(_identity(data), inode=inode, lidos=copied, tmp_bytes=f.tell())
+        _save(csv_path, agg, rollups, history, segmentos, ate, live, origem)
+        # Com a trava, nenhum acréscimo cai no CSV antigo entre a última cópia e a troca
+        with open_live(csv_path, 'rb'):
+            _append_from(csv_path, copied, f)
+            f.flush()
+            os.fsync(f.fileno())
+            os.replace(_live_tmp(csv_path), csv_path)
+    logger.info("csv_compactado", extra={"arquivadas": len(archived), "mantidas": len(kept), "ate": ate})
+    return {'arquivadas': len(archived), 'mantidas': len(kept), 'ate': ate, 'segmento': segmentos[-1]}
+
+
+def rebuild(csv_path: Path, history_size: int = 1000, resolutions: Optional[Dict[str, int]] = None) -> int:
+    """Recria o checkpoint a partir de todos os segmentos arquivados. Retorna as linhas."""
+    if checkpoint_path(csv_path).exists():
+        _load_previous(csv_path)
+    archive = archive_dir(csv_path)
+    segmentos = sorted(p.name for p in archive.glob('*.csv')) if archive.exists() else []
+    agg, history, rollups = Aggregates(), HistoryBuffer(history_size), TimeRollups(resolutions)
+    for name in segmentos:
+        agg.fold(iter_chunks((archive / name).read_bytes()), history, (rollups,))
+    with open(csv_path, 'rb') as f:
+        live = f.read(PREFIX_BYTES)
+    _save(csv_path, agg, rollups, history, segmentos, None, live)
+    return agg.linhas
+
+
+__all__ = [
+    "Checkpoint", "CompactionPending", "compact", "rebuild", "checkpoint_path", "archive_dir", "open_live",
+]
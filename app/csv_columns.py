@@ -0,0 +1,121 @@
+"""Leitura do CSV em blocos colunares, sem um dict por linha.
+
+As posições das colunas são resolvidas uma vez a partir do cabeçalho; cada
+bloco de até ``CHUNK_ROWS`` linhas é transposto de uma vez e devolvido como
+``(timestamps, produtos, vendas, estoque)``, com os inteiros em ``array('q')``.
+As regras de normalização (vazio, inválido ou fora de int64 = 0, produto
+vazio = ``'N/A'``)
+ficam em ``chunk_from_columns``, usada também pelo caminho pandas para que os
+dois produzam exatamente os mesmos valores.
+"""
+import csv
+import io
+from array import array
+from itertools import islice, repeat
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+COLUMNS = ('timestamp', 'produto', 'vendas', 'estoque')
+CHUNK_ROWS = 10_000
+INT_DTYPES = ('int8', 'int16', 'int32', 'int64')
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# (timestamps, produtos, vendas, estoque)
+Chunk = Tuple[Sequence[str], Sequence[str], array, array]
+
+
+def _safe_int(value) -> int:
+    try:
+        n = int(value or 0)
+    except ValueError:
+        return 0
+    # Não cabe em array('q'): inválida como texto sujo
+    return n if INT64_MIN <= n <= INT64_MAX else 0
+
+
+def int_column(values: Sequence) -> array:
+    """Converte uma coluna de texto em ``array('q')``; vazio, inválido ou fora de int64 vira 0."""
+    try:
+        return array('q', list(map(int, values)))
+    except (ValueError, OverflowError):
+        # Só colunas com células vazias/sujas pagam a conversão protegida por célula
+        return array('q', map(_safe_int, values))
+
+
+def chunk_from_columns(
+    size: int,
+    timestamps: Optional[Sequence[str]],
+    produtos: Optional[Sequence[str]],
+    vendas: Optional[Sequence],
+    estoque: Optional[Sequence],
+) -> Chunk:
+    """Normaliza colunas brutas (``None`` = coluna ausente no CSV) em um bloco."""
+    if timestamps is None:
+        timestamps = [''] * size
+    if produtos is None:
+        produtos = ['N/A'] * size
+    elif '' in produtos:
+        produtos = [p or 'N/A' for p in produtos]
+    vendas = vendas if isinstance(vendas, array) else (
+        int_column(vendas) if vendas is not None else array('q', repeat(0, size))
+    )
+    estoque = estoque if isinstance(estoque, array) else (
+        int_column(estoque) if estoque is not None else array('q', repeat(0, size))
+    )
+    return timestamps, produtos, vendas, estoque
+
+
+class CsvSchema:
+    """Como a carga completa com pandas lê o CSV (ver app.pandas_loader).
+
+    ``timestamp_format`` é o formato esperado (strftime); valores fora dele
+    continuam aceitos via ISO 8601, só que mais devagar. ``int_dtype`` é o
+    tipo das contagens depois da leitura; um valor fora do seu intervalo leva
+    o arquivo à leitura robusta (contagens como texto). Arquivos com ``chunk_threshold`` bytes ou
+    mais são lidos em blocos de ``chunk_rows`` linhas.
+    """
+
+    def __init__(
+        self,
+        timestamp_format: str = '%Y-%m-%dT%H:%M',
+        int_dtype: str = 'int32',
+        chunk_threshold: int = 64 * 1024 * 1024,
+        chunk_rows: int = 200_000,
+    ):
+        if int_dtype not in INT_DTYPES:
+            raise ValueError(f"int_dtype inválido: {int_dtype!r} (use {', '.join(INT_DTYPES)})")
+        if chunk_rows <= 0:
+            raise ValueError("chunk_rows deve ser positivo")
+        self.timestamp_format = timestamp_format
+        self.int_dtype = int_dtype
+        self.chunk_threshold = chunk_threshold
+        self.chunk_rows = chunk_rows
+
+
+def iter_chunks(data: bytes, fieldnames: Optional[List[str]] = None, chunk_rows: int = CHUNK_ROWS) -> Iterator[Chunk]:
+    """Blocos colunares de ``data`` (bytes UTF-8 com linhas completas).
+
+    Sem ``fieldnames`` a primeira linha é o cabeçalho. Linhas em branco são
+    ignoradas; células faltantes valem como vazias.
+    """
+    reader = csv.reader(io.StringIO(data.decode('utf-8')))
+    if fieldnames is None:
+        fieldnames = next(reader, None)
+        if fieldnames is None:
+            return
+    index = {name: i for i, name in enumerate(fieldnames)}
+    positions = [index.get(name) for name in COLUMNS]
+    width = max((p for p in positions if p is not None), default=-1) + 1
+    while True:
+        raw = list(islice(reader, chunk_rows))
+        if not raw:
+            return
+        rows = list(filter(None, raw))
+        if not rows:
+            continue
+        if min(map(len, rows)) < width:
+            rows = [r if len(r) >= width else r + [''] * (width - len(r)) for r in rows]
+        columns = list(zip(*rows)) if width else []
+        yield chunk_from_columns(len(rows), *(columns[p] if p is not None else None for p in positions))
+
+
+__all__ = ["COLUMNS", "CHUNK_ROWS", "CsvSchema", "int_column", "chunk_from_columns", "iter_chunks"]
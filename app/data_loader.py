@@ -1,28 +1,80 @@
+import csv
+import os
+import importlib
+import importlib.util
 import threading
 import time
 from pathlib import Path
-from typing import List, Dict, Any, Callable
-try:
-    import pandas as pd  # type: ignore
-except Exception:  # pandas opcional
-    pd = None  # type: ignore
-from watchdog.observers import Observer
+from typing import List, Dict, Any, Callable, Tuple
 from watchdog.events import FileSystemEventHandler
 from typing import Optional
 import logging
+from app import metrics
+from app.checkpoint import Checkpoint, CompactionPending, checkpoint_path
+from app.aggregates import Aggregates
+from app.csv_columns import CsvSchema, iter_chunks
+from app.directory_loader import DirectoryParser
+from app.history import HistoryBuffer
+from app.ingest import append_to_csv
+from app.product_index import ProductIndex
+from app.reload_scheduler import ReloadScheduler
+from app.rollups import TimeRollups
+from app.sidecar_cache import SidecarCache
+from app.windows import SlidingWindows
+
+
+class _LazyModule:
+    """Importa o módulo no primeiro acesso a um atributo.
+
+    pandas custa ~250 ms de import; assim só quem faz uma carga
+    completa paga por eles, e não o import de ``app.main`` (nem workers com
+    ``SNAPSHOT_SOCKET``, que nunca leem o CSV).
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# pandas opcional: ``pd is None`` apenas se não estiver instalado
+if importlib.util.find_spec('pandas') is not None:
+    pd = _LazyModule('pandas')
+else:
+    pd = None  # type: ignore
 
 logger = logging.getLogger(__name__)
 
+EXPECTED_COLUMNS = {"timestamp", "produto", "vendas", "estoque"}
+# Bytes finais já consumidos, usados para detectar reescrita do arquivo
+TAIL_GUARD_BYTES = 64
+
 
 class CSVChangeHandler(FileSystemEventHandler):
-    def __init__(self, target_path: Path, on_change: Callable[[], None]):
+    """Dispara ``on_change`` quando o CSV alvo (ou, se ``pattern`` for dado,
+    qualquer arquivo do diretório alvo que case com o padrão) muda."""
+
+    def __init__(self, target_path: Path, on_change: Callable[[], None], pattern: Optional[str] = None):
         super().__init__()
         self._target = target_path.resolve()
         self._on_change = on_change
+        self._pattern = pattern
+
+    def _matches(self, path: str) -> bool:
+        p = Path(path).resolve()
+        if self._pattern is None:
+            # O checkpoint da compactação também muda o estado publicado
+            return p == self._target or p == checkpoint_path(self._target)
+        return p.parent == self._target and p.match(self._pattern)
 
     def on_modified(self, event):  # type: ignore
         try:
-            if Path(event.src_path).resolve() == self._target:
+            paths = [event.src_path, getattr(event, 'dest_path', '') or event.src_path]
+            if any(self._matches(p) for p in paths):
                 logger.debug("Arquivo CSV modificado: %s", event.src_path)
                 self._on_change()
         except Exception as e:
@@ -32,32 +84,145 @@ class CSVChangeHandler(FileSystemEventHandler):
     def on_moved(self, event):  # type: ignore
         self.on_modified(event)
 
+    def on_created(self, event):  # type: ignore
+        if self._pattern is not None:
+            self.on_modified(event)
+
+    def on_deleted(self, event):  # type: ignore
+        if self._pattern is not None:
+            self.on_modified(event)
+
 
 class DataManager:
-    """Gerencia leitura do CSV e mantém snapshot em memória."""
+    """Gerencia leitura do CSV e mantém snapshot em memória.
+
+    Com ``incremental=True`` (padrão) o arquivo é tratado como append-only:
+    guardamos o offset em bytes já processado e, a cada mudança, apenas as
+    linhas novas são lidas e acumuladas. Truncamento, troca de inode, mudança
+    de cabeçalho ou reescrita do trecho já lido disparam reconstrução completa.
+
+    Cada snapshot publicado recebe ``versao`` monotonicamente crescente.
+    Com ``top_n``, os mapas por produto do snapshot trazem só os ``top_n``
+    mais vendidos / de menor estoque; o catálogo completo fica no
+    ``ProductIndex`` (``get_produtos``).
+
+    Se ``csv_path`` for um diretório, todos os arquivos que casam com
+    ``pattern`` são lidos (ver app.directory_loader): apenas os alterados são
+    reinterpretados, em paralelo em até ``workers`` processos.
 
-    def __init__(self, csv_path: Path, refresh_interval: float = 5.0):
+    Com ``cache_dir`` o estado já interpretado é persistido (ver
+    app.sidecar_cache) a cada ``cache_interval`` segundos e no ``stop()``:
+    o estado é capturado sob o lock de carga e gravado depois de soltá-lo,
+    com os rollups como diário dos buckets alterados desde a captura
+    anterior. Na partida apenas o trecho do CSV após o cache é lido.
+
+    Watchdog e polling não recarregam diretamente: pedem ao
+    ``ReloadScheduler``, que agrupa gatilhos dentro de ``debounce`` segundos
+    (sem passar de ``max_staleness``) e executa uma recarga por vez.
+
+    Com pandas a carga completa é tipada (``schema``) e, a partir de
+    ``schema.chunk_threshold`` bytes, lida do disco em blocos (ver
+    app.pandas_loader); sem pandas, ou se ele rejeitar o arquivo, vale o
+    leitor stdlib.
+
+    ``start(background=True)`` faz a carga inicial numa thread e retorna na
+    hora; até o primeiro snapshot ``state`` é ``'aquecendo'``.
+    """
+
+    def __init__(
+        self,
+        csv_path: Path,
+        refresh_interval: float = 5.0,
+        incremental: bool = True,
+        history_size: int = 1000,
+        rollup_resolutions: Optional[Dict[str, int]] = None,
+        cache_dir: Optional[Path] = None,
+        cache_interval: float = 30.0,
+        pattern: str = '*.csv',
+        workers: Optional[int] = None,
+        debounce: float = 0.05,
+        max_staleness: float = 2.0,
+        windows: Optional[Dict[str, int]] = None,
+        top_n: Optional[int] = 50,
+        schema: Optional[CsvSchema] = None,
+    ):
         self.csv_path = csv_path
+        # Tipos, formato do timestamp e leitura em blocos da carga com pandas (app.pandas_loader)
+        self.schema = schema or CsvSchema()
         self.refresh_interval = refresh_interval
+        self.incremental = incremental
         self._last_mtime = 0.0
+        self._published_at: Optional[float] = None
+        self._last_signature = None  # (mtime, size, inode, mtime do checkpoint)
         self._lock = threading.RLock()
+        # Serializa as cargas (watchdog e polling rodam em threads distintas)
+        self._load_lock = threading.Lock()
         self._data = {}
+        self._version = 0
+        self._agg = Aggregates()
+        self._history = HistoryBuffer(history_size)
+        self._rollup_resolutions = rollup_resolutions
+        self._rollups = TimeRollups(rollup_resolutions)
+        # Catálogo ordenado: o snapshot leva só os top_n (None/0 = mapas completos)
+        self.top_n = top_n
+        self._index = ProductIndex()
+        self._window_spec = windows
+        self._windows = self._new_windows()
+        self._offset = 0
+        self._inode = None
+        self._header = b''
+        self._tail_guard = b''
+        self._cache = SidecarCache(csv_path, cache_dir) if cache_dir else None
+        self.cache_interval = cache_interval
+        self._cache_saved_at = 0.0
+        self._cache_mtime = 0.0
+        # Rollups cujas alterações o cache acompanha (objeto novo = gravação completa)
+        self._cache_rollups: Optional[TimeRollups] = None
+        self.pattern = pattern
+        self._directory = DirectoryParser(csv_path, pattern, workers)
         self._subscribers = []  # type: list[Callable[[dict[str, Any]], None]]
         self._stop_event = threading.Event()
         self._thread = None  # type: ignore
+        self._warm_thread: Optional[threading.Thread] = None
         self._observer = None  # type: ignore
+        self._scheduler = ReloadScheduler(self._load_if_changed, debounce, max_staleness)
+
+    def start(self, background: bool = False):
+        if background:
+            self._warm_thread = threading.Thread(target=self._warm_start, name='data-warm', daemon=True)
+            self._warm_thread.start()
+            return
+        self._warm_start()
 
-    def start(self):
-        self._load_if_changed(force=True)
+    def _warm_start(self):
+        started = time.perf_counter()
+        if self._restore_cache():
+            self._load_if_changed()
+        else:
+            self._load_if_changed(force=True)
+        logger.info("carga_inicial", extra={
+            "estado": self.state, "duracao_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        if self._stop_event.is_set():
+            return
+        self._scheduler.start()
         # Thread de polling (fallback caso watchdog falhe)
         self._thread = threading.Thread(target=self._poll_loop, daemon=True)
         self._thread.start()
         # Watchdog
         if self.csv_path.exists():
             try:
-                handler = CSVChangeHandler(self.csv_path, self._load_if_changed)
+                # Sob demanda (~20 ms): workers com SNAPSHOT_SOCKET nunca observam o CSV
+                from watchdog.observers import Observer
+
+                if self.csv_path.is_dir():
+                    handler = CSVChangeHandler(self.csv_path, self.request_reload, self.pattern)
+                    watched = self.csv_path
+                else:
+                    handler = CSVChangeHandler(self.csv_path, self.request_reload)
+                    watched = self.csv_path.parent
                 self._observer = Observer()
-                self._observer.schedule(handler, str(self.csv_path.parent), recursive=False)
+                self._observer.schedule(handler, str(watched), recursive=False)
                 self._observer.start()
                 logger.info("Watchdog iniciado para %s", self.csv_path)
             except Exception as e:
@@ -66,12 +231,35 @@ class DataManager:
                 logger.warning("Watchdog desativado, usando apenas polling. Motivo: %s", e)
         else:
             logger.warning("CSV inicial não encontrado: %s", self.csv_path)
+        if self._warm_thread is not None:
+            # Gravações feitas durante a carga inicial, antes do watchdog existir
+            self.request_reload('partida')
+
+    @property
+    def ready(self) -> bool:
+        """Já existe snapshot publicado."""
+        return self._published_at is not None
+
+    @property
+    def state(self) -> str:
+        """``'pronto'``, ``'aquecendo'`` (carga inicial em curso) ou ``'sem_dados'``."""
+        if self.ready:
+            return 'pronto'
+        warm = self._warm_thread
+        return 'aquecendo' if warm is not None and warm.is_alive() else 'sem_dados'
 
     def stop(self):
         self._stop_event.set()
+        if self._warm_thread is not None:
+            self._warm_thread.join(timeout=5)
         if self._observer:
             self._observer.stop()
             self._observer.join(timeout=2)
+        self._scheduler.stop()
+        with self._load_lock:
+            cache_state = self._cache_state(due=False)
+        self._write_cache(cache_state)
+        self._directory.close()
 
     def subscribe(self, cb: Callable[[Dict[str, Any]], None]):
         with self._lock:
@@ -81,13 +269,105 @@ class DataManager:
         with self._lock:
             return dict(self._data)
 
+    def snapshot_age(self) -> Optional[float]:
+        """Segundos desde a publicação do snapshot atual (None se ainda não há)."""
+        published_at = self._published_at
+        return time.time() - published_at if published_at is not None else None
+
+    def get_historico(self, limit: int) -> List[Dict[str, Any]]:
+        """Últimas ``limit`` linhas (ordenadas por timestamp) direto da memória."""
+        with self._lock:
+            history = self._history
+        return history.tail(limit)
+
+    def history_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            history = self._history
+        return history.stats()
+
+    @property
+    def rollups(self) -> TimeRollups:
+        with self._lock:
+            return self._rollups
+
+    @property
+    def history(self) -> HistoryBuffer:
+        with self._lock:
+            return self._history
+
+    def get_series(self, bucket: str, produtos=None, inicio=None, fim=None, limit=None,
+                   max_points=None) -> List[Dict[str, Any]]:
+        """Série agregada por bucket (ver app.rollups.TimeRollups.series)."""
+        return self.rollups.series(bucket, produtos, inicio, fim, limit, max_points)
+
+    @property
+    def products(self) -> ProductIndex:
+        return self._index
+
+    def get_produtos(self, ordem='produto', desc=False, prefixo=None, cursor=None, limit=100) -> Dict[str, Any]:
+        """Página do catálogo completo (ver app.product_index.ProductIndex.page)."""
+        return self._index.page(ordem, desc, prefixo, cursor, limit)
+
+    def lookup_produtos(self, produtos) -> Dict[str, Dict[str, int]]:
+        """Vendas e estoque atuais de ``produtos`` (assinaturas do /ws)."""
+        return self._index.lookup(produtos)
+
+    def append_rows(self, rows: List[Tuple[str, str, int, int]], fsync: bool = False) -> int:
+        """Grava ``rows`` no CSV com um único write e as aplica sem esperar o watchdog.
+
+        Retorna a versão publicada. Bytes de outros produtores ainda não lidos
+        entram pela leitura normal da cauda, junto com as linhas gravadas aqui.
+        """
+        if self.csv_path.is_dir():
+            raise ValueError("ingestão indisponível com CSV_PATH apontando para um diretório")
+        with self._load_lock:
+            start = time.perf_counter()
+            before = self.csv_path.stat() if self.csv_path.exists() else None
+            # Tudo até o fim do arquivo já foi lido: as linhas novas são exatamente as gravadas
+            direct = (
+                before is not None and self._offset > 0
+                and before.st_ino == self._inode and before.st_size == self._offset
+            )
+            data = append_to_csv(self.csv_path, rows, fsync)
+            st = self.csv_path.stat()
+            novas = None
+            if direct:
+                header = next(csv.reader([self._header.decode('utf-8')]))
+                novas = self._agg.fold(
+                    iter_chunks(data, header), self._history,
+                    (self._rollups, self._windows, self._index),
+                )
+                self._offset += len(data)
+                self._tail_guard = (self._tail_guard + data)[-TAIL_GUARD_BYTES:]
+            elif self._offset > 0:
+                novas = self._read_tail(st)
+            if novas is None:
+                novas = self._full_rebuild()
+                if novas is None:
+                    raise OSError(f"falha ao reler {self.csv_path} após a gravação")
+            # O evento do watchdog desta gravação vira "sem_mudanca"
+            self._last_signature = (st.st_mtime, st.st_size, st.st_ino, self._checkpoint_signature())
+            metrics.RELOAD_DURATION.observe(time.perf_counter() - start, modo='ingestao')
+            metrics.RELOAD_ROWS.observe(novas, modo='ingestao')
+            metrics.RELOADS.inc(resultado='ingestao')
+            self._publish(st.st_mtime)
+            self._cache_mtime = st.st_mtime
+            cache_state = self._cache_state()
+            versao = self._version
+        self._write_cache(cache_state)
+        self._notify()
+        return versao
+
+    def request_reload(self, origem: str = 'watchdog'):
+        """Pede uma recarga ao agendador (agrupada com outros gatilhos próximos)."""
+        self._scheduler.trigger(origem)
+
+    def reload_stats(self) -> Dict[str, Any]:
+        return self._scheduler.stats()
+
     def _poll_loop(self):
-        while not self._stop_event.is_set():
-            try:
-                self._load_if_changed()
-            except Exception as e:
-                logger.error("Erro no polling: %s", e)
-            time.sleep(self.refresh_interval)
+        while not self._stop_event.wait(self.refresh_interval):
+            self.request_reload('polling')
 
     def _notify(self):
         snapshot = self.get_snapshot()
@@ -100,112 +380,359 @@ class DataManager:
     def _load_if_changed(self, force: bool = False):
         try:
             if not self.csv_path.exists():
+                metrics.RELOADS.inc(resultado='sem_arquivo')
                 return
-            mtime = self.csv_path.stat().st_mtime
-            if not force and mtime <= self._last_mtime:
+            if self.csv_path.is_dir():
+                self._load_directory(force)
                 return
-            # Evitar leitura durante escrita: tentar múltiplas vezes
-            if pd:
-                for attempt in range(5):
-                    try:
-                        df = pd.read_csv(self.csv_path)
-                        break
-                    except Exception:
-                        time.sleep(0.2)
-                else:
-                    logger.error("Falha ao ler CSV após várias tentativas")
+            cache_state = None
+            with self._load_lock:
+                start = time.perf_counter()
+                st = self.csv_path.stat()
+                signature = (st.st_mtime, st.st_size, st.st_ino, self._checkpoint_signature())
+                if not force and signature == self._last_signature:
+                    metrics.RELOADS.inc(resultado='sem_mudanca')
                     return
-                if df.empty:
+                modo = 'completo'
+                novas = None
+                # Checkpoint novo (compactação): recomeça dele em vez de ler só a cauda
+                checkpoint_changed = self._last_signature is not None and signature[3] != self._last_signature[3]
+                if self.incremental and not force and self._offset > 0 and not checkpoint_changed:
+                    novas = self._read_tail(st)
+                    if novas is not None:
+                        modo = 'incremental'
+                if novas is None:
+                    novas = self._full_rebuild()
+                    if novas is None:
+                        metrics.RELOADS.inc(resultado='erro')
+                        return
+                self._last_signature = signature
+                metrics.RELOAD_DURATION.observe(time.perf_counter() - start, modo=modo)
+                metrics.RELOAD_ROWS.observe(novas, modo=modo)
+                if modo == 'incremental' and novas == 0:
+                    # Nada novo (ex: linha ainda incompleta); não republica
+                    metrics.RELOADS.inc(resultado='sem_linhas_novas')
                     return
-                expected = {"timestamp", "produto", "vendas", "estoque"}
-                missing = expected - set(df.columns)
-                if missing:
-                    logger.warning("Colunas ausentes no CSV: %s", missing)
-                if 'timestamp' in df.columns:
-                    try:
-                        df['timestamp'] = pd.to_datetime(df['timestamp'])
-                    except Exception:
-                        pass
-                total_vendas = df['vendas'].sum() if 'vendas' in df.columns else None
-                estoque_por_produto = (
-                    df.groupby('produto')['estoque'].last().to_dict() if 'produto' in df.columns and 'estoque' in df.columns else {}
-                )
-                vendas_por_produto = (
-                    df.groupby('produto')['vendas'].sum().to_dict() if 'produto' in df.columns and 'vendas' in df.columns else {}
-                )
-                ultimo_timestamp = (
-                    df['timestamp'].max().isoformat() if 'timestamp' in df.columns and not df['timestamp'].isna().all() else None
+                metrics.RELOADS.inc(resultado=modo)
+                if self._agg.linhas == 0:
+                    return
+                self._publish(st.st_mtime)
+                self._cache_mtime = st.st_mtime
+                cache_state = self._cache_state()
+                logger.info(
+                    "snapshot_update",
+                    extra={
+                        "modo": modo,
+                        "linhas_novas": novas,
+                        "linhas": self._agg.linhas,
+                        "total_vendas": self._agg.total_vendas,
+                        "produtos": len(self._agg.estoque_por_produto),
+                        "ultimo_timestamp": self._agg.ultimo_timestamp,
+                        "historico_bytes": self._history.stats()['bytes_aprox'],
+                    },
                 )
+            self._write_cache(cache_state)
+            self._notify()
+        except Exception:
+            metrics.RELOADS.inc(resultado='erro')
+            logger.exception("csv_load_error")
+
+    def _load_directory(self, force: bool):
+        history_size = self._history.capacity
+        with self._load_lock:
+            start = time.perf_counter()
+            result = self._directory.refresh(history_size, self._rollup_resolutions, force)
+            if result is None:
+                metrics.RELOADS.inc(resultado='sem_mudanca')
+                return
+            relidos, removidos = result
+            # Rollups mantidos entre recargas: só os buckets dos arquivos relidos mudam
+            agg, history, rollups, produtos = self._directory.merged(history_size, self._rollup_resolutions)
+            metrics.RELOAD_DURATION.observe(time.perf_counter() - start, modo='diretorio')
+            metrics.RELOAD_ROWS.observe(agg.linhas, modo='diretorio')
+            metrics.RELOADS.inc(resultado='diretorio')
+            windows = self._new_windows()
+            windows.load_rollups(rollups)
+            self._agg = agg
+            if produtos is None:
+                self._index.invalidate()
             else:
-                # Fallback sem pandas (leitura simples e agregação manual)
-                import csv
-                rows = []
-                with open(self.csv_path, newline='', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for r in reader:
-                        rows.append(r)
-                if not rows:
-                    return
-                total_vendas = 0
-                estoque_por_produto = {}
-                vendas_por_produto = {}
-                ultimo_timestamp = None
-                for r in rows:
-                    try:
-                        vendas = int(r.get('vendas', 0) or 0)
-                    except ValueError:
-                        vendas = 0
-                    try:
-                        estoque = int(r.get('estoque', 0) or 0)
-                    except ValueError:
-                        estoque = 0
-                    produto = r.get('produto') or 'N/A'
-                    total_vendas += vendas
-                    vendas_por_produto[produto] = vendas_por_produto.get(produto, 0) + vendas
-                    # Último estoque prevalece
-                    estoque_por_produto[produto] = estoque
-                    ts = r.get('timestamp')
-                    if ts:
-                        ultimo_timestamp = ts  # último encontrado
-            linhas = len(df) if pd else len(rows)  # type: ignore
-            
-            # Conversão de tipos numpy/pandas para JSON-serializáveis
-            def make_json_safe(obj):
-                """Converte tipos numpy/pandas para tipos nativos Python"""
-                if hasattr(obj, 'item'):  # numpy scalar
-                    return obj.item()
-                elif hasattr(obj, 'isoformat'):  # datetime/timestamp
-                    return obj.isoformat()
-                elif isinstance(obj, dict):
-                    return {k: make_json_safe(v) for k, v in obj.items()}
-                elif isinstance(obj, (list, tuple)):
-                    return [make_json_safe(item) for item in obj]
-                else:
-                    return obj
-            
-            snapshot = {
-                'total_vendas': make_json_safe(total_vendas),
-                'estoque_por_produto': make_json_safe(estoque_por_produto),
-                'vendas_por_produto': make_json_safe(vendas_por_produto),
-                'linhas': int(linhas),
-                'ultimo_timestamp': ultimo_timestamp,
-                'atualizado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
-            }
+                self._index.touch(produtos)
             with self._lock:
-                self._data = snapshot
-                self._last_mtime = mtime
+                self._history = history
+                self._rollups = rollups
+                self._windows = windows
+            if agg.linhas == 0:
+                return
+            self._publish(self._directory.last_mtime)
             logger.info(
                 "snapshot_update",
                 extra={
-                    "linhas": linhas,
-                    "total_vendas": total_vendas,
-                    "produtos": len(estoque_por_produto),
-                    "ultimo_timestamp": ultimo_timestamp,
+                    "modo": "diretorio",
+                    "arquivos": self._directory.files,
+                    "arquivos_relidos": relidos,
+                    "arquivos_removidos": removidos,
+                    "linhas": agg.linhas,
+                    "total_vendas": agg.total_vendas,
+                    "produtos": len(agg.estoque_por_produto),
                 },
             )
-            self._notify()
-        except Exception:
-            logger.exception("csv_load_error")
+        self._notify()
+
+    def _checkpoint_signature(self):
+        try:
+            return checkpoint_path(self.csv_path).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_complete(self, f, size: int) -> bytes:
+        """Lê de f até ``size`` e descarta a última linha se ainda incompleta."""
+        data = f.read(max(0, size - f.tell()))
+        cut = data.rfind(b'\n')
+        return data[:cut + 1] if cut >= 0 else b''
+
+    def _full_rebuild(self) -> Optional[int]:
+        """Relê o arquivo inteiro e recria os agregados. Retorna linhas lidas."""
+        # Evitar leitura durante escrita: tentar múltiplas vezes
+        for attempt in range(5):
+            try:
+                f = open(self.csv_path, 'rb')
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            logger.error("Falha ao ler CSV após várias tentativas")
+            return None
+        # Tudo (checkpoint, cabeçalho, dados) vem do mesmo arquivo aberto, mesmo que a
+        # compactação troque o caminho no meio da carga
+        with f:
+            return self._rebuild_from(f, os.fstat(f.fileno()))
+
+    def _rebuild_from(self, f, st) -> Optional[int]:
+        try:
+            # Períodos compactados (app.checkpoint) entram já agregados; só o CSV vivo é lido
+            checkpoint = Checkpoint.load(self.csv_path, f)
+        except CompactionPending:
+            # Checkpoint novo, CSV ainda o antigo: publicar agora perderia os períodos arquivados
+            logger.warning("compactacao_pendente", extra={"csv": str(self.csv_path)})
+            return None
+        # Acima do limiar o pandas lê do disco em blocos, sem o arquivo inteiro na memória
+        streamed = pd is not None and st.st_size >= self.schema.chunk_threshold
+        if streamed:
+            data = None
+            header, end, tail_guard = self._scan_bounds(f, st.st_size)
+        else:
+            data = self._read_complete(f, st.st_size)
+            header = data[:data.find(b'\n') + 1]
+            end, tail_guard = len(data), data[-TAIL_GUARD_BYTES:]
+        if not header.endswith(b'\n'):
+            return None
+        fieldnames = next(csv.reader([header.decode('utf-8')]))
+        missing = EXPECTED_COLUMNS - set(fieldnames)
+        if missing:
+            logger.warning("Colunas ausentes no CSV: %s", missing)
+        loaded = None
+        if pd is not None:
+            from app import pandas_loader
+
+            source = data if data is not None else (f, end)
+            # Tipado primeiro; células fora do esquema (vazias, "5.0") pedem a leitura robusta
+            for robust in (False, True):
+                agg, history, rollups = self._base_state(checkpoint)
+                try:
+                    pandas_loader.fold_csv(
+                        source, fieldnames, self.schema, agg, history, rollups, (), robust,
+                    )
+                    loaded = agg, history, rollups
+                    break
+                except Exception as e:
+                    # Ex: linhas com colunas a mais; o leitor stdlib aceita
+                    logger.info("csv_pandas_fallback", extra={"robusta": robust, "erro": str(e)[:200]})
+        if loaded is None:
+            # Sem pandas (ou CSV que ele rejeita): leitura em blocos colunares (app.csv_columns)
+            if data is None:
+                f.seek(0)
+                data = self._read_complete(f, end)
+            agg, history, rollups = self._base_state(checkpoint)
+            agg.fold(iter_chunks(data), history, (rollups,))
+            loaded = agg, history, rollups
+        agg, history, rollups = loaded
+        # Janelas derivadas dos rollups: a carga completa não paga o custo por linha
+        windows = self._new_windows()
+        windows.load_rollups(rollups)
+        self._agg = agg
+        self._index.invalidate()
+        with self._lock:
+            self._history = history
+            self._rollups = rollups
+            self._windows = windows
+        self._offset = end
+        self._inode = st.st_ino
+        self._header = header
+        self._tail_guard = tail_guard
+        return agg.linhas
+
+    def _base_state(self, checkpoint: Optional[Checkpoint]) -> Tuple[Aggregates, HistoryBuffer, TimeRollups]:
+        """Estado inicial de uma carga completa (zerado ou a partir do checkpoint)."""
+        if self._cache is not None:
+            self._cache.reset()
+        if checkpoint is not None:
+            return (
+                checkpoint.aggregates(),
+                checkpoint.history(self._history.capacity),
+                checkpoint.rollups(self._rollup_resolutions),
+            )
+        return Aggregates(), HistoryBuffer(self._history.capacity), TimeRollups(self._rollup_resolutions)
+
+    @staticmethod
+    def _scan_bounds(f, size: int) -> Tuple[bytes, int, bytes]:
+        """Cabeçalho, fim da última linha completa e bytes finais, sem ler o meio do arquivo."""
+        header = f.readline()
+        end = size
+        while end > 0:
+            start = max(0, end - (1 << 16))
+            f.seek(start)
+            cut = f.read(end - start).rfind(b'\n')
+            if cut >= 0:
+                end = start + cut + 1
+                break
+            end = start
+        f.seek(max(0, end - TAIL_GUARD_BYTES))
+        tail_guard = f.read(end - max(0, end - TAIL_GUARD_BYTES))
+        f.seek(len(header))
+        return header, end, tail_guard
+
+    def _new_windows(self) -> SlidingWindows:
+        # Granularidade = menor resolução de rollup, para reconstruir as janelas a partir dela
+        return SlidingWindows(
+            self._window_spec, min(self._rollups.resolutions.values(), default=60), self.top_n
+        )
+
+    def _cache_state(self, due: bool = True) -> Optional[tuple]:
+        """Captura o estado a persistir (chamado com _load_lock), ou None se não for a hora."""
+        if self._cache is None or self._offset == 0:
+            return None
+        if due and time.monotonic() - self._cache_saved_at < self.cache_interval:
+            return None
+        self._cache_saved_at = time.monotonic()
+        state = {
+            'agregados': self._agg.to_state(),
+            'historico': [list(r) for r in self._history.rows()],
+        }
+        # Rollups: só os buckets alterados desde a captura anterior, salvo quando o cache pede tudo
+        rollups = self._rollups
+        changes = rollups.drain_changes('cache')
+        full = changes is None or rollups is not self._cache_rollups or self._cache.needs_full
+        self._cache_rollups = rollups
+        return (
+            self._offset, self._cache_mtime, self._inode, self._header, self._tail_guard,
+            state, rollups.to_state() if full else changes, full,
+            self._cache.generation, self._cache.next_seq(),
+        )
+
+    def _write_cache(self, cache_state: Optional[tuple]):
+        """Grava o estado capturado por ``_cache_state``; roda fora do _load_lock."""
+        if cache_state is None:
+            return
+        try:
+            self._cache.save(*cache_state)
+        except OSError as e:
+            logger.warning("sidecar_cache_save_error", extra={"erro": str(e)})
+
+    def _restore_cache(self) -> bool:
+        """Restaura o estado do cache, se válido para o CSV atual."""
+        if self._cache is None:
+            return False
+        state = self._cache.load()
+        if state is None:
+            return False
+        with self._load_lock:
+            self._agg = Aggregates.from_state(state['estado']['agregados'])
+            self._index.invalidate()
+            rollups = TimeRollups(self._rollup_resolutions)
+            rollups.apply_state(state['estado']['rollups'], replace=True)
+            for changes in state['estado']['diario']:
+                rollups.apply_state(changes)
+            # O cache já tem este estado: as próximas gravações levam só o diário
+            rollups.drain_changes('cache')
+            self._cache_rollups = rollups
+            windows = self._new_windows()
+            windows.load_rollups(rollups)
+            history = HistoryBuffer(self._history.capacity)
+            history.extend(tuple(r) for r in state['estado']['historico'])
+            with self._lock:
+                self._rollups = rollups
+                self._windows = windows
+                self._history = history
+            self._offset = state['offset']
+            self._inode = state['inode']
+            self._header = state['header']
+            self._tail_guard = state['tail_guard']
+            self._cache_saved_at = time.monotonic()
+            if self._agg.linhas:
+                self._publish(self.csv_path.stat().st_mtime)
+        logger.info("sidecar_cache_restored", extra={"linhas": self._agg.linhas, "offset": self._offset})
+        return True
+
+    def _read_tail(self, st) -> Optional[int]:
+        """Acumula apenas os bytes anexados desde o último offset.
+
+        Retorna ``None`` quando o arquivo foi truncado/reescrito e é preciso
+        reconstruir tudo.
+        """
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            logger.info("csv_rewrite_detected", extra={"motivo": "inode/tamanho"})
+            return None
+        with open(self.csv_path, 'rb') as f:
+            if f.readline() != self._header:
+                logger.info("csv_rewrite_detected", extra={"motivo": "cabecalho"})
+                return None
+            guard_len = len(self._tail_guard)
+            f.seek(self._offset - guard_len)
+            if f.read(guard_len) != self._tail_guard:
+                logger.info("csv_rewrite_detected", extra={"motivo": "conteudo"})
+                return None
+            data = self._read_complete(f, st.st_size)
+        if not data:
+            return 0
+        header = next(csv.reader([self._header.decode('utf-8')]))
+        novas = self._agg.fold(
+            iter_chunks(data, header), self._history, (self._rollups, self._windows, self._index)
+        )
+        self._offset += len(data)
+        self._tail_guard = (self._tail_guard + data)[-TAIL_GUARD_BYTES:]
+        return novas
+
+    def _publish(self, mtime: float):
+        agg = self._agg
+        index = self._index
+        index.refresh(agg.vendas_por_produto, agg.estoque_por_produto)
+        if self.top_n:
+            # Catálogo completo em /api/produtos; aqui só os mais vendidos e os de menor estoque
+            vendas = dict(index.top('vendas', self.top_n, desc=True))
+            estoque = dict(index.top('estoque', self.top_n))
+        else:
+            vendas = dict(agg.vendas_por_produto)
+            estoque = dict(agg.estoque_por_produto)
+        snapshot = {
+            'total_vendas': int(agg.total_vendas),
+            'estoque_por_produto': estoque,
+            'vendas_por_produto': vendas,
+            'total_produtos': len(index),
+            'linhas': int(agg.linhas),
+            'ultimo_timestamp': agg.ultimo_timestamp,
+            'atualizado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            # Momento da escrita no CSV (epoch), base da latência ponta a ponta
+            'csv_modificado_em': mtime,
+            # Janelas deslizantes: total_vendas_<janela> e vendas_por_produto_<janela>
+            **self._windows.to_snapshot(),
+        }
+        with self._lock:
+            self._version += 1
+            snapshot['versao'] = self._version
+            self._data = snapshot
+            self._last_mtime = mtime
+            self._published_at = time.time()
 
 
 __all__ = ["DataManager"]
@@ -0,0 +1,213 @@
+"""Leitura de um diretório de CSVs (ex: um arquivo por dia e por filial).
+
+Cada arquivo alterado é interpretado isoladamente — em paralelo, num pool de
+processos — e gera um agregado parcial. Os parciais são combinados em
+memória: somas são somadas e o estoque vale o da linha de timestamp mais
+recente entre todos os arquivos. Arquivos sem mudança reaproveitam o
+parcial anterior, então alterar o arquivo de hoje não relê o histórico.
+
+Os rollups combinados são mantidos entre recargas: a troca de um parcial
+atualiza só os buckets dele (vendas: combinado - antigo + novo), que são os
+únicos publicados como alterações (ver TimeRollups.drain_changes).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.aggregates import Aggregates
+from app.csv_columns import iter_chunks
+from app.history import HistoryBuffer
+from app.rollups import TimeRollups
+
+
+def parse_csv_file(path: str, history_size: int, resolutions: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """Interpreta um CSV e devolve seu agregado parcial (serializável entre processos)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Última linha ainda sendo escrita fica para a próxima leitura
+    data = data[:data.rfind(b'\n') + 1]
+    agg = Aggregates()
+    history = HistoryBuffer(history_size)
+    rollups = TimeRollups(resolutions)
+    agg.fold(iter_chunks(data), history, (rollups,))
+    return {
+        'agregados': agg,
+        'historico': [tuple(r.values()) for r in history.tail(history_size)],
+        # res -> produto -> bucket -> [vendas, estoque, ts]
+        'rollups': {
+            res: {p: {c[0]: c[1:] for c in cells} for p, cells in by_product.items()}
+            for res, by_product in rollups.to_state().items()
+        },
+    }
+
+
+def _merge_rows(partials: List[Dict[str, Any]], history_size: int) -> Tuple[Aggregates, HistoryBuffer]:
+    agg = Aggregates()
+    recent = []
+    for part in partials:
+        agg.merge(part['agregados'])
+        recent.extend(part['historico'])
+    recent.sort(key=lambda r: r[0])
+    history = HistoryBuffer(history_size)
+    history.extend(recent[-history_size:])
+    return agg, history
+
+
+def merge_partials(
+    partials: List[Dict[str, Any]],
+    history_size: int,
+    resolutions: Optional[Dict[str, int]],
+) -> Tuple[Aggregates, HistoryBuffer, TimeRollups]:
+    agg, history = _merge_rows(partials, history_size)
+    rollups = TimeRollups(resolutions)
+    for part in partials:
+        for res, by_product in part['rollups'].items():
+            rollups.load_buckets(
+                res, ((p, bucket, *cell) for p, cells in by_product.items() for bucket, cell in cells.items())
+            )
+    return agg, history, rollups
+
+
+class DirectoryParser:
+    """Mantém os parciais por arquivo e reinterpreta só os que mudaram."""
+
+    def __init__(self, directory: Path, pattern: str, workers: Optional[int] = None):
+        self.directory = directory
+        self.pattern = pattern
+        self.workers = workers
+        self._parts: Dict[str, Tuple[tuple, Dict[str, Any]]] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Rollups combinados (None = recombinar tudo no próximo merged())
+        self._rollups: Optional[TimeRollups] = None
+        # Produtos dos parciais trocados desde o último merged() (None = todos)
+        self._produtos: Optional[Set[str]] = None
+
+    def scan(self) -> Dict[str, tuple]:
+        sigs = {}
+        for f in sorted(self.directory.glob(self.pattern)):
+            if f.is_file():
+                st = f.stat()
+                sigs[str(f)] = (st.st_mtime, st.st_size, st.st_ino)
+        return sigs
+
+    def refresh(self, history_size: int, resolutions, force: bool = False) -> Optional[Tuple[int, int]]:
+        """Atualiza os parciais. Retorna (arquivos relidos, removidos) ou None se nada mudou."""
+        sigs = self.scan()
+        changed = [f for f, sig in sigs.items() if force or self._parts.get(f, (None,))[0] != sig]
+        removed = [f for f in self._parts if f not in sigs]
+        if not changed and not removed:
+            return None
+        parsed = self._parse(changed, history_size, resolutions)
+        if force:
+            self._rollups = None
+        if force or removed:
+            # Produtos podem ter sumido: o índice é refeito por inteiro
+            self._produtos = None
+        for f in removed:
+            self._replace(f, None)
+        for f, part in zip(changed, parsed):
+            self._replace(f, (sigs[f], part))
+        return len(changed), len(removed)
+
+    def _replace(self, f: str, entry: Optional[Tuple[tuple, Dict[str, Any]]]):
+        """Troca o parcial de ``f`` e atualiza os buckets dele nos rollups combinados."""
+        old = self._parts.pop(f, (None, None))[1]
+        if entry is not None:
+            self._parts[f] = entry
+        new = entry[1] if entry is not None else None
+        if self._produtos is not None:
+            for part in (old, new):
+                if part is not None:
+                    self._produtos.update(part['agregados'].vendas_por_produto)
+                    self._produtos.update(part['agregados'].estoque_por_produto)
+        rollups = self._rollups
+        if rollups is None:
+            return
+        old_by = old['rollups'] if old is not None else {}
+        new_by = new['rollups'] if new is not None else {}
+        for res in rollups.resolutions:
+            o_by, n_by = old_by.get(res, {}), new_by.get(res, {})
+            cells = {}
+            for produto in o_by.keys() | n_by.keys():
+                o_cells, n_cells = o_by.get(produto, {}), n_by.get(produto, {})
+                for bucket in o_cells.keys() | n_cells.keys():
+                    o, n = o_cells.get(bucket), n_cells.get(bucket)
+                    if o == n:
+                        continue
+                    current = rollups.cell(res, produto, bucket)
+                    if current is None and o is not None:
+                        continue  # já descartado pela retenção
+                    cells[(produto, bucket)] = self._combine(res, produto, bucket, current, o, n)
+            if cells:
+                rollups.set_buckets(res, cells)
+
+    def _combine(self, res: str, produto: str, bucket: int, current, old, new) -> Optional[list]:
+        # Vendas se desfazem por subtração, o estoque não: sem o novo parcial, ou se ele
+        # recuou o timestamp de quem podia ser o vencedor, recombina o bucket de todos
+        if new is None or (current is not None and new[2] < current[2] and old is not None and old[2] >= current[2]):
+            return self._scan(res, produto, bucket)
+        vendas = (current[0] if current is not None else 0) - (old[0] if old is not None else 0) + new[0]
+        if current is None or new[2] >= current[2]:
+            return [vendas, new[1], new[2]]
+        return [vendas, current[1], current[2]]
+
+    def _scan(self, res: str, produto: str, bucket: int) -> Optional[list]:
+        merged = None
+        for _, part in self._parts.values():
+            cell = part['rollups'].get(res, {}).get(produto, {}).get(bucket)
+            if cell is None:
+                continue
+            if merged is None:
+                merged = list(cell)
+            else:
+                merged[0] += cell[0]
+                if cell[2] >= merged[2]:
+                    merged[1:] = cell[1:]
+        return merged
+
+    def _parse(self, files: List[str], history_size: int, resolutions) -> List[Dict[str, Any]]:
+        if len(files) <= 1 or self.workers == 1:
+            return [parse_csv_file(f, history_size, resolutions) for f in files]
+        if self._executor is None:
+            # spawn: o processo principal tem threads (watchdog/polling), fork não é seguro
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return list(self._executor.map(
+            parse_csv_file, files, [history_size] * len(files), [resolutions] * len(files)
+        ))
+
+    def merged(
+        self, history_size: int, resolutions
+    ) -> Tuple[Aggregates, HistoryBuffer, TimeRollups, Optional[Set[str]]]:
+        """Agregados e histórico combinados, rollups mantidos e produtos alterados (None = todos).
+
+        Os rollups só são recriados na primeira chamada ou após ``refresh(force=True)``.
+        """
+        partials = [part for _, part in self._parts.values()]
+        if self._rollups is None:
+            agg, history, self._rollups = merge_partials(partials, history_size, resolutions)
+            produtos = None
+        else:
+            agg, history = _merge_rows(partials, history_size)
+            produtos = self._produtos
+        self._produtos = set()
+        return agg, history, self._rollups, produtos
+
+    @property
+    def last_mtime(self) -> float:
+        """mtime mais recente entre os arquivos lidos (0 se não há arquivos)."""
+        return max((sig[0] for sig, _ in self._parts.values()), default=0.0)
+
+    @property
+    def files(self) -> int:
+        return len(self._parts)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+__all__ = ["DirectoryParser", "parse_csv_file", "merge_partials"]
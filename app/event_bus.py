@@ -0,0 +1,91 @@
+"""Ponte thread-safe entre o carregador (threads) e o event loop do asyncio.
+
+O DataManager notifica seus subscribers nas threads de recarga, onde não há
+event loop. ``SnapshotBus.publish_threadsafe`` entrega o snapshot ao loop
+capturado em ``start()`` via ``call_soon_threadsafe``; uma task consome e
+chama o consumidor assíncrono (``WSConnectionManager.publish``).
+
+Backpressure: há um único slot pendente. Se snapshots chegam mais rápido do
+que o broadcast dá conta, o mais recente substitui o anterior (conflação) e
+o próximo delta é calculado sobre o último snapshot difundido.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotBus:
+    def __init__(self, consumer: Callable[[Dict[str, Any]], Awaitable[None]]):
+        self._consumer = consumer
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[Tuple[float, Dict[str, Any]]] = None
+        self.received = 0
+        self.delivered = 0
+        self.conflated = 0
+
+    async def start(self):
+        """Captura o loop corrente; deve ser chamado dentro dele (ex: no startup)."""
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        self._loop = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def publish_threadsafe(self, snapshot: Dict[str, Any]):
+        """Pode ser chamado de qualquer thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._offer, time.perf_counter(), snapshot)
+        except RuntimeError:
+            # Loop encerrado entre a checagem e a chamada (shutdown)
+            pass
+
+    def _offer(self, queued_at: float, snapshot: Dict[str, Any]):
+        self.received += 1
+        if self._pending is not None:
+            self.conflated += 1
+            metrics.BUS_CONFLATED.inc()
+        self._pending = (queued_at, snapshot)
+        self._event.set()
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            queued_at, snapshot = pending
+            metrics.BUS_HANDOFF.observe(time.perf_counter() - queued_at)
+            try:
+                await self._consumer(snapshot)
+            except Exception:
+                logger.exception("snapshot_bus_consumer_failed")
+            self.delivered += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recebidos": self.received,
+            "entregues": self.delivered,
+            "conflacionados": self.conflated,
+        }
+
+
+__all__ = ["SnapshotBus"]
@@ -0,0 +1,135 @@
+import sys
+import threading
+from collections import deque
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple
+
+# (timestamp, produto, vendas, estoque)
+Row = Tuple[str, str, int, int]
+
+FIELDS = ('timestamp', 'produto', 'vendas', 'estoque')
+
+
+def _row_size(row: Row) -> int:
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+
+
+class HistoryBuffer:
+    """Buffer circular com as linhas mais recentes, ordenado por timestamp.
+
+    Linhas fora de ordem são inseridas na posição correta (busca a partir do
+    fim, já que atrasos costumam ser pequenos). Quando cheio, linhas mais
+    antigas que todas as guardadas são descartadas.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, int(capacity))
+        self._rows: deque = deque(maxlen=self.capacity)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Linhas recebidas (inclusive descartadas) e as ainda não drenadas, para réplicas
+        # (carregador compartilhado); None = excesso, enviar o estado completo
+        self._seq = 0
+        self._changes: Optional[List[Row]] = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def append(self, row: Row):
+        with self._lock:
+            self._append(row)
+
+    def extend(self, rows):
+        with self._lock:
+            for row in rows:
+                self._append(row)
+
+    def _append(self, row: Row):
+        self._insert(row)
+        self._seq += 1
+        changes = self._changes
+        if changes is not None:
+            changes.append(row)
+            if len(changes) > self.capacity:
+                self._changes = None
+
+    def _insert(self, row: Row):
+        rows = self._rows
+        full = len(rows) == self.capacity
+        if not rows or row[0] >= rows[-1][0]:
+            if full:
+                self._bytes -= _row_size(rows[0])
+            rows.append(row)
+            self._bytes += _row_size(row)
+            return
+        if full and row[0] < rows[0][0]:
+            return
+        if full:
+            self._bytes -= _row_size(rows.popleft())
+        i = len(rows)
+        while i > 0 and rows[i - 1][0] > row[0]:
+            i -= 1
+        rows.insert(i, row)
+        self._bytes += _row_size(row)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._bytes = 0
+            self._changes = None
+
+    def tail(self, limit: int) -> List[Dict[str, Any]]:
+        """Últimas ``limit`` linhas em ordem crescente de timestamp (O(limit))."""
+        with self._lock:
+            rows = list(islice(reversed(self._rows), max(0, limit)))
+        rows.reverse()
+        return [dict(zip(FIELDS, r)) for r in rows]
+
+    def rows(self) -> List[Row]:
+        """Cópia das linhas guardadas (tuplas), em ordem de timestamp."""
+        with self._lock:
+            return list(self._rows)
+
+    def to_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'seq': self._seq, 'linhas': [list(r) for r in self._rows]}
+
+    def drain_changes(self) -> Optional[Dict[str, Any]]:
+        """Linhas recebidas desde a última chamada, na ordem de chegada.
+
+        Retorna ``None`` se foram mais que ``capacity`` (ou houve ``clear``) e
+        é preciso enviar o estado completo.
+        """
+        with self._lock:
+            changes, self._changes = self._changes, []
+            if changes is None:
+                return None
+            return {'seq': self._seq, 'linhas': [list(r) for r in changes]}
+
+    def apply_state(self, state: Dict[str, Any], replace: bool = False):
+        """Aplica estado (completo ou linhas novas) exportado por outra instância.
+
+        ``seq`` conta as linhas já recebidas pela origem: linhas que esta
+        réplica já tem (ex: vindas no estado completo) não são repetidas.
+        """
+        with self._lock:
+            linhas = state['linhas']
+            if replace:
+                self._rows.clear()
+                self._bytes = 0
+            else:
+                linhas = linhas[max(0, len(linhas) - (state['seq'] - self._seq)):]
+            for row in linhas:
+                self._insert(tuple(row))
+            self._seq = state['seq']
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'capacidade': self.capacity,
+                'linhas': len(self._rows),
+                'bytes_aprox': self._bytes + sys.getsizeof(self._rows),
+            }
+
+
+__all__ = ["HistoryBuffer"]
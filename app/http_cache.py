@@ -0,0 +1,147 @@
+"""Respostas versionadas para os endpoints de leitura (ETag, 304 e compressão).
+
+O corpo JSON de cada (rota, parâmetros) é serializado uma vez por versão do
+snapshot e guardado num LRU limitado; as variantes gzip/brotli são calculadas
+sob demanda, também uma única vez, e reaproveitadas por todos os clientes. O ETag é derivado do
+conteúdo, então continua válido entre workers e após reinício do carregador.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app import metrics
+from app.serialization import dumps
+
+try:
+    import brotli  # type: ignore
+except Exception:  # brotli opcional
+    brotli = None  # type: ignore
+
+# Corpos menores que isso não compensam a compressão
+MIN_COMPRESS_BYTES = 512
+
+
+class EncodedBody:
+    """Corpo serializado e suas variantes comprimidas (calculadas uma vez)."""
+
+    __slots__ = ('identity', 'etag', '_variants')
+
+    def __init__(self, body: bytes):
+        self.identity = body
+        self.etag = 'W/"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        self._variants: Dict[str, bytes] = {}
+
+    def variant(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.identity
+        data = self._variants.get(encoding)
+        if data is None:
+            if encoding == 'br':
+                data = brotli.compress(self.identity, quality=5)
+            else:
+                data = gzip.compress(self.identity, compresslevel=6, mtime=0)
+            self._variants[encoding] = data
+        return data
+
+
+def choose_encoding(accept_encoding: str, size: int) -> Optional[str]:
+    if size < MIN_COMPRESS_BYTES or not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        key, _, value = params.partition('=')
+        if key.strip() == 'q':
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == bare:
+            return True
+    return False
+
+
+def respond(request: Request, body: EncodedBody, media_type: str = 'application/json') -> Response:
+    """304 se o cliente já tem a versão; senão o corpo na melhor codificação aceita."""
+    headers = {'ETag': body.etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and _matches(if_none_match, body.etag):
+        return Response(status_code=304, headers=headers)
+    encoding = choose_encoding(request.headers.get('accept-encoding', ''), len(body.identity))
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return Response(body.variant(encoding), media_type=media_type, headers=headers)
+
+
+class VersionedBodies:
+    """LRU de corpos serializados, chaveado por (versão do snapshot, rota e parâmetros).
+
+    ``key`` é uma tupla cujo primeiro item é o nome da rota (rótulo das
+    métricas). ``invalidate`` é registrado como subscriber do DataManager: a
+    cada snapshot publicado, as entradas de versões anteriores são liberadas.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = max(1, maxsize)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Hashable, tuple], EncodedBody]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, versao: Hashable, key: tuple, build: Callable[[], Any]) -> EncodedBody:
+        entry_key = (versao, key)
+        with self._lock:
+            body = self._entries.get(entry_key)
+            if body is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+        if body is not None:
+            metrics.RESPONSE_CACHE.inc(rota=key[0], resultado='hit')
+            return body
+        # Serialização fora do lock; corrida rara só repete o trabalho
+        body = EncodedBody(dumps(build()))
+        with self._lock:
+            self.misses += 1
+            body = self._entries.setdefault(entry_key, body)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        metrics.RESPONSE_CACHE.inc(rota=key[0], resultado='miss')
+        return body
+
+    def invalidate(self, snapshot: Optional[Dict[str, Any]] = None):
+        """Descarta entradas de versões diferentes da de ``snapshot`` (todas, se None)."""
+        versao = (snapshot or {}).get('versao')
+        with self._lock:
+            for entry_key in [k for k in self._entries if snapshot is None or k[0] != versao]:
+                del self._entries[entry_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entradas': len(self._entries), 'capacidade': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+__all__ = ["EncodedBody", "VersionedBodies", "respond", "choose_encoding"]
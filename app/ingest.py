@@ -0,0 +1,246 @@
+"""Ingestão de eventos por API com group commit.
+
+``POST /api/events`` entrega lotes a ``GroupCommitter.submit``; uma única
+thread grava tudo o que se acumulou desde a gravação anterior com um só
+``write`` e aplica as linhas direto nos agregados (``DataManager.append_rows``),
+sem esperar watchdog/polling. Enquanto um commit está em andamento os lotes
+seguintes se acumulam e vão juntos no próximo.
+"""
+import asyncio
+import csv
+import io
+import logging
+import operator
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from app import metrics
+from app.checkpoint import open_live
+from app.csv_columns import COLUMNS, INT64_MAX, INT64_MIN
+
+logger = logging.getLogger(__name__)
+
+# (timestamp, produto, vendas, estoque)
+Event = Tuple[str, str, int, int]
+
+# Espera máxima para outro produtor terminar a última linha do CSV antes de acrescentar
+TAIL_WAIT_SECONDS = 1.0
+# Bloco da busca, de trás para frente, pelo fim da última linha completa
+_SCAN_BYTES = 1 << 16
+
+
+def validate_rows(rows: Sequence[Event]) -> List[Event]:
+    """Confere e normaliza o lote inteiro antes de qualquer gravação.
+
+    Uma linha que a leitura não consegue acumular (contagem fora de int64,
+    quebra de linha no produto) já gravada no CSV faria falhar todas as
+    ingestões seguintes; aqui o lote é recusado com ``ValueError``.
+    """
+    out = []
+    for ts, produto, vendas, estoque in rows:
+        if not isinstance(produto, str) or not produto or '\n' in produto or '\r' in produto:
+            raise ValueError(f"produto inválido: {produto!r}")
+        if not isinstance(ts, str) or '\n' in ts or '\r' in ts:
+            raise ValueError(f"timestamp inválido: {ts!r}")
+        counts = []
+        for name, value in (('vendas', vendas), ('estoque', estoque)):
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                value = operator.index(value)
+            except TypeError:
+                raise ValueError(f"{name} não é inteiro: {value!r}") from None
+            if not INT64_MIN <= value <= INT64_MAX:
+                raise ValueError(f"{name} fora do intervalo de int64: {value!r}")
+            counts.append(value)
+        out.append((ts, produto, counts[0], counts[1]))
+    return out
+
+
+def encode_rows(rows: Sequence[Event], fieldnames: Sequence[str]) -> bytes:
+    """Linhas CSV na ordem de colunas do cabeçalho do arquivo."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    positions = [COLUMNS.index(name) if name in COLUMNS else None for name in fieldnames]
+    for row in rows:
+        writer.writerow(['' if p is None else row[p] for p in positions])
+    return buf.getvalue().encode('utf-8')
+
+
+def _ends_with_newline(f) -> bool:
+    f.seek(-1, os.SEEK_END)
+    return f.read(1) == b'\n'
+
+
+def quarantine_path(path: Path) -> Path:
+    return path.with_name(path.name + '.quarentena')
+
+
+def _quarantine_tail(path: Path, f) -> None:
+    """Move a última linha incompleta para ``quarantine_path`` e corta o CSV no fim da anterior.
+
+    Os leitores só consomem linhas completas, então o offset deles nunca passa
+    do corte. Sem nenhuma linha completa (nem o cabeçalho) não há o que
+    preservar: levanta ``OSError``.
+    """
+    size = f.seek(0, os.SEEK_END)
+    cut = size
+    while cut > 0:
+        start = max(0, cut - _SCAN_BYTES)
+        f.seek(start)
+        pos = f.read(cut - start).rfind(b'\n')
+        if pos >= 0:
+            cut = start + pos + 1
+            break
+        cut = start
+    if cut == 0:
+        raise OSError(f"{path} sem nenhuma linha completa")
+    f.seek(cut)
+    fragment = f.read(size - cut)
+    with open(quarantine_path(path), 'ab') as q:
+        q.write(fragment + b'\n')
+        q.flush()
+        os.fsync(q.fileno())
+    f.truncate(cut)
+    metrics.INGEST_QUARANTINED.inc()
+    logger.error(
+        "linha_incompleta_em_quarentena",
+        extra={"csv": str(path), "offset": cut, "bytes": len(fragment), "quarentena": str(quarantine_path(path))},
+    )
+
+
+def append_to_csv(path: Path, rows: Sequence[Event], fsync: bool = False,
+                  tail_wait: float = TAIL_WAIT_SECONDS) -> bytes:
+    """Acrescenta ``rows`` ao CSV com um único write. Retorna os bytes gravados.
+
+    O lote é validado por inteiro antes de abrir o arquivo (``validate_rows``)
+    e gravado com a trava do CSV vivo (``open_live``), que a compactação
+    segura durante a troca. Cria o arquivo (com cabeçalho) se não existir.
+    Se a última linha estiver incompleta (outro produtor no meio de uma
+    gravação), espera até ``tail_wait`` segundos que ela termine: terminá-la
+    daqui partiria a linha alheia em duas, e o DataManager só lê linhas
+    completas. Se continuar incompleta, o produtor é dado como morto e o
+    trecho vai para a quarentena (``<csv>.quarentena``, log de erro e
+    ``dashboard_ingest_quarantined_lines_total``) antes da gravação.
+    """
+    rows = validate_rows(rows)
+    deadline = time.monotonic() + tail_wait
+    with open_live(path) as f:
+        f.seek(0)
+        header_line = f.readline()
+        if header_line:
+            fieldnames = next(csv.reader([header_line.decode('utf-8')]))
+            while not _ends_with_newline(f):
+                if time.monotonic() >= deadline:
+                    _quarantine_tail(path, f)
+                    break
+                time.sleep(0.01)
+            prefix = b''
+        else:
+            fieldnames = list(COLUMNS)
+            prefix = (','.join(COLUMNS) + '\n').encode('utf-8')
+        data = prefix + encode_rows(rows, fieldnames)
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    return data
+
+
+class GroupCommitter:
+    """Agrupa lotes concorrentes em um commit por vez (thread dedicada).
+
+    ``commit`` recebe todas as linhas acumuladas e devolve um resultado
+    repassado a cada lote. ``linger`` segura o commit alguns milissegundos
+    para juntar mais lotes; 0 grava assim que a thread estiver livre.
+    """
+
+    def __init__(self, commit: Callable[[List[Event]], Any], max_rows: int = 50_000, linger: float = 0.0):
+        self._commit = commit
+        self.max_rows = max_rows
+        self.linger = linger
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[List[Event], Future]] = []
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.commits = 0
+        self.rows = 0
+
+    def start(self):
+        with self._cond:
+            self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='ingest-commit', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, rows: List[Event]) -> Future:
+        """Enfileira um lote; lote inválido falha sozinho, sem derrubar o commit dos outros."""
+        future: Future = Future()
+        try:
+            rows = validate_rows(rows)
+        except ValueError as e:
+            future.set_exception(e)
+            return future
+        with self._cond:
+            if self._stopped:
+                future.set_exception(RuntimeError("ingestão encerrada"))
+                return future
+            self._pending.append((rows, future))
+            self._cond.notify_all()
+        return future
+
+    async def submit_async(self, rows: List[Event]):
+        return await asyncio.wrap_future(self.submit(rows))
+
+    def _take(self) -> List[Tuple[List[Event], Future]]:
+        taken, total = [], 0
+        while self._pending and (not taken or total + len(self._pending[0][0]) <= self.max_rows):
+            batch = self._pending.pop(0)
+            taken.append(batch)
+            total += len(batch[0])
+        return taken
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._pending)
+                if self._stopped and not self._pending:
+                    return
+            if self.linger:
+                time.sleep(self.linger)
+            with self._cond:
+                batches = self._take()
+            rows = [row for batch, _ in batches for row in batch]
+            start = time.perf_counter()
+            try:
+                result = self._commit(rows)
+            except Exception as e:
+                logger.exception("ingest_commit_failed")
+                for _, future in batches:
+                    future.set_exception(e)
+                continue
+            metrics.INGEST_COMMIT_DURATION.observe(time.perf_counter() - start)
+            metrics.INGEST_COMMIT_ROWS.observe(len(rows))
+            metrics.INGEST_ROWS.inc(len(rows))
+            self.commits += 1
+            self.rows += len(rows)
+            for _, future in batches:
+                future.set_result(result)
+
+    def stats(self):
+        with self._cond:
+            pendentes = sum(len(batch) for batch, _ in self._pending)
+        return {'commits': self.commits, 'linhas': self.rows, 'pendentes': pendentes}
+
+
+__all__ = ["GroupCommitter", "append_to_csv", "encode_rows", "validate_rows", "quarantine_path"]
@@ -1,14 +1,24 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pythonjsonlogger import jsonlogger
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app import metrics
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # 'json' ou 'plain'
 LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
-LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / 'app.log'
+# Formatação e escrita em disco numa thread própria (fila entre o app e os handlers)
+LOG_QUEUE = os.getenv("LOG_QUEUE", "0") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Amostragem por logger (ou logger:mensagem) abaixo de WARNING, ex: "http=0.01,api:snapshot_served=0.01"
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
 
 
 class PlainFormatter(logging.Formatter):
@@ -17,13 +27,118 @@ class PlainFormatter(logging.Formatter):
         super().__init__(self.default_fmt)
 
 
-def configure_logging():
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """``"http=0.01,api:snapshot_served=0.1"`` -> ``{'http': 0.01, 'api:snapshot_served': 0.1}``."""
+    rates = {}
+    for part in (p.strip() for p in spec.split(',')):
+        if not part:
+            continue
+        name, sep, value = part.rpartition('=')
+        try:
+            rate = float(value)
+        except ValueError:
+            rate = -1.0
+        if not sep or not name or not 0.0 <= rate <= 1.0:
+            raise ValueError(f"amostragem inválida: {part!r} (use ex: http=0.01)")
+        rates[name.strip()] = rate
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Mantém só uma fração dos registros abaixo de WARNING de cada logger.
+
+    As regras valem para o logger e seus filhos (``app`` cobre ``app.main``);
+    ``logger:mensagem`` restringe a uma mensagem. Erros e avisos passam
+    sempre. Registros mantidos ganham ``amostra`` (a taxa), para reponderar
+    contagens feitas a partir dos logs.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._by_message = {k: v for k, v in rates.items() if ':' in k}
+        self._by_logger: Dict[str, Optional[float]] = {}
+
+    def _rate(self, record: logging.LogRecord) -> Optional[float]:
+        if self._by_message:
+            rate = self._by_message.get(f"{record.name}:{record.msg}")
+            if rate is not None:
+                return rate
+        try:
+            return self._by_logger[record.name]
+        except KeyError:
+            pass
+        name, rate = record.name, None
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                break
+            name = name.rpartition('.')[0]
+        self._by_logger[record.name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record)
+        if rate is None or rate >= 1.0:
+            return True
+        # Mesmo filtro em vários handlers: a decisão fica no próprio registro e vale
+        # para todos, mesmo com outras threads filtrando registros no meio
+        keep = getattr(record, '_sampled', None)
+        if keep is not None:
+            return keep
+        keep = record._sampled = random.random() < rate
+        if keep:
+            record.amostra = rate
+        else:
+            metrics.LOG_DISCARDED.inc(motivo='amostragem')
+        return keep
+
+
+class _QueueHandler(QueueHandler):
+    """Enfileira sem formatar: só junta ``msg % args`` e o traceback (o resto fica na thread do listener).
+
+    Único handler do root quando a fila está ativa, então altera o próprio
+    registro em vez de copiá-lo como o ``QueueHandler`` padrão.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Disco/console não acompanham: descarta em vez de bloquear o event loop
+            metrics.LOG_DISCARDED.inc(motivo='fila_cheia')
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Com a fila cheia, espera o listener abrir espaço em vez de falhar no stop()
+        self.queue.put(self._sentinel)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(use_queue: Optional[bool] = None, sampling: Optional[str] = None):
+    global _listener
     root = logging.getLogger()
     if getattr(root, '_configured', False):
         return
+    use_queue = LOG_QUEUE if use_queue is None else use_queue
+    rates = parse_sampling(LOG_SAMPLE if sampling is None else sampling)
     root.setLevel(LOG_LEVEL)
     for h in list(root.handlers):
         root.removeHandler(h)
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
 
     if LOG_FORMAT == 'json':
         formatter = jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s %(pathname)s %(lineno)s')
@@ -32,11 +147,41 @@ def configure_logging():
 
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    root.addHandler(stream_handler)
 
     file_handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=5, encoding='utf-8')
     file_handler.setFormatter(formatter)
-    root.addHandler(file_handler)
+
+    handlers: Tuple[logging.Handler, ...] = (stream_handler, file_handler)
+    if use_queue:
+        queue_handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _listener = _QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        handlers = (queue_handler,)
+    sampler = SamplingFilter(rates) if rates else None
+    for handler in handlers:
+        if sampler is not None:
+            # No handler (e não no logger) para valer também para os loggers filhos
+            handler.addFilter(sampler)
+        root.addHandler(handler)
 
     root._configured = True  # type: ignore
-    root.info("logging configured", extra={"level": LOG_LEVEL, "format": LOG_FORMAT, "file": str(LOG_FILE)})
+    root.info("logging configured", extra={
+        "level": LOG_LEVEL, "format": LOG_FORMAT, "file": str(LOG_FILE), "queue": use_queue, "sample": rates,
+    })
+
+
+def shutdown_logging():
+    """Esvazia a fila (se houver) e desfaz ``configure_logging``."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    root._configured = False  # type: ignore
+
+
+__all__ = ["configure_logging", "shutdown_logging", "parse_sampling", "SamplingFilter", "LOG_FILE"]
@@ -1,90 +1,138 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import logging
+import os
 import time
+from datetime import datetime, timezone
 from pathlib import Path
-import asyncio
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from app import http_cache, metrics, serialization
+from app.csv_columns import INT64_MAX, INT64_MIN, CsvSchema
 from app.data_loader import DataManager
+from app.event_bus import SnapshotBus
+from app.ingest import GroupCommitter, append_to_csv
+from app.product_index import ORDERS
+from app.shared_snapshot import SharedDataManager
+from app.rollups import parse_timestamp
+from app.windows import parse_windows
+from app.ws_manager import WSConnectionManager
 from app.logging_setup import configure_logging
-try:
-    import pandas as pd  # type: ignore
-except Exception:
-    pd = None  # type: ignore
 
-configure_logging()
 logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
-CSV_PATH = BASE_DIR / 'sample_data.csv'
+# Arquivo CSV ou diretório de CSVs (um por dia/filial) filtrados por CSV_PATTERN
+CSV_PATH = Path(os.getenv("CSV_PATH", str(BASE_DIR / 'sample_data.csv')))
+CSV_PATTERN = os.getenv("CSV_PATTERN", "*.csv")
+# Quantidade de linhas recentes mantidas em memória para /api/historico
+HISTORY_CAPACITY = int(os.getenv("HISTORY_CAPACITY", "1000"))
+# Fila de saída por cliente WS e atraso máximo tolerado antes de desconectar
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "32"))
+WS_MAX_LAG_SECONDS = float(os.getenv("WS_MAX_LAG_SECONDS", "10"))
+# Produtos + campos que uma conexão pode assinar ({"type": "subscribe", ...})
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "1000"))
+# Leitura com pandas: formato dos timestamps, tipo das contagens e, a partir de
+# CSV_CHUNK_THRESHOLD_MB, leitura em blocos de CSV_CHUNK_ROWS linhas
+CSV_TIMESTAMP_FORMAT = os.getenv("CSV_TIMESTAMP_FORMAT", "%Y-%m-%dT%H:%M")
+CSV_INT_DTYPE = os.getenv("CSV_INT_DTYPE", "int32")
+CSV_CHUNK_THRESHOLD_MB = float(os.getenv("CSV_CHUNK_THRESHOLD_MB", "64"))
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+# Cache de estado para partida rápida (vazio = desativado)
+CSV_CACHE_DIR = os.getenv("CSV_CACHE_DIR")
+# Recarga do CSV: gatilhos dentro da janela de debounce viram uma só leitura,
+# e nenhuma mudança espera mais que o staleness máximo
+RELOAD_DEBOUNCE_SECONDS = float(os.getenv("RELOAD_DEBOUNCE_SECONDS", "0.05"))
+RELOAD_MAX_STALENESS_SECONDS = float(os.getenv("RELOAD_MAX_STALENESS_SECONDS", "2"))
+# Respostas serializadas (por rota/parâmetros e versão do snapshot) mantidas em LRU
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "128"))
+# Janelas deslizantes publicadas no snapshot (total_vendas_5m, vendas_por_produto_5m, ...)
+SLIDING_WINDOWS = parse_windows(os.getenv("SLIDING_WINDOWS", "5m,1h,24h"))
+# Pontos por resposta de /api/series (os mais recentes), qualquer que seja o número de produtos
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "20000"))
+# Produtos por mapa do snapshot (mais vendidos / menor estoque); 0 = catálogo inteiro.
+# O catálogo completo é paginado em /api/produtos
+SNAPSHOT_TOP_N = int(os.getenv("SNAPSHOT_TOP_N", "50"))
+# POST /api/events: linhas por requisição, espera extra para agrupar commits e fsync por commit
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "10000"))
+INGEST_LINGER_MS = float(os.getenv("INGEST_LINGER_MS", "0"))
+INGEST_FSYNC = os.getenv("INGEST_FSYNC", "0") == "1"
+# Com vários workers: socket do processo carregador (python -m app.shared_snapshot)
+SNAPSHOT_SOCKET = os.getenv("SNAPSHOT_SOCKET")
 
-app = FastAPI(title="Dashboard Vendas & Estoque")
+app = FastAPI(title="Dashboard Vendas & Estoque", default_response_class=serialization.FastJSONResponse)
 
 templates = Jinja2Templates(directory=str(BASE_DIR / 'templates'))
 app.mount('/static', StaticFiles(directory=str(BASE_DIR / 'static')), name='static')
 
-data_manager = DataManager(CSV_PATH, refresh_interval=5.0)
+if SNAPSHOT_SOCKET:
+    data_manager = SharedDataManager(SNAPSHOT_SOCKET, history_size=HISTORY_CAPACITY)
+else:
+    data_manager = DataManager(
+        CSV_PATH,
+        refresh_interval=5.0,
+        history_size=HISTORY_CAPACITY,
+        cache_dir=Path(CSV_CACHE_DIR) if CSV_CACHE_DIR else None,
+        pattern=CSV_PATTERN,
+        debounce=RELOAD_DEBOUNCE_SECONDS,
+        max_staleness=RELOAD_MAX_STALENESS_SECONDS,
+        windows=SLIDING_WINDOWS,
+        top_n=SNAPSHOT_TOP_N,
+        schema=CsvSchema(
+            timestamp_format=CSV_TIMESTAMP_FORMAT,
+            int_dtype=CSV_INT_DTYPE,
+            chunk_threshold=int(CSV_CHUNK_THRESHOLD_MB * 1024 * 1024),
+            chunk_rows=CSV_CHUNK_ROWS,
+        ),
+    )
 
+ws_manager = WSConnectionManager(
+    data_manager.get_snapshot,
+    queue_size=WS_QUEUE_SIZE,
+    max_lag_seconds=WS_MAX_LAG_SECONDS,
+    product_lookup=data_manager.lookup_produtos,
+    max_subscriptions=WS_MAX_SUBSCRIPTIONS,
+)
+snapshot_bus = SnapshotBus(ws_manager.publish)
+response_bodies = http_cache.VersionedBodies(RESPONSE_CACHE_SIZE)
 
-class WSConnectionManager:
-    def __init__(self):
-        self.active: list[WebSocket] = []
-        self._lock = asyncio.Lock()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        async with self._lock:
-            self.active.append(websocket)
-        logging.getLogger("ws").info("ws_connected", extra={"total_active": len(self.active), "client": str(websocket.client)})
-        # Envia snapshot inicial
-        await self.send_personal(websocket, data_manager.get_snapshot())
+def _commit_events(rows):
+    if isinstance(data_manager, DataManager):
+        return data_manager.append_rows(rows, fsync=INGEST_FSYNC)
+    # Worker com carregador compartilhado: grava no CSV e o carregador lê pela cauda
+    append_to_csv(CSV_PATH, rows, INGEST_FSYNC)
+    return None
 
-    async def disconnect(self, websocket: WebSocket):
-        async with self._lock:
-            if websocket in self.active:
-                self.active.remove(websocket)
-        logging.getLogger("ws").info("ws_disconnected", extra={"total_active": len(self.active), "client": str(websocket.client)})
-
-    async def broadcast(self, data):
-        dead = []
-        for ws in list(self.active):
-            try:
-                await ws.send_json(data)
-            except Exception:
-                dead.append(ws)
-        if dead:
-            async with self._lock:
-                for d in dead:
-                    if d in self.active:
-                        self.active.remove(d)
-
-    async def send_personal(self, websocket: WebSocket, data):
-        await websocket.send_json(data)
 
+ingest_committer = GroupCommitter(_commit_events, linger=INGEST_LINGER_MS / 1000)
 
-ws_manager = WSConnectionManager()
+metrics.SNAPSHOT_AGE.set_function(data_manager.snapshot_age)
+metrics.WS_CONNECTIONS.set_function(lambda: len(ws_manager.active))
+metrics.WS_SUBSCRIBED_PRODUCTS.set_function(lambda: ws_manager.subscribed_products)
 
 
 @app.on_event("startup")
 async def startup():
-    data_manager.start()
-    # Registrar callback para broadcast
-    def push(snapshot):
-        # Encapsular para loop async
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(ws_manager.broadcast({'type': 'snapshot', 'data': snapshot}))
-        except RuntimeError:
-            pass
-
-    data_manager.subscribe(push)
-    logger.info("Aplicação inicializada")
+    # Logging configurado na partida, não no import (import de app.main sem efeitos colaterais)
+    configure_logging()
+    # Os subscribers rodam nas threads do carregador: o bus repassa ao event loop
+    await snapshot_bus.start()
+    data_manager.subscribe(snapshot_bus.publish_threadsafe)
+    data_manager.subscribe(response_bodies.invalidate)
+    # Carga inicial em segundo plano: o servidor aceita conexões já e /ready indica quando há snapshot
+    data_manager.start(background=True)
+    ingest_committer.start()
+    logger.info("Aplicação inicializada", extra={"estado": data_manager.state})
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    ingest_committer.stop()
     data_manager.stop()
+    await snapshot_bus.stop()
 
 
 @app.get('/', response_class=HTMLResponse)
@@ -92,75 +140,210 @@ async def index(request: Request):
     return templates.TemplateResponse('index.html', {"request": request, "title": "Dashboard"})
 
 
+def _not_ready() -> Response:
+    return serialization.FastJSONResponse(
+        {"estado": data_manager.state}, status_code=503, headers={"Retry-After": "1"},
+    )
+
+
+@app.get('/ready')
+async def ready():
+    """Prontidão: 200 quando já existe snapshot, 503 enquanto a carga inicial não termina."""
+    if not data_manager.ready:
+        return _not_ready()
+    return {"estado": "pronto", "versao": data_manager.get_snapshot().get('versao')}
+
+
 @app.get('/api/data')
-async def api_data():
+async def api_data(request: Request):
+    if not data_manager.ready:
+        return _not_ready()
     snapshot = data_manager.get_snapshot()
     logging.getLogger("api").debug("snapshot_served", extra={"linhas": snapshot.get('linhas'), "total_vendas": snapshot.get('total_vendas')})
-    return snapshot
+    # ETag/304 e gzip/brotli calculados uma vez por versão (ver app.http_cache)
+    body = response_bodies.get(snapshot.get('versao'), ('data',), lambda: snapshot)
+    return http_cache.respond(request, body)
 
 
 @app.get('/api/historico')
-async def api_historico(limit: int = Query(100, ge=1, le=1000)):
-    """Retorna as últimas linhas (raw) do CSV para gráficos históricos.
-    Funciona com pandas (se disponível) ou fallback csv puro.
+async def api_historico(request: Request, limit: int = Query(100, ge=1, le=1000)):
+    """Retorna as últimas linhas do CSV para gráficos históricos.
+    Servido do buffer em memória do DataManager (sem reler o arquivo).
     """
-    if not CSV_PATH.exists():
-        return []
     try:
-        def make_json_safe(obj):
-            """Converte tipos numpy/pandas para tipos nativos Python"""
-            if hasattr(obj, 'item'):  # numpy scalar
-                return obj.item()
-            elif hasattr(obj, 'isoformat'):  # datetime/timestamp
-                return obj.isoformat()
-            elif isinstance(obj, dict):
-                return {k: make_json_safe(v) for k, v in obj.items()}
-            elif isinstance(obj, (list, tuple)):
-                return [make_json_safe(item) for item in obj]
-            else:
-                return obj
-
-        if pd:
-            df = pd.read_csv(CSV_PATH)
-            if df.empty:
-                return []
-            if 'timestamp' in df.columns:
-                try:
-                    df['timestamp'] = pd.to_datetime(df['timestamp'])
-                    df = df.sort_values('timestamp')
-                except Exception:
-                    pass
-            df = df.tail(limit)
-            records = df.to_dict(orient='records')
-            return JSONResponse([make_json_safe(record) for record in records])
-        else:
-            import csv
-            rows = []
-            with open(CSV_PATH, newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for r in reader:
-                    rows.append(r)
-            if not rows:
-                return []
-            rows = rows[-limit:]
-            return JSONResponse(rows)
+        versao = data_manager.get_snapshot().get('versao')
+        body = response_bodies.get(versao, ('historico', limit), lambda: data_manager.get_historico(limit))
+        return http_cache.respond(request, body)
     except Exception as e:
         logger.error("Erro ao ler historico: %s", e)
-        return JSONResponse([], status_code=500)
+        return serialization.FastJSONResponse([], status_code=500)
+
+
+@app.get('/api/series')
+async def api_series(
+    request: Request,
+    bucket: str = Query('5m'),
+    produto: Optional[list[str]] = Query(None),
+    inicio: Optional[str] = Query(None, alias='from'),
+    fim: Optional[str] = Query(None, alias='to'),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+):
+    """Série por bucket de tempo (rollups mantidos incrementalmente pelo DataManager).
+
+    ``limit`` vale por produto; a resposta inteira tem no máximo
+    ``SERIES_MAX_POINTS`` pontos (os mais recentes).
+
+    Ex: /api/series?bucket=5m&produto=Produto%20A&from=2025-08-15T20:00&to=2025-08-15T22:00
+    """
+    if bucket not in data_manager.rollups.resolutions:
+        return serialization.FastJSONResponse(
+            {"erro": f"bucket inválido: {bucket}", "disponiveis": list(data_manager.rollups.resolutions)},
+            status_code=400,
+        )
+    limites = []
+    for valor in (inicio, fim):
+        epoch = parse_timestamp(valor) if valor else None
+        if valor and epoch is None:
+            return serialization.FastJSONResponse({"erro": f"timestamp inválido: {valor}"}, status_code=400)
+        limites.append(epoch)
+    versao = data_manager.get_snapshot().get('versao')
+    key = ('series', bucket, tuple(produto or ()), limites[0], limites[1], limit)
+    body = response_bodies.get(
+        versao, key,
+        lambda: data_manager.get_series(bucket, produto, limites[0], limites[1], limit, SERIES_MAX_POINTS),
+    )
+    return http_cache.respond(request, body)
+
+
+@app.get('/api/produtos')
+async def api_produtos(
+    request: Request,
+    ordem: str = Query('produto'),
+    desc: bool = Query(False),
+    prefixo: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Catálogo completo paginado por cursor (o snapshot traz só os top N).
+
+    Ex: /api/produtos?ordem=vendas&desc=true&prefixo=Produto%20A&limit=50
+    e depois &cursor=<proximo> para a página seguinte.
+    """
+    if ordem not in ORDERS:
+        return serialization.FastJSONResponse(
+            {"erro": f"ordem inválida: {ordem}", "disponiveis": list(ORDERS)}, status_code=400
+        )
+    versao = data_manager.get_snapshot().get('versao')
+    key = ('produtos', ordem, desc, prefixo, cursor, limit)
+    try:
+        body = response_bodies.get(
+            versao, key, lambda: data_manager.get_produtos(ordem, desc, prefixo, cursor, limit)
+        )
+    except ValueError as e:
+        return serialization.FastJSONResponse({"erro": str(e)}, status_code=400)
+    return http_cache.respond(request, body)
+
+
+class Evento(BaseModel):
+    timestamp: Optional[str] = None  # ISO 8601; vazio = agora (UTC)
+    # Uma linha CSV por evento: quebras de linha (mesmo entre aspas) desalinham a compactação
+    produto: str = Field(min_length=1, pattern=r'^[^\r\n]+$')
+    # Fora de int64 a leitura do CSV descartaria a contagem: recusado antes de gravar
+    vendas: int = Field(0, ge=INT64_MIN, le=INT64_MAX)
+    estoque: int = Field(0, ge=INT64_MIN, le=INT64_MAX)
+
+
+@app.post('/api/events')
+async def api_events(eventos: List[Evento]):
+    """Recebe um lote de linhas; gravado no CSV em group commit e aplicado sem esperar o watchdog.
+
+    Ex: POST /api/events  [{"produto": "Produto A", "vendas": 3, "estoque": 97}]
+    """
+    if len(eventos) > INGEST_MAX_BATCH:
+        return serialization.FastJSONResponse(
+            {"erro": f"lote maior que {INGEST_MAX_BATCH} eventos"}, status_code=413
+        )
+    agora = datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec='seconds')
+    rows = []
+    for evento in eventos:
+        ts = evento.timestamp or agora
+        if parse_timestamp(ts) is None:
+            return serialization.FastJSONResponse({"erro": f"timestamp inválido: {ts}"}, status_code=422)
+        rows.append((ts, evento.produto, evento.vendas, evento.estoque))
+    if not rows:
+        return {"aceitos": 0, "versao": data_manager.get_snapshot().get('versao')}
+    try:
+        versao = await ingest_committer.submit_async(rows)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.error("Erro na ingestão: %s", e)
+        return serialization.FastJSONResponse({"erro": str(e)}, status_code=503)
+    return {"aceitos": len(rows), "versao": versao}
+
+
+@app.get('/api/ws/stats')
+async def api_ws_stats():
+    """Profundidade de fila e latência de envio por cliente WebSocket."""
+    return ws_manager.stats()
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Métricas no formato texto do Prometheus (ver app.metrics)."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.websocket('/ws')
 async def websocket_endpoint(websocket: WebSocket):
-    await ws_manager.connect(websocket)
+    await ws_manager.connect(websocket, _parse_versao(websocket.query_params.get('versao')))
     try:
         while True:
-            # Mantemos a conexão viva (ping/pong implícito)
-            await websocket.receive_text()
+            # Mantemos a conexão viva (ping/pong implícito); mensagens JSON
+            # {"type": "resume", "versao": N} pedem catch-up a partir de N;
+            # subscribe/unsubscribe filtram o stream (ver WSConnectionManager)
+            text = await websocket.receive_text()
+            if not text.startswith('{'):
+                continue
+            try:
+                msg = serialization.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(msg, dict):
+                continue
+            tipo = msg.get('type')
+            if tipo == 'resume':
+                await ws_manager.resume(websocket, _parse_versao(msg.get('versao')))
+            elif tipo == 'subscribe':
+                await ws_manager.subscribe(
+                    websocket, _parse_names(msg.get('produtos')), _parse_names(msg.get('campos')),
+                    todos=msg.get('todos') is True,
+                )
+            elif tipo == 'unsubscribe':
+                produtos, campos = msg.get('produtos'), msg.get('campos')
+                await ws_manager.unsubscribe(
+                    websocket,
+                    None if produtos is None else _parse_names(produtos),
+                    None if campos is None else _parse_names(campos),
+                )
     except WebSocketDisconnect:
         await ws_manager.disconnect(websocket)
     except Exception:
         await ws_manager.disconnect(websocket)
 
+
+def _parse_versao(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_names(value) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list):
+        return []
+    return [v for v in value if isinstance(v, str)]
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start = time.perf_counter()
@@ -169,8 +352,16 @@ async def log_requests(request: Request, call_next):
         response = await call_next(request)
         return response
     finally:
-        duration_ms = (time.perf_counter() - start) * 1000
-        logging.getLogger("http").info(
+        duration = time.perf_counter() - start
+        duration_ms = duration * 1000
+        # Rota (template) em vez do caminho, para não explodir a cardinalidade
+        route = getattr(request.scope.get('route'), 'path', 'desconhecida')
+        status = getattr(response, 'status_code', 500)
+        metrics.HTTP_LATENCY.observe(duration, method=request.method, route=route)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status))
+        # 5xx como erro: nunca cai na amostragem de LOG_SAMPLE
+        logging.getLogger("http").log(
+            logging.ERROR if status >= 500 else logging.INFO,
             "request",
             extra={
                 "method": request.method,
@@ -0,0 +1,260 @@
+"""Métricas no formato texto do Prometheus, expostas em ``/metrics``.
+
+Registro mínimo (contadores, gauges e histogramas com labels) para não
+exigir ``prometheus_client``. As métricas são por processo: com
+``SNAPSHOT_SOCKET`` as de recarga do CSV ficam no processo carregador e os
+workers expõem apenas HTTP, WebSocket e idade do snapshot.
+"""
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RELOAD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge com valor fixo (``set``) ou calculado na coleta (``set_function``)."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, fn: Callable[[], float]):
+        self._function = fn
+
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def _samples(self) -> List[str]:
+        return [f'{self.name} {_number(self.value())}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # labels -> [contagens por bucket..., soma, total]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            cell = self._values.get(key)
+            if cell is None:
+                cell = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    cell[i] += 1
+                    break
+            cell[-2] += value
+            cell[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            cell = self._values.get(self._key(labels))
+            return cell[-1] if cell else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, cell in items:
+            acumulado = 0
+            for bound, n in zip(self.buckets, cell):
+                acumulado += n
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {acumulado}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, INF_LABEL)} {cell[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(cell[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cell[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# -- carregador do CSV --------------------------------------------------
+RELOADS = REGISTRY.register(Counter(
+    'dashboard_reloads_total',
+    'Verificações de recarga do CSV por resultado (inclui as ignoradas sem mudança).',
+    ('resultado',),
+))
+RELOAD_DURATION = REGISTRY.register(Histogram(
+    'dashboard_reload_duration_seconds', 'Duração das recargas que interpretaram dados.', ('modo',), RELOAD_BUCKETS,
+))
+RELOAD_ROWS = REGISTRY.register(Histogram(
+    'dashboard_reload_rows', 'Linhas interpretadas por recarga.', ('modo',), ROWS_BUCKETS,
+))
+RELOAD_TRIGGERS = REGISTRY.register(Counter(
+    'dashboard_reload_triggers_total', 'Gatilhos de recarga recebidos por origem (watchdog, polling).', ('origem',),
+))
+RELOAD_COALESCED = REGISTRY.register(Counter(
+    'dashboard_reload_triggers_coalesced_total', 'Gatilhos agrupados em uma recarga já pendente.',
+))
+RELOAD_TRIGGER_WAIT = REGISTRY.register(Histogram(
+    'dashboard_reload_trigger_wait_seconds', 'Espera entre o primeiro gatilho pendente e o início da recarga.',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+))
+SNAPSHOT_AGE = REGISTRY.register(Gauge(
+    'dashboard_snapshot_age_seconds', 'Segundos desde a publicação do snapshot atual.',
+))
+
+# -- ingestão (POST /api/events) ----------------------------------------
+INGEST_ROWS = REGISTRY.register(Counter(
+    'dashboard_ingest_rows_total', 'Linhas recebidas por POST /api/events e gravadas no CSV.',
+))
+INGEST_COMMIT_ROWS = REGISTRY.register(Histogram(
+    'dashboard_ingest_commit_rows', 'Linhas por group commit (lotes concorrentes somados).', buckets=ROWS_BUCKETS,
+))
+INGEST_COMMIT_DURATION = REGISTRY.register(Histogram(
+    'dashboard_ingest_commit_duration_seconds', 'Duração de um group commit (gravação + aplicação em memória).',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+))
+INGEST_QUARANTINED = REGISTRY.register(Counter(
+    'dashboard_ingest_quarantined_lines_total',
+    'Linhas incompletas abandonadas por outro produtor, movidas do CSV para a quarentena.',
+))
+
+# -- HTTP ---------------------------------------------------------------
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'dashboard_http_requests_total', 'Requisições HTTP por rota e status.', ('method', 'route', 'status'),
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    'dashboard_http_request_duration_seconds', 'Latência das requisições HTTP por rota.', ('method', 'route'),
+))
+RESPONSE_CACHE = REGISTRY.register(Counter(
+    'dashboard_response_cache_total', 'Consultas ao cache de respostas serializadas por rota.', ('rota', 'resultado'),
+))
+
+# -- WebSocket ----------------------------------------------------------
+WS_CONNECTIONS = REGISTRY.register(Gauge(
+    'dashboard_ws_connections', 'Conexões WebSocket ativas.',
+))
+WS_BROADCAST_DURATION = REGISTRY.register(Histogram(
+    'dashboard_ws_broadcast_duration_seconds', 'Duração do broadcast (enfileiramento em todos os clientes).',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+))
+WS_DELIVERY_LATENCY = REGISTRY.register(Histogram(
+    'dashboard_ws_delivery_latency_seconds', 'Latência ponta a ponta: escrita no CSV até a entrega ao cliente WS.',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+))
+BUS_HANDOFF = REGISTRY.register(Histogram(
+    'dashboard_bus_handoff_seconds', 'Espera entre a notificação do carregador e o início do broadcast.',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+))
+BUS_CONFLATED = REGISTRY.register(Counter(
+    'dashboard_bus_conflated_total', 'Snapshots substituídos por um mais recente antes do broadcast.',
+))
+WS_ROUTED = REGISTRY.register(Counter(
+    'dashboard_ws_routed_messages_total', 'Mensagens filtradas por assinatura enfileiradas para clientes WS.',
+))
+WS_SUBSCRIBED_PRODUCTS = REGISTRY.register(Gauge(
+    'dashboard_ws_subscribed_products', 'Produtos distintos com ao menos um assinante no /ws.',
+))
+WS_DROPPED = REGISTRY.register(Counter(
+    'dashboard_ws_clients_dropped_total', 'Clientes WebSocket desconectados pelo servidor.', ('motivo',),
+))
+LOG_DISCARDED = REGISTRY.register(Counter(
+    'dashboard_log_records_discarded_total', 'Registros de log descartados (amostragem ou fila cheia).', ('motivo',),
+))
+
+
+__all__ = [
+    "Counter", "Gauge", "Histogram", "Registry", "REGISTRY", "CONTENT_TYPE",
+    "RELOADS", "RELOAD_DURATION", "RELOAD_ROWS", "RELOAD_TRIGGERS", "RELOAD_COALESCED", "RELOAD_TRIGGER_WAIT",
+    "SNAPSHOT_AGE", "INGEST_ROWS", "INGEST_COMMIT_ROWS", "INGEST_COMMIT_DURATION", "INGEST_QUARANTINED",
+    "HTTP_REQUESTS", "HTTP_LATENCY", "RESPONSE_CACHE", "WS_CONNECTIONS", "WS_BROADCAST_DURATION", "WS_DROPPED",
+    "WS_DELIVERY_LATENCY", "WS_ROUTED", "WS_SUBSCRIBED_PRODUCTS", "BUS_HANDOFF", "BUS_CONFLATED",
+    "LOG_DISCARDED",
+]
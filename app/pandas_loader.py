@@ -0,0 +1,201 @@
+"""Carga completa do CSV com pandas: tipada e, em arquivos grandes, em blocos.
+
+``read_csv`` recebe o esquema (``CsvSchema``) em vez de inferir os tipos:
+
+- só as colunas usadas (``usecols``);
+- ``produto`` e ``timestamp`` como ``category``: cada texto distinto vira um
+  único objeto Python e os timestamps são convertidos uma vez por valor
+  distinto, com o formato explícito (ISO 8601 só para os que não casam);
+- contagens lidas em int64 e reduzidas a ``int_dtype`` (int32 por padrão) só
+  depois de conferir o intervalo: o ``read_csv`` com um tipo estreito trunca
+  valores grandes em silêncio (3000000000 vira -1294967296 em int32).
+
+Arquivos a partir de ``chunk_threshold`` bytes são lidos direto do disco em
+blocos de ``chunk_rows`` linhas; cada bloco é acumulado nos agregados e
+rollups antes do próximo, então o pico de memória acompanha o bloco, não o
+arquivo.
+
+Células que o esquema não aceita (vazias, ``5.0``, texto) ou contagens fora
+do intervalo de ``int_dtype`` fazem a leitura tipada falhar com
+``ValueError``; com ``robust=True`` as contagens são lidas
+como texto e passam pelas regras de ``chunk_from_columns``, as mesmas do
+leitor stdlib (contagem fora de int64 vale 0, como célula inválida). Importado só na primeira carga completa (ver app.data_loader).
+"""
+import io
+from array import array
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.aggregates import Aggregates
+from app.csv_columns import CHUNK_ROWS, COLUMNS, Chunk, CsvSchema, chunk_from_columns
+from app.history import HistoryBuffer
+from app.rollups import TimeRollups
+
+_INT_COLUMNS = ('vendas', 'estoque')
+_EPOCH = pd.Timestamp(0, tz='UTC')
+
+
+class _BoundedReader(io.RawIOBase):
+    """Lê ``f`` só até o byte ``end`` (uma linha ainda sendo escrita fica de fora)."""
+
+    def __init__(self, f, end: int):
+        self._f = f
+        self._remaining = end - f.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        n = self._f.readinto(memoryview(buffer)[:self._remaining])
+        self._remaining -= n
+        return n
+
+
+def fold_csv(
+    source,
+    header: Sequence[str],
+    schema: CsvSchema,
+    agg: Aggregates,
+    history: Optional[HistoryBuffer],
+    rollups: TimeRollups,
+    sinks=(),
+    robust: bool = False,
+) -> int:
+    """Acumula o CSV em ``agg``, ``history``, ``rollups`` e ``sinks``. Retorna as linhas lidas.
+
+    ``source`` são os bytes do arquivo (linhas completas, com cabeçalho) ou
+    ``(arquivo, fim)``: o CSV aberto em modo binário, lido do início em
+    blocos até o byte ``fim``.
+    """
+    def chunks() -> Iterator[Chunk]:
+        for frame in _read(source, header, schema, robust):
+            size = len(frame)
+            if not size:
+                continue
+            chunk = _to_chunk(frame, size, robust)
+            _fold_rollups(frame, chunk, schema.timestamp_format, rollups)
+            yield from _slices(chunk, size)
+
+    # Um único fold para o arquivo todo: o histórico fica com as últimas linhas do arquivo, não de cada bloco
+    return agg.fold(chunks(), history, sinks)
+
+
+def _read(source, header: Sequence[str], schema: CsvSchema, robust: bool) -> Iterator[pd.DataFrame]:
+    present = [c for c in COLUMNS if c in header]
+    if not present:
+        raise ValueError("nenhuma coluna conhecida no cabeçalho")
+    dtype = {c: 'category' for c in ('timestamp', 'produto') if c in present}
+    dtype.update({c: str if robust else 'int64' for c in _INT_COLUMNS if c in present})
+    options = dict(usecols=present, dtype=dtype, na_filter=False)
+    for frame in _frames(source, schema.chunk_rows, options):
+        yield frame if robust else _narrow(frame, schema.int_dtype)
+
+
+def _frames(source, chunk_rows: int, options) -> Iterator[pd.DataFrame]:
+    if isinstance(source, (bytes, bytearray)):
+        yield pd.read_csv(io.BytesIO(source), **options)
+        return
+    f, end = source
+    f.seek(0)
+    stream = io.BufferedReader(_BoundedReader(f, end), buffer_size=1 << 20)
+    with pd.read_csv(stream, chunksize=chunk_rows, **options) as reader:
+        yield from reader
+
+
+def _narrow(frame: pd.DataFrame, int_dtype: str) -> pd.DataFrame:
+    """Reduz as contagens a ``int_dtype``; ``ValueError`` se algum valor não couber."""
+    info = np.iinfo(int_dtype)
+    for name in _INT_COLUMNS:
+        if name not in frame or frame.empty:
+            continue
+        column = frame[name]
+        low, high = column.min(), column.max()
+        if low < info.min or high > info.max:
+            raise ValueError(f"{name} fora do intervalo de {int_dtype}: [{low}, {high}]")
+        frame[name] = column.astype(int_dtype)
+    return frame
+
+
+def _to_chunk(frame: pd.DataFrame, size: int, robust: bool) -> Chunk:
+    columns = {}
+    for name in COLUMNS:
+        if name not in frame:
+            columns[name] = None
+        elif name in _INT_COLUMNS and not robust:
+            columns[name] = array('q', frame[name].to_numpy(dtype='int64').tobytes())
+        else:
+            # Categorias: as linhas compartilham o mesmo objeto str de cada valor distinto
+            columns[name] = frame[name].tolist()
+    return chunk_from_columns(size, *(columns[n] for n in COLUMNS))
+
+
+def _slices(chunk: Chunk, size: int) -> Iterator[Chunk]:
+    # Mesmo tamanho de bloco do leitor stdlib para os sinks
+    if size <= CHUNK_ROWS:
+        yield chunk
+        return
+    for i in range(0, size, CHUNK_ROWS):
+        yield tuple(column[i:i + CHUNK_ROWS] for column in chunk)
+
+
+def _epochs(values: pd.Index, timestamp_format: str) -> np.ndarray:
+    """Epoch (segundos, float com NaN para inválidos) de cada timestamp distinto."""
+    parsed = pd.to_datetime(values, format=timestamp_format, errors='coerce', utc=True)
+    bad = parsed.isna() & (values != '')
+    if bad.any():
+        # Fora do formato esperado (segundos, fuso explícito...): ISO 8601, como o leitor stdlib
+        fallback = pd.to_datetime(values.where(bad, ''), format='ISO8601', errors='coerce', utc=True)
+        parsed = parsed.where(~bad, fallback)
+    return ((parsed - _EPOCH) // pd.Timedelta(seconds=1)).to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _fold_rollups(frame: pd.DataFrame, chunk: Chunk, timestamp_format: str, rollups: TimeRollups):
+    """Soma o bloco nos rollups com groupby sobre os códigos das categorias."""
+    if 'timestamp' not in frame:
+        return
+    ts = frame['timestamp'].cat
+    ts_names: List[str] = list(ts.categories)
+    ts_codes = ts.codes.to_numpy()
+    epochs = _epochs(pd.Index(ts_names, dtype=object), timestamp_format)
+    epoch = np.where(ts_codes >= 0, epochs[ts_codes], np.nan)
+    valid = ~np.isnan(epoch)
+    if not valid.any():
+        return
+    if 'produto' in frame:
+        produto = frame['produto'].cat
+        names = [p or 'N/A' for p in produto.categories]
+        codes = produto.codes.to_numpy()
+    else:
+        names, codes = ['N/A'], np.zeros(len(frame), dtype=np.int8)
+    _, _, vendas, estoque = chunk
+    df = pd.DataFrame({
+        'p': codes[valid],
+        't': ts_codes[valid],
+        'epoch': epoch[valid].astype(np.int64),
+        'vendas': np.frombuffer(vendas, dtype=np.int64)[valid],
+        'estoque': np.frombuffer(estoque, dtype=np.int64)[valid],
+    })
+    # Ordenado por tempo, 'last' devolve o estoque e o timestamp mais recentes de cada bucket
+    df = df.sort_values('epoch', kind='stable')
+    for res, size in rollups.resolutions.items():
+        df['bucket'] = df['epoch'] // size * size
+        grouped = df.groupby(['p', 'bucket'], sort=True).agg(
+            vendas=('vendas', 'sum'), estoque=('estoque', 'last'), t=('t', 'last')
+        )
+        # Só os buckets mais recentes de cada produto sobrevivem à retenção: os demais nem entram
+        grouped = grouped.groupby(level='p', sort=False).tail(rollups.retention[res])
+        rollups.load_buckets(res, (
+            (names[p], bucket, v, e, ts_names[t])
+            for p, bucket, v, e, t in zip(
+                grouped.index.get_level_values('p').tolist(),
+                grouped.index.get_level_values('bucket').tolist(),
+                grouped['vendas'].tolist(), grouped['estoque'].tolist(), grouped['t'].tolist(),
+            )
+        ))
+
+
+__all__ = ["fold_csv"]
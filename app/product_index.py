@@ -0,0 +1,327 @@
+"""Índice em memória do catálogo: produtos ordenados por nome, vendas e estoque.
+
+Com dezenas de milhares de SKUs o snapshot não leva mais os mapas completos,
+apenas os N mais vendidos e os N de menor estoque (``top``); o catálogo
+inteiro é servido paginado por ``/api/produtos`` (``page``).
+
+As ordens ficam em ``SortedKeys``, listas ordenadas em blocos de até
+``2 * LOAD`` chaves: inserir ou remover custa O(log n + LOAD) em vez de
+deslocar a lista inteira. Como sink de ``Aggregates.fold`` o índice anota
+os produtos tocados e ``refresh`` reposiciona só esses; se muitos mudaram de
+uma vez (carga completa), tudo é reordenado do zero. Top-K lê a ponta de uma
+ordem e uma página percorre a partir do cursor (paginação por chave), sem
+copiar o catálogo.
+"""
+import base64
+import binascii
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice, takewhile
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+ORDERS = ('produto', 'vendas', 'estoque')
+# Chaves por bloco do SortedKeys (blocos passam de 2 * LOAD são divididos)
+LOAD = 512
+# Acima desta fração das chaves alterada de uma vez, reordenar tudo sai mais barato
+# (medido com 50k chaves: ~2,5 ms por 1% incremental contra ~45 ms para reordenar)
+RESORT_FRACTION = 0.2
+_PREFIX_END = '\U0010ffff'
+
+
+class SortedKeys:
+    """Lista ordenada de chaves únicas, em blocos."""
+
+    def __init__(self, keys: Iterable = ()):
+        self.reset(sorted(keys))
+
+    def reset(self, ordered: List):
+        """Substitui o conteúdo por ``ordered`` (já ordenada)."""
+        self._blocks = [ordered[i:i + LOAD] for i in range(0, len(ordered), LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(ordered)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key):
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            blocks.append([key])
+            maxes.append(key)
+            self._len = 1
+            return
+        i = min(bisect_left(maxes, key), len(maxes) - 1)
+        block = blocks[i]
+        insort(block, key)
+        maxes[i] = block[-1]
+        self._len += 1
+        if len(block) > 2 * LOAD:
+            blocks[i:i + 1] = [block[:LOAD], block[LOAD:]]
+            maxes[i:i + 1] = [blocks[i][-1], blocks[i + 1][-1]]
+
+    def discard(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if block[j] != key:
+            return
+        del block[j]
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def rank(self, key) -> int:
+        """Quantas chaves são menores que ``key``."""
+        i = bisect_left(self._maxes, key)
+        before = sum(len(block) for block in self._blocks[:i])
+        return before + (bisect_left(self._blocks[i], key) if i < len(self._blocks) else 0)
+
+    def iter_from(self, key=None, desc: bool = False, inclusive: bool = False) -> Iterator:
+        """Chaves a partir de ``key`` (exclusive, salvo ``inclusive``), em ordem crescente ou decrescente."""
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            return
+        if not desc:
+            i, j = 0, 0
+            if key is not None:
+                i = (bisect_left if inclusive else bisect_right)(maxes, key)
+                if i == len(blocks):
+                    return
+                j = (bisect_left if inclusive else bisect_right)(blocks[i], key)
+            yield from blocks[i][j:]
+            for block in blocks[i + 1:]:
+                yield from block
+        else:
+            i, j = len(blocks) - 1, len(blocks[-1])
+            if key is not None:
+                i = bisect_left(maxes, key)
+                if i == len(blocks):
+                    i, j = len(blocks) - 1, len(blocks[-1])
+                else:
+                    j = (bisect_right if inclusive else bisect_left)(blocks[i], key)
+            yield from reversed(blocks[i][:j])
+            for block in reversed(blocks[:i]):
+                yield from reversed(block)
+
+
+class Ranking:
+    """Chaves ordenadas por valor (``(valor, chave)`` em um SortedKeys), atualizadas em lote."""
+
+    def __init__(self):
+        self.values: Dict[Hashable, int] = {}
+        self.order = SortedKeys()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def replace(self, values: Dict[Hashable, int]):
+        self.values = dict(values)
+        self.order.reset(sorted((v, k) for k, v in self.values.items()))
+
+    def update(self, changes: Mapping[Hashable, Optional[int]]):
+        """Aplica ``{chave: valor}``; valor ``None`` remove a chave."""
+        values, order = self.values, self.order
+        if len(changes) > RESORT_FRACTION * len(values):
+            for key, value in changes.items():
+                if value is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = value
+            order.reset(sorted((v, k) for k, v in values.items()))
+            return
+        for key, value in changes.items():
+            old = values.get(key)
+            if old == value:
+                continue
+            if old is not None:
+                order.discard((old, key))
+            if value is None:
+                del values[key]
+            else:
+                values[key] = value
+                order.add((value, key))
+
+    def top(self, n: int, desc: bool = False) -> List[Tuple[Hashable, int]]:
+        """Os ``n`` primeiros (chave, valor): menores valores, ou maiores com ``desc``."""
+        return [(key, value) for value, key in islice(self.order.iter_from(desc=desc), n)]
+
+
+def encode_cursor(ordem: str, desc: bool, key) -> str:
+    raw = json.dumps([ordem, desc, key], separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, ordem: str, desc: bool):
+    """Chave do último item da página anterior. ``ValueError`` se inválido ou de outra ordenação."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        c_ordem, c_desc, key = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("cursor inválido") from None
+    if c_ordem != ordem or c_desc != desc:
+        raise ValueError("cursor de outra ordenação")
+    if ordem == 'produto':
+        if not isinstance(key, str):
+            raise ValueError("cursor inválido")
+        return key
+    if not (isinstance(key, list) and len(key) == 2 and isinstance(key[0], int) and isinstance(key[1], str)):
+        raise ValueError("cursor inválido")
+    return tuple(key)
+
+
+class ProductIndex:
+    def __init__(self):
+        self._names = SortedKeys()
+        self._vendas = Ranking()
+        self._estoque = Ranking()
+        self._lock = threading.Lock()
+        self._dirty: set = set()
+        self._full = True  # próximo refresh reconstrói tudo
+        # Produtos alterados desde o último drain_changes (para o carregador compartilhado)
+        self._changes: set = set()
+        self._changes_full = True
+
+    def __len__(self) -> int:
+        return len(self._vendas)
+
+    def extend(self, rows: Iterable[Tuple[str, str, int, int]]):
+        """Sink de linhas (ver Aggregates.fold): só anota quais produtos mudaram."""
+        with self._lock:
+            self._dirty.update(row[1] for row in rows)
+
+    def touch(self, produtos: Iterable[str]):
+        """Anota produtos alterados sem passar linhas (ex: parciais do modo diretório)."""
+        with self._lock:
+            self._dirty.update(produtos)
+
+    def invalidate(self):
+        """Agregados recriados (carga completa, cache, diretório): o próximo refresh relê tudo."""
+        with self._lock:
+            self._full = True
+            self._dirty.clear()
+
+    def refresh(self, vendas_por_produto: Mapping[str, int], estoque_por_produto: Mapping[str, int]):
+        """Aplica aos índices os valores atuais dos produtos anotados desde o último refresh."""
+        with self._lock:
+            if self._full:
+                produtos: Iterable[str] = estoque_por_produto.keys() | vendas_por_produto.keys()
+            else:
+                produtos = self._dirty
+            updates = {p: (vendas_por_produto.get(p, 0), estoque_por_produto.get(p, 0)) for p in produtos}
+            self._apply(updates, replace=self._full)
+            self._full = False
+            self._dirty = set()
+
+    def _apply(self, updates: Dict[str, Tuple[int, int]], replace: bool):
+        if replace:
+            self._names.reset(sorted(updates))
+            self._vendas.replace({p: v for p, (v, _) in updates.items()})
+            self._estoque.replace({p: e for p, (_, e) in updates.items()})
+            self._changes.clear()
+            self._changes_full = True
+            return
+        vendas, estoque = self._vendas.values, self._estoque.values
+        updates = {p: v for p, v in updates.items() if (vendas.get(p), estoque.get(p)) != v}
+        if not updates:
+            return
+        if not self._changes_full:
+            self._changes.update(updates)
+        for produto in updates:
+            if produto not in vendas:
+                self._names.add(produto)
+        self._vendas.update({p: v for p, (v, _) in updates.items()})
+        self._estoque.update({p: e for p, (_, e) in updates.items()})
+
+    def top(self, ordem: str, n: int, desc: bool = False) -> List[Tuple[str, int]]:
+        """Os ``n`` primeiros (produto, valor) em ``ordem`` 'vendas' ou 'estoque'."""
+        with self._lock:
+            return (self._vendas if ordem == 'vendas' else self._estoque).top(n, desc)
+
+    def page(
+        self,
+        ordem: str = 'produto',
+        desc: bool = False,
+        prefixo: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """Página de produtos: ``{'itens', 'total', 'proximo'}``.
+
+        ``total`` conta os produtos que casam com ``prefixo``; ``proximo`` é o
+        cursor da página seguinte (None na última). Com ``prefixo`` e ordem por
+        valor, só a faixa de nomes do prefixo é ordenada.
+        """
+        if ordem not in ORDERS:
+            raise ValueError(f"ordem inválida: {ordem}")
+        after = decode_cursor(cursor, ordem, desc) if cursor else None
+        with self._lock:
+            vendas, estoque = self._vendas.values, self._estoque.values
+            start, inclusive = after, False
+            if prefixo:
+                total = self._names.rank(prefixo + _PREFIX_END) - self._names.rank(prefixo)
+                if ordem == 'produto':
+                    keys = self._names
+                    if after is None:
+                        start, inclusive = (prefixo + _PREFIX_END, False) if desc else (prefixo, True)
+                else:
+                    values = vendas if ordem == 'vendas' else estoque
+                    names = takewhile(lambda p: p.startswith(prefixo), self._names.iter_from(prefixo, inclusive=True))
+                    keys = SortedKeys((values[p], p) for p in names)
+            else:
+                total = len(self._names)
+                keys = {'produto': self._names, 'vendas': self._vendas.order, 'estoque': self._estoque.order}[ordem]
+            selected = keys.iter_from(start, desc, inclusive)
+            if prefixo and ordem == 'produto':
+                selected = takewhile(lambda p: p.startswith(prefixo), selected)
+            selected = list(islice(selected, limit + 1))
+            more = len(selected) > limit
+            selected = selected[:limit]
+            names = selected if ordem == 'produto' else [p for _, p in selected]
+            itens = [{'produto': p, 'vendas': vendas[p], 'estoque': estoque[p]} for p in names]
+        last = selected[-1] if selected else None
+        return {
+            'itens': itens,
+            'total': total,
+            'proximo': encode_cursor(ordem, desc, last if ordem == 'produto' else list(last)) if more else None,
+        }
+
+    def lookup(self, produtos: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """Valores atuais (``{'vendas', 'estoque'}``) dos produtos conhecidos entre ``produtos``."""
+        with self._lock:
+            vendas, estoque = self._vendas.values, self._estoque.values
+            return {p: {'vendas': vendas[p], 'estoque': estoque[p]} for p in produtos if p in vendas}
+
+    def to_state(self) -> Dict[str, List[int]]:
+        with self._lock:
+            estoque = self._estoque.values
+            return {p: [v, estoque[p]] for p, v in self._vendas.values.items()}
+
+    def drain_changes(self) -> Optional[Dict[str, List[int]]]:
+        """Produtos alterados desde a última chamada, no formato de ``to_state``.
+
+        Retorna ``None`` se o índice foi reconstruído e é preciso enviar o estado completo.
+        """
+        with self._lock:
+            if self._changes_full:
+                self._changes_full = False
+                self._changes.clear()
+                return None
+            vendas, estoque = self._vendas.values, self._estoque.values
+            changes = {p: [vendas[p], estoque[p]] for p in self._changes if p in vendas}
+            self._changes.clear()
+            return changes
+
+    def apply_state(self, state: Dict[str, List[int]], replace: bool = False):
+        """Aplica estado (completo ou alterações) exportado por outra instância."""
+        with self._lock:
+            self._apply({p: (v, e) for p, (v, e) in state.items()}, replace)
+            self._full = False
+
+
+__all__ = ["ProductIndex", "Ranking", "SortedKeys", "ORDERS", "encode_cursor", "decode_cursor"]
@@ -0,0 +1,112 @@
+"""Agendador de recargas do CSV: single-flight, com debounce e staleness máximo.
+
+Watchdog e polling apenas chamam ``trigger``; uma única thread executa as
+recargas, então nunca há duas em paralelo. Gatilhos que chegam dentro da
+janela de ``debounce`` (ou durante uma recarga em andamento) são agrupados
+em uma só execução, mas nenhum espera mais que ``max_staleness`` segundos a
+partir do primeiro gatilho pendente — uma rajada contínua de appends não
+adia a recarga indefinidamente.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ReloadScheduler:
+    def __init__(self, load: Callable[[], None], debounce: float = 0.05, max_staleness: float = 2.0):
+        self._load = load
+        self.debounce = max(0.0, debounce)
+        self.max_staleness = max(self.debounce, max_staleness)
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first: Optional[float] = None  # monotonic do primeiro gatilho pendente
+        self._last: Optional[float] = None
+        self._running = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.triggers = 0
+        self.coalesced = 0
+        self.reloads = 0
+
+    def start(self):
+        with self._cond:
+            self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='csv-reload', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self, origem: str = 'watchdog'):
+        now = time.monotonic()
+        with self._cond:
+            self.triggers += 1
+            coalesced = self._pending > 0
+            if coalesced:
+                self.coalesced += 1
+            else:
+                self._first = now
+            self._pending += 1
+            self._last = now
+            self._cond.notify_all()
+        metrics.RELOAD_TRIGGERS.inc(origem=origem)
+        if coalesced:
+            metrics.RELOAD_COALESCED.inc()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até não haver gatilho pendente nem recarga em andamento."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'gatilhos': self.triggers,
+                'agrupados': self.coalesced,
+                'recargas': self.reloads,
+                'pendentes': self._pending,
+                'em_andamento': self._running,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._pending)
+                # Espera a rajada acalmar, limitado pelo staleness máximo
+                while not self._stopped:
+                    now = time.monotonic()
+                    deadline = min(self._last + self.debounce, self._first + self.max_staleness)
+                    if now >= deadline:
+                        break
+                    self._cond.wait(deadline - now)
+                if self._stopped:
+                    return
+                batch = self._pending
+                waited = now - self._first
+                self._pending = 0
+                self._first = self._last = None
+                self._running = True
+            metrics.RELOAD_TRIGGER_WAIT.observe(waited)
+            try:
+                self._load()
+            except Exception:
+                logger.exception("reload_failed")
+            finally:
+                with self._cond:
+                    self._running = False
+                    self.reloads += 1
+                    self._cond.notify_all()
+            if batch > 1:
+                logger.debug("reload_coalesced", extra={"gatilhos": batch, "espera_ms": round(waited * 1000, 2)})
+
+
+__all__ = ["ReloadScheduler"]
@@ -0,0 +1,249 @@
+"""Rollups por produto em várias resoluções (ex: 1m, 5m, 1h).
+
+Cada linha ingerida soma ``vendas`` no bucket correspondente de cada
+resolução e guarda o último ``estoque`` visto nele. As chaves de cada série
+ficam em lista ordenada, então consultas por intervalo custam
+O(log n + buckets retornados) independentemente de quantas linhas existam.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600}
+# Buckets mantidos por produto: 7 dias em 1m, 30 dias em 5m, 1 ano em 1h
+RETENTION = {'1m': 7 * 1440, '5m': 30 * 288, '1h': 365 * 24}
+# Acima disso, alterações pendentes viram "precisa de estado completo"
+MAX_PENDING_CHANGES = 50_000
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(ts: str) -> Optional[float]:
+    """Converte timestamp ISO 8601 em epoch (segundos). Sem fuso = UTC."""
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def format_bucket(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).replace(tzinfo=None).isoformat(timespec='minutes')
+
+
+class _Series:
+    __slots__ = ('keys', 'values')
+
+    def __init__(self):
+        self.keys: List[int] = []
+        self.values: Dict[int, list] = {}  # bucket -> [vendas, estoque, ts do estoque]
+
+
+class TimeRollups:
+    def __init__(self, resolutions: Optional[Dict[str, int]] = None, retention: Optional[Dict[str, int]] = None):
+        self.resolutions = dict(resolutions or RESOLUTIONS)
+        self.retention = {res: (retention or RETENTION).get(res, 10_000) for res in self.resolutions}
+        self._series: Dict[str, Dict[str, _Series]] = {res: {} for res in self.resolutions}
+        self._lock = threading.Lock()
+        # Buckets alterados por consumidor de drain_changes (None = excesso, pede estado completo).
+        # O consumidor padrão ('') é rastreado desde a criação; os outros, desde o primeiro drain
+        self._changes: Dict[str, Optional[set]] = {'': set()}
+
+    def extend(self, rows: Iterable[Tuple[str, str, int, int]]):
+        with self._lock:
+            for ts, produto, vendas, estoque in rows:
+                epoch = parse_timestamp(ts)
+                if epoch is None:
+                    continue
+                for res, size in self.resolutions.items():
+                    bucket = int(epoch) // size * size
+                    self._add(res, produto, bucket, vendas, estoque, ts)
+
+    def load_buckets(self, res: str, buckets: Iterable[Tuple[str, int, int, int, str]]):
+        """Soma buckets já agregados (produto, bucket, vendas, estoque, ts) — usado pelo caminho pandas."""
+        with self._lock:
+            for produto, bucket, vendas, estoque, ts in buckets:
+                self._add(res, produto, int(bucket), int(vendas), int(estoque), ts)
+
+    def _add(self, res: str, produto: str, bucket: int, vendas: int, estoque: int, ts: str):
+        series = self._series[res].get(produto)
+        if series is None:
+            series = self._series[res][produto] = _Series()
+        cell = series.values.get(bucket)
+        if cell is None:
+            series.values[bucket] = [vendas, estoque, ts]
+            if not series.keys or bucket > series.keys[-1]:
+                series.keys.append(bucket)
+            else:
+                insort(series.keys, bucket)
+            self._trim(res, series)
+        else:
+            cell[0] += vendas
+            if ts >= cell[2]:
+                cell[1] = estoque
+                cell[2] = ts
+        self._track(res, produto, bucket)
+
+    def _trim(self, res: str, series: _Series):
+        limit = self.retention[res]
+        # Remove em lotes para amortizar o custo de apagar do início da lista
+        if len(series.keys) > limit + max(1, limit // 10):
+            drop = series.keys[:len(series.keys) - limit]
+            del series.keys[:len(drop)]
+            for k in drop:
+                del series.values[k]
+
+    def _track(self, res: str, produto: str, bucket: int):
+        key = (res, produto, bucket)
+        for consumer, changes in self._changes.items():
+            if changes is None:
+                continue
+            changes.add(key)
+            if len(changes) > MAX_PENDING_CHANGES:
+                self._changes[consumer] = None
+
+    def _overflow(self):
+        for consumer in self._changes:
+            self._changes[consumer] = None
+
+    def series(
+        self,
+        res: str,
+        produtos: Optional[List[str]] = None,
+        inicio: Optional[float] = None,
+        fim: Optional[float] = None,
+        limit: Optional[int] = None,
+        max_points: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Buckets de ``res`` no intervalo [inicio, fim] (epoch), em ordem de tempo.
+
+        ``limit`` restringe aos últimos N buckets de cada produto;
+        ``max_points`` aos N pontos mais recentes da resposta inteira.
+        """
+        out = []
+        with self._lock:
+            by_product = self._series[res]
+            for produto in (produtos if produtos is not None else sorted(by_product)):
+                series = by_product.get(produto)
+                if series is None:
+                    continue
+                lo = bisect_left(series.keys, inicio) if inicio is not None else 0
+                hi = bisect_right(series.keys, fim) if fim is not None else len(series.keys)
+                if limit is not None:
+                    lo = max(lo, hi - limit)
+                for bucket in series.keys[lo:hi]:
+                    vendas, estoque, _ = series.values[bucket]
+                    out.append({'timestamp': bucket, 'produto': produto, 'vendas': vendas, 'estoque': estoque})
+        out.sort(key=lambda r: r['timestamp'])
+        if max_points is not None and len(out) > max_points:
+            out = out[len(out) - max_points:]
+        for r in out:
+            r['timestamp'] = format_bucket(r['timestamp'])
+        return out
+
+    def recent_buckets(self, res: str, span: int) -> List[Tuple[int, str, int]]:
+        """(bucket, produto, vendas) de ``res`` até ``span`` segundos antes do bucket mais recente."""
+        with self._lock:
+            by_product = self._series[res]
+            latest = max((s.keys[-1] for s in by_product.values() if s.keys), default=None)
+            if latest is None:
+                return []
+            out = []
+            for produto, series in by_product.items():
+                for bucket in series.keys[bisect_left(series.keys, latest - span):]:
+                    out.append((bucket, produto, series.values[bucket][0]))
+            return out
+
+    def cell(self, res: str, produto: str, bucket: int) -> Optional[list]:
+        """Cópia de ``[vendas, estoque, ts]`` de um bucket, ou None."""
+        with self._lock:
+            series = self._series[res].get(produto)
+            cell = series.values.get(bucket) if series is not None else None
+            return list(cell) if cell is not None else None
+
+    def set_buckets(self, res: str, cells: Dict[Tuple[str, int], Optional[list]]):
+        """Substitui buckets ``(produto, bucket)`` de ``res``; ``None`` remove o bucket.
+
+        Só os buckets passados entram em ``drain_changes``. Remoções não cabem
+        em alterações: a próxima chamada pede o estado completo.
+        """
+        with self._lock:
+            for (produto, bucket), cell in cells.items():
+                series = self._series[res].get(produto)
+                if cell is None:
+                    if series is not None and series.values.pop(bucket, None) is not None:
+                        del series.keys[bisect_left(series.keys, bucket)]
+                        self._overflow()
+                    continue
+                if series is None:
+                    series = self._series[res][produto] = _Series()
+                novo = bucket not in series.values
+                series.values[bucket] = list(cell)
+                if novo:
+                    insort(series.keys, bucket)
+                    self._trim(res, series)
+                self._track(res, produto, bucket)
+
+    def to_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                res: {p: [[k, *s.values[k]] for k in s.keys] for p, s in by_product.items()}
+                for res, by_product in self._series.items()
+            }
+
+    def drain_changes(self, consumer: str = '') -> Optional[Dict[str, Any]]:
+        """Buckets alterados desde a última chamada de ``consumer``, no formato de ``to_state``.
+
+        Retorna ``None`` se houve alterações demais (ou é a primeira chamada de
+        um consumidor além do padrão) e é preciso enviar o estado completo.
+        """
+        with self._lock:
+            pending = self._changes.get(consumer)
+            self._changes[consumer] = set()
+            if pending is None:
+                return None
+            changes: Dict[str, Dict[str, list]] = {}
+            for res, produto, bucket in pending:
+                cell = self._series[res].get(produto, _Series()).values.get(bucket)
+                if cell is not None:
+                    changes.setdefault(res, {}).setdefault(produto, []).append([bucket, *cell])
+            return changes
+
+    def merge_state(self, state: Dict[str, Any]):
+        """Soma o estado de outra instância (ex: parcial de outro arquivo)."""
+        with self._lock:
+            for res, by_product in state.items():
+                if res not in self._series:
+                    continue
+                for produto, cells in by_product.items():
+                    for bucket, vendas, estoque, ts in cells:
+                        self._add(res, produto, bucket, vendas, estoque, ts)
+
+    def apply_state(self, state: Dict[str, Any], replace: bool = False):
+        """Aplica estado (completo ou alterações) exportado por outra instância."""
+        with self._lock:
+            if replace:
+                self._series = {res: {} for res in self.resolutions}
+            for res, by_product in state.items():
+                if res not in self._series:
+                    continue
+                for produto, cells in by_product.items():
+                    series = self._series[res].get(produto)
+                    if series is None:
+                        series = self._series[res][produto] = _Series()
+                    for bucket, vendas, estoque, ts in cells:
+                        if bucket not in series.values:
+                            insort(series.keys, bucket)
+                        series.values[bucket] = [vendas, estoque, ts]
+                    self._trim(res, series)
+            for consumer, pending in self._changes.items():
+                if pending is not None:
+                    pending.clear()
+
+
+__all__ = ["TimeRollups", "RESOLUTIONS", "parse_timestamp"]
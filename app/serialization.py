@@ -0,0 +1,63 @@
+"""Serialização JSON única para REST (``/api/*``) e WebSocket.
+
+Usa ``orjson`` quando instalado (numpy e datetime nativos); senão o ``json``
+da stdlib com o mesmo ``default``. Escalares numpy/pandas e datetimes viram
+tipos nativos durante a codificação, sem uma passada prévia pelo objeto.
+A saída é compacta e em UTF-8, como a do ``JSONResponse`` do Starlette.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson  # type: ignore
+except Exception:  # orjson opcional
+    orjson = None  # type: ignore
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _default(obj: Any) -> Any:
+    if hasattr(obj, 'isoformat'):  # datetime/date/pd.Timestamp
+        return obj.isoformat()
+    if hasattr(obj, 'item'):  # escalar numpy
+        return obj.item()
+    if hasattr(obj, 'tolist'):  # ndarray
+        return obj.tolist()
+    raise TypeError(f'Tipo não serializável em JSON: {type(obj).__name__}')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(
+        ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default,
+    )
+
+    def dumps(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+def dumps_text(obj: Any) -> str:
+    """Para frames de texto do WebSocket."""
+    return dumps(obj).decode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """``JSONResponse`` codificado por :func:`dumps`."""
+
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+__all__ = ["BACKEND", "dumps", "dumps_text", "loads", "FastJSONResponse"]
@@ -0,0 +1,369 @@
+"""Snapshot compartilhado entre vários workers uvicorn.
+
+Um único processo carregador (``python -m app.shared_snapshot``) roda o
+DataManager (polling + watchdog + parsing do CSV) e publica cada novo
+snapshot, junto com o histórico recente, por um socket local. Os workers
+HTTP/WS usam ``SharedDataManager``, que apenas se conecta e lê: nenhum deles
+abre o CSV.
+
+Uso::
+
+    python -m app.shared_snapshot --csv app/sample_data.csv --socket /tmp/dashboard.sock
+    SNAPSHOT_SOCKET=/tmp/dashboard.sock uvicorn app.main:app --workers 4
+
+``--socket`` aceita um caminho de Unix socket ou ``tcp://host:porta`` (para
+plataformas sem AF_UNIX). ``--metrics-port`` expõe as métricas de recarga do
+CSV do carregador (os workers expõem as suas em ``/metrics``).
+
+Protocolo: frames com 4 bytes de tamanho (big-endian) seguidos de JSON
+``{"snapshot": {...}, "historico": {"seq": n, "linhas": [...]}, "historico_completo": bool,
+"rollups": {...}, "rollups_completo": bool, "produtos": {...}, "produtos_completo": bool}``.
+Ao conectar, o worker recebe o estado atual; depois, um frame por snapshot
+publicado, com apenas as linhas novas do histórico, os buckets de rollup e os
+produtos do catálogo (``/api/produtos``) alterados desde o anterior. O frame
+inicial é montado e enviado sob o mesmo lock do ``publish``: nenhuma
+alteração drenada entre os dois deixa de chegar ao worker novo.
+"""
+import argparse
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app import serialization
+from app.history import HistoryBuffer
+from app.product_index import ProductIndex
+from app.rollups import TimeRollups
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I')
+
+
+def _open_socket(spec: str):
+    """Retorna (família, endereço) a partir de um caminho ou ``tcp://host:porta``."""
+    if spec.startswith('tcp://'):
+        host, _, port = spec[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, spec
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class SnapshotPublisher:
+    """Publica os snapshots de um DataManager para workers conectados."""
+
+    def __init__(self, data_manager, socket_spec: str, send_timeout: float = 2.0):
+        self.data_manager = data_manager
+        self.socket_spec = socket_spec
+        self.send_timeout = send_timeout
+        self._clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        self._stop_event = threading.Event()
+        # Objeto (rollups/produtos/histórico) cujas alterações o último publish drenou
+        self._sources: Dict[str, Any] = {}
+
+    def start(self):
+        family, address = _open_socket(self.socket_spec)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        self.data_manager.subscribe(lambda snapshot: self.publish())
+        logger.info("snapshot_publisher_started", extra={"socket": self.socket_spec})
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.close()
+        with self._lock:
+            for c in self._clients:
+                c.close()
+            self._clients.clear()
+
+    def _parts(self):
+        dm = self.data_manager
+        return (('historico', dm.history), ('rollups', dm.rollups), ('produtos', dm.products))
+
+    def _frame(self, parts: Dict[str, Any]) -> bytes:
+        payload = serialization.dumps({'snapshot': self.data_manager.get_snapshot(), **parts})
+        return _HEADER.pack(len(payload)) + payload
+
+    def _full_frame(self) -> bytes:
+        """Estado completo para um worker recém-conectado (não drena alterações)."""
+        parts = {}
+        for name, source in self._parts():
+            parts[name] = source.to_state()
+            parts[name + '_completo'] = True
+        return self._frame(parts)
+
+    def _delta_frame(self) -> bytes:
+        """Alterações desde o último publish; estado completo de cada parte trocada ou com excesso."""
+        parts = {}
+        for name, source in self._parts():
+            changes = None
+            if self._sources.get(name) is source:
+                changes = source.drain_changes()
+            else:
+                # Objeto novo (carga completa no carregador): alterações pendentes já estão no estado
+                source.drain_changes()
+                self._sources[name] = source
+            parts[name] = changes if changes is not None else source.to_state()
+            parts[name + '_completo'] = changes is None
+        return self._frame(parts)
+
+    def _accept_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            conn.settimeout(self.send_timeout)
+            # Mesmo lock do publish: alterações drenadas depois do estado completo chegam a este worker
+            with self._lock:
+                try:
+                    conn.sendall(self._full_frame())
+                except OSError:
+                    conn.close()
+                    continue
+                self._clients.append(conn)
+                workers = len(self._clients)
+            logger.info("snapshot_worker_attached", extra={"workers": workers})
+
+    def publish(self):
+        # Serializa uma vez e envia o mesmo frame para todos os workers
+        with self._lock:
+            frame = self._delta_frame()
+            for conn in list(self._clients):
+                try:
+                    conn.sendall(frame)
+                except OSError:
+                    conn.close()
+                    self._clients.remove(conn)
+                    logger.info("snapshot_worker_detached", extra={"workers": len(self._clients)})
+
+
+class SharedDataManager:
+    """Leitor de snapshots publicados pelo processo carregador.
+
+    Expõe a mesma interface usada por ``app.main`` (start/stop/subscribe/
+    get_snapshot/get_historico/history_stats/get_series/get_produtos/
+    lookup_produtos/snapshot_age/ready/state), sem ler o CSV.
+    """
+
+    def __init__(
+        self,
+        socket_spec: str,
+        history_size: int = 1000,
+        reconnect_interval: float = 1.0,
+        rollup_resolutions: Optional[Dict[str, int]] = None,
+    ):
+        self.socket_spec = socket_spec
+        self.reconnect_interval = reconnect_interval
+        self._lock = threading.RLock()
+        self._data: Dict[str, Any] = {}
+        self._published_at: Optional[float] = None
+        self._history = HistoryBuffer(history_size)
+        self.rollups = TimeRollups(rollup_resolutions)
+        self.products = ProductIndex()
+        self._subscribers = []  # type: list[Callable[[dict[str, Any]], None]]
+        self._stop_event = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        self._thread = None  # type: ignore
+
+    def start(self, background: bool = True):
+        # Sempre em segundo plano: o primeiro snapshot chega quando o carregador publicar
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._published_at is not None
+
+    @property
+    def state(self) -> str:
+        return 'pronto' if self.ready else 'aquecendo'
+
+    def stop(self):
+        self._stop_event.set()
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+
+    def subscribe(self, cb: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            self._subscribers.append(cb)
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data)
+
+    def snapshot_age(self) -> Optional[float]:
+        published_at = self._published_at
+        return time.time() - published_at if published_at is not None else None
+
+    def get_historico(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            history = self._history
+        return history.tail(limit)
+
+    def history_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            history = self._history
+        return history.stats()
+
+    def get_series(self, bucket: str, produtos=None, inicio=None, fim=None, limit=None,
+                   max_points=None) -> List[Dict[str, Any]]:
+        return self.rollups.series(bucket, produtos, inicio, fim, limit, max_points)
+
+    def get_produtos(self, ordem='produto', desc=False, prefixo=None, cursor=None, limit=100) -> Dict[str, Any]:
+        return self.products.page(ordem, desc, prefixo, cursor, limit)
+
+    def lookup_produtos(self, produtos) -> Dict[str, Dict[str, int]]:
+        return self.products.lookup(produtos)
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            family, address = _open_socket(self.socket_spec)
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as sock:
+                    sock.connect(address)
+                    self._sock = sock
+                    logger.info("snapshot_loader_attached", extra={"socket": self.socket_spec})
+                    while not self._stop_event.is_set():
+                        header = _recv_exact(sock, _HEADER.size)
+                        if header is None:
+                            break
+                        payload = _recv_exact(sock, _HEADER.unpack(header)[0])
+                        if payload is None:
+                            break
+                        self._apply(serialization.loads(payload))
+            except OSError as e:
+                logger.debug("snapshot_loader_unavailable", extra={"erro": str(e)})
+            if not self._stop_event.is_set():
+                time.sleep(self.reconnect_interval)
+
+    def _apply(self, message: Dict[str, Any]):
+        self._history.apply_state(message['historico'], replace=message.get('historico_completo', False))
+        self.rollups.apply_state(message.get('rollups') or {}, replace=message.get('rollups_completo', False))
+        self.products.apply_state(message.get('produtos') or {}, replace=message.get('produtos_completo', False))
+        with self._lock:
+            self._data = message.get('snapshot') or {}
+            self._published_at = time.time()
+        snapshot = self.get_snapshot()
+        for cb in list(self._subscribers):
+            try:
+                cb(snapshot)
+            except Exception as e:
+                logger.warning("Subscriber falhou: %s", e)
+
+
+def serve_metrics(port: int):
+    """Expõe ``/metrics`` do processo carregador (métricas de recarga do CSV)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from app import metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', metrics.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # silencia o log padrão em stderr
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    from app.csv_columns import INT_DTYPES, CsvSchema
+    from app.data_loader import DataManager
+    from app.logging_setup import configure_logging
+    from app.windows import parse_windows
+
+    parser = argparse.ArgumentParser(description="Processo carregador que publica snapshots para os workers.")
+    parser.add_argument('--csv', type=str, default=os.getenv('CSV_PATH', str(Path(__file__).resolve().parent / 'sample_data.csv')))
+    parser.add_argument('--pattern', type=str, default=os.getenv('CSV_PATTERN', '*.csv'))
+    parser.add_argument('--socket', type=str, default=os.getenv('SNAPSHOT_SOCKET', '/tmp/dashboard-snapshot.sock'))
+    parser.add_argument('--refresh-interval', type=float, default=5.0)
+    parser.add_argument('--history-size', type=int, default=int(os.getenv('HISTORY_CAPACITY', '1000')))
+    parser.add_argument('--cache-dir', type=str, default=os.getenv('CSV_CACHE_DIR'))
+    parser.add_argument('--debounce', type=float, default=float(os.getenv('RELOAD_DEBOUNCE_SECONDS', '0.05')))
+    parser.add_argument('--max-staleness', type=float, default=float(os.getenv('RELOAD_MAX_STALENESS_SECONDS', '2')))
+    parser.add_argument('--janelas', type=str, default=os.getenv('SLIDING_WINDOWS', '5m,1h,24h'))
+    parser.add_argument('--top-n', type=int, default=int(os.getenv('SNAPSHOT_TOP_N', '50')),
+                        help="produtos por mapa no snapshot (0 = todos)")
+    parser.add_argument('--timestamp-format', type=str, default=os.getenv('CSV_TIMESTAMP_FORMAT', '%Y-%m-%dT%H:%M'))
+    parser.add_argument('--int-dtype', choices=INT_DTYPES, default=os.getenv('CSV_INT_DTYPE', 'int32'))
+    parser.add_argument('--chunk-threshold-mb', type=float, default=float(os.getenv('CSV_CHUNK_THRESHOLD_MB', '64')),
+                        help="a partir deste tamanho o CSV é lido em blocos")
+    parser.add_argument('--chunk-rows', type=int, default=int(os.getenv('CSV_CHUNK_ROWS', '200000')))
+    parser.add_argument('--metrics-port', type=int, default=None, help="porta HTTP para /metrics do carregador")
+    args = parser.parse_args()
+
+    configure_logging()
+    data_manager = DataManager(
+        Path(args.csv),
+        refresh_interval=args.refresh_interval,
+        history_size=args.history_size,
+        cache_dir=Path(args.cache_dir) if args.cache_dir else None,
+        pattern=args.pattern,
+        debounce=args.debounce,
+        max_staleness=args.max_staleness,
+        windows=parse_windows(args.janelas),
+        top_n=args.top_n,
+        schema=CsvSchema(
+            timestamp_format=args.timestamp_format,
+            int_dtype=args.int_dtype,
+            chunk_threshold=int(args.chunk_threshold_mb * 1024 * 1024),
+            chunk_rows=args.chunk_rows,
+        ),
+    )
+    publisher = SnapshotPublisher(data_manager, args.socket)
+    publisher.start()
+    if args.metrics_port:
+        from app import metrics
+        metrics.SNAPSHOT_AGE.set_function(data_manager.snapshot_age)
+        serve_metrics(args.metrics_port)
+    data_manager.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        data_manager.stop()
+        publisher.stop()
+
+
+__all__ = ["SnapshotPublisher", "SharedDataManager"]
+
+
+if __name__ == '__main__':
+    main()
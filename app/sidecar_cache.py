@@ -0,0 +1,231 @@
+"""Cache do estado já interpretado ao lado do CSV, para partida rápida.
+
+Layout do diretório (padrão ``<csv>.cache/``)::
+
+    meta.json           identidade do CSV no offset cacheado, agregados,
+                        histórico recente e qual base/diário de rollups vale
+    rollups-N.json      estado completo dos rollups (base N)
+    rollups-N.log       diário: uma linha JSON por gravação com só os
+                        buckets alterados desde a anterior
+
+Adaptação em relação a um cache colunar binário (colunas por linha, produto
+codificado por dicionário): o cache guarda só estado derivado, em JSON, como
+o checkpoint (app.checkpoint). A carga completa não paga nada por linha e a
+partida não relê linhas já agregadas. O custo fica nas gravações:
+
+- ``meta.json`` é reescrito a cada ``cache_interval`` e cresce com o
+  catálogo (agregados por produto) mais o histórico, que é limitado;
+- os rollups (até um ano de buckets de 1h por produto) só são gravados por
+  inteiro na primeira gravação, após uma carga completa ou quando o diário
+  passa do tamanho da base; nas demais vai para o diário apenas o que mudou
+  (``TimeRollups.drain_changes('cache')``).
+
+Na partida, a base é lida e o diário reaplicado até o tamanho registrado no
+meta (bytes além disso, de uma gravação interrompida, são descartados);
+apenas os bytes do CSV após o offset cacheado são interpretados.
+
+A chave do cache é o tamanho e o mtime do CSV no offset cacheado mais uma
+impressão digital (sha1 do início do arquivo e dos bytes que antecedem o
+offset), além do inode e do cabeçalho.
+
+``save`` pode rodar fora do lock de carga do DataManager: cada ``reset``
+avança a geração, cada captura recebe um número de sequência (``next_seq``)
+e gravações fora de ordem são descartadas. Um diário só é aceito logo após
+a gravação anterior; senão a próxima captura precisa ser completa
+(``needs_full``).
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 3
+FINGERPRINT_BYTES = 4096
+
+# Arquivos do formato 1 (colunas binárias), removidos no reset
+_LEGACY_FILES = ('produtos.txt', 'timestamps.txt', 'ts.bin', 'produto.bin', 'vendas.bin', 'estoque.bin')
+
+
+def fingerprint(path: Path, offset: int) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        h.update(f.read(min(FINGERPRINT_BYTES, offset)))
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        h.update(f.read(min(FINGERPRINT_BYTES, offset)))
+    return h.hexdigest()
+
+
+def _write_replace(path: Path, data: bytes):
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class SidecarCache:
+    """Leitura/gravação do cache de estado de um CSV."""
+
+    def __init__(self, csv_path: Path, cache_dir: Optional[Path] = None):
+        self.csv_path = csv_path
+        self.dir = cache_dir or csv_path.with_name(csv_path.name + '.cache')
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._issued = 0  # última sequência entregue por next_seq
+        self._saved_seq = 0  # sequência da última gravação aceita
+        self._base: Optional[int] = None  # base de rollups em disco (None = nenhuma)
+        self._base_bytes = 0
+        self._journal_bytes = 0
+        self._broken = False  # diário perdeu uma gravação: a próxima precisa ser completa
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def needs_full(self) -> bool:
+        """A próxima gravação deve levar os rollups completos (sem base, diário grande ou falha)."""
+        return self._base is None or self._broken or self._journal_bytes > self._base_bytes
+
+    def next_seq(self) -> int:
+        """Sequência de uma captura (chamado com o lock de carga, na ordem das capturas)."""
+        with self._lock:
+            self._issued += 1
+            return self._issued
+
+    def _rollups_path(self, base: int, suffix: str) -> Path:
+        return self.dir / f'rollups-{base}.{suffix}'
+
+    def _remove_base(self, base: int):
+        for suffix in ('json', 'log'):
+            path = self._rollups_path(base, suffix)
+            if path.exists():
+                path.unlink()
+
+    # -- gravação -------------------------------------------------------
+
+    def reset(self):
+        """Descarta o conteúdo (chamado em toda reconstrução completa)."""
+        with self._lock:
+            self._generation += 1
+            for name in ('meta.json',) + _LEGACY_FILES:
+                path = self.dir / name
+                if path.exists():
+                    path.unlink()
+            for path in self.dir.glob('rollups-*') if self.dir.exists() else ():
+                path.unlink()
+            self._base = None
+            self._base_bytes = self._journal_bytes = 0
+
+    def save(self, offset: int, mtime: float, inode: int, header: bytes, tail_guard: bytes,
+             state: Dict[str, Any], rollups: Dict[str, Any], full: bool, generation: int, seq: int) -> bool:
+        """Grava o estado capturado. ``rollups``: estado completo (``full``) ou só as alterações.
+
+        Retorna ``False`` (sem gravar) se houve ``reset`` após a captura, se
+        uma captura posterior já foi gravada ou se o diário não continua da
+        gravação anterior.
+        """
+        csv_ident = {
+            'tamanho': offset,
+            'mtime': mtime,
+            'inode': inode,
+            'fingerprint': fingerprint(self.csv_path, offset),
+            'header': base64.b64encode(header).decode('ascii'),
+            'tail_guard': base64.b64encode(tail_guard).decode('ascii'),
+        }
+        rollups_data = json.dumps(rollups, separators=(',', ':')).encode('utf-8') if full or rollups else b''
+        with self._lock:
+            if generation != self._generation or seq <= self._saved_seq:
+                return False
+            if not full and (self._base is None or self._broken or seq != self._saved_seq + 1):
+                self._broken = True
+                return False
+            self._broken = True  # até a gravação terminar
+            self.dir.mkdir(parents=True, exist_ok=True)
+            previous = self._base
+            if full:
+                base = (previous or 0) + 1
+                _write_replace(self._rollups_path(base, 'json'), rollups_data)
+                self._rollups_path(base, 'log').write_bytes(b'')
+                base_bytes, journal_bytes = len(rollups_data), 0
+            else:
+                base, base_bytes, journal_bytes = previous, self._base_bytes, self._journal_bytes
+                if rollups_data:
+                    with open(self._rollups_path(base, 'log'), 'r+b') as f:
+                        f.seek(journal_bytes)
+                        f.write(rollups_data + b'\n')
+                        f.truncate()
+                    journal_bytes += len(rollups_data) + 1
+            meta = {
+                'formato': FORMAT_VERSION,
+                'csv': csv_ident,
+                'rollups': {'base': base, 'diario_bytes': journal_bytes},
+                'estado': state,
+            }
+            _write_replace(self.dir / 'meta.json', json.dumps(meta, separators=(',', ':')).encode('utf-8'))
+            if full and previous is not None:
+                self._remove_base(previous)
+            self._base, self._base_bytes, self._journal_bytes = base, base_bytes, journal_bytes
+            self._saved_seq = seq
+            self._broken = False
+        return True
+
+    # -- leitura --------------------------------------------------------
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Valida o cache contra o CSV atual e devolve o estado salvo, ou None.
+
+        ``estado`` traz ``agregados``, ``historico``, ``rollups`` (a base) e
+        ``diario`` (alterações a reaplicar sobre ela, em ordem).
+        """
+        meta_path = self.dir / 'meta.json'
+        if not meta_path.exists() or not self.csv_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta.get('formato') != FORMAT_VERSION:
+                return None
+            ident = meta['csv']
+            st = self.csv_path.stat()
+            offset = ident['tamanho']
+            if st.st_ino != ident['inode'] or st.st_size < offset:
+                return None
+            header = base64.b64decode(ident['header'])
+            with open(self.csv_path, 'rb') as f:
+                if f.readline() != header:
+                    return None
+            unchanged = st.st_size == offset and st.st_mtime == ident['mtime']
+            if not unchanged and fingerprint(self.csv_path, offset) != ident['fingerprint']:
+                return None
+            base, journal_bytes = meta['rollups']['base'], meta['rollups']['diario_bytes']
+            base_data = self._rollups_path(base, 'json').read_bytes()
+            with open(self._rollups_path(base, 'log'), 'r+b') as f:
+                journal = f.read(journal_bytes)
+                if len(journal) != journal_bytes:
+                    raise ValueError("diário de rollups menor que o registrado")
+                # Gravação interrompida depois do diário e antes do meta
+                f.truncate(journal_bytes)
+            estado = dict(meta['estado'])
+            estado['rollups'] = json.loads(base_data)
+            estado['diario'] = [json.loads(line) for line in journal.splitlines()]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("sidecar_cache_invalido", extra={"erro": str(e)})
+            return None
+        with self._lock:
+            self._base, self._base_bytes, self._journal_bytes = base, len(base_data), journal_bytes
+            self._saved_seq = self._issued
+            self._broken = False
+        return {
+            'offset': offset,
+            'inode': ident['inode'],
+            'header': header,
+            'tail_guard': base64.b64decode(ident['tail_guard']),
+            'estado': estado,
+        }
+
+
+__all__ = ["SidecarCache"]
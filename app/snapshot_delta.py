@@ -0,0 +1,111 @@
+"""Protocolo de deltas versionados para o canal /ws.
+
+Cada snapshot publicado pelo DataManager carrega ``versao`` (monotônica).
+Em vez de reenviar o snapshot inteiro, o servidor envia apenas os campos e
+produtos que mudaram em relação à versão anterior::
+
+    {"type": "delta", "base": 41, "versao": 42,
+     "data": {"total_vendas": 1234, "vendas_por_produto": {"Produto A": 310}},
+     "removidos": {"vendas_por_produto": ["Produto Z"]}}
+
+Um cliente que reconecta informa a última versão que conhece e recebe um
+delta acumulado (se ainda estiver no log) ou o snapshot completo.
+"""
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+MAP_FIELDS = ('estoque_por_produto', 'vendas_por_produto')
+# Mapas das janelas deslizantes (vendas_por_produto_5m, ...) também vão por produto
+WINDOW_MAP_PREFIX = 'vendas_por_produto_'
+# Campos que não entram no delta (identificam a versão em si)
+IGNORED_FIELDS = ('versao',)
+
+
+def is_map_field(key: str) -> bool:
+    return key in MAP_FIELDS or key.startswith(WINDOW_MAP_PREFIX)
+
+
+def diff_snapshots(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Retorna ``{'data': ..., 'removidos': ...}`` com o que mudou de old para new."""
+    data: Dict[str, Any] = {}
+    removidos: Dict[str, list] = {}
+    for key, value in new.items():
+        if key in IGNORED_FIELDS:
+            continue
+        if is_map_field(key) and isinstance(value, dict):
+            before = old.get(key) or {}
+            changed = {p: v for p, v in value.items() if p not in before or before[p] != v}
+            if changed:
+                data[key] = changed
+            gone = [p for p in before if p not in value]
+            if gone:
+                removidos[key] = gone
+        elif key not in old or old[key] != value:
+            data[key] = value
+    return {'data': data, 'removidos': removidos}
+
+
+def merge_deltas(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """Combina dois deltas consecutivos em um só (second aplicado após first)."""
+    data = {k: (dict(v) if is_map_field(k) else v) for k, v in first['data'].items()}
+    removidos = {k: set(v) for k, v in first['removidos'].items()}
+    for key, value in second['data'].items():
+        if is_map_field(key):
+            data.setdefault(key, {}).update(value)
+            if key in removidos:
+                removidos[key].difference_update(value)
+        else:
+            data[key] = value
+    for key, gone in second['removidos'].items():
+        for p in gone:
+            data.get(key, {}).pop(p, None)
+        removidos.setdefault(key, set()).update(gone)
+    return {
+        'data': {k: v for k, v in data.items() if v != {} or not is_map_field(k)},
+        'removidos': {k: sorted(v) for k, v in removidos.items() if v},
+    }
+
+
+class DeltaLog:
+    """Guarda os últimos deltas por versão para permitir catch-up de clientes.
+
+    Cada delta registra sua versão base; versões puladas (snapshots
+    conflacionados antes do broadcast) não quebram a cadeia.
+    """
+
+    def __init__(self, maxlen: int = 256):
+        self.maxlen = maxlen
+        self._deltas: "OrderedDict[int, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+
+    def append(self, versao: int, delta: Dict[str, Any], base: Optional[int] = None):
+        self._deltas[versao] = (versao - 1 if base is None else base, delta)
+        while len(self._deltas) > self.maxlen:
+            self._deltas.popitem(last=False)
+
+    def clear(self):
+        self._deltas.clear()
+
+    def since(self, versao: int, current: int) -> Optional[Dict[str, Any]]:
+        """Delta acumulado de ``versao`` até ``current`` ou None se não houver histórico."""
+        if versao == current:
+            return {'data': {}, 'removidos': {}}
+        if versao > current:
+            return None
+        chain = []
+        v = current
+        while v > versao:
+            entry = self._deltas.get(v)
+            if entry is None:
+                return None
+            v, delta = entry
+            chain.append(delta)
+        if v != versao:
+            # ``versao`` foi pulada (nunca difundida): não há base comum
+            return None
+        merged = None
+        for delta in reversed(chain):
+            merged = delta if merged is None else merge_deltas(merged, delta)
+        return merged
+
+
+__all__ = ["diff_snapshots", "merge_deltas", "is_map_field", "DeltaLog"]
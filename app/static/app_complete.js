@@ -5,9 +5,18 @@ const state = {
     reconnectAttempts: 0,
     maxReconnect: 10,
     reconnectDelay: 2000,
-    charts: {}
+    charts: {},
+    snapshot: null,
+    versao: null,
+    historicoTimer: null,
+    historicoEm: 0
 };
 
+// Gráficos de linha: só os produtos mais vendidos do snapshot, buscados no máximo
+// uma vez a cada HISTORICO_INTERVALO_MS (deltas do WS chegam bem mais rápido)
+const CHART_MAX_PRODUTOS = 10;
+const HISTORICO_INTERVALO_MS = 5000;
+
 function $(id) { return document.getElementById(id); }
 
 function setStatus(text, cls) {
@@ -18,7 +27,7 @@ function setStatus(text, cls) {
     }
 }
 
-function renderTable(tableId, dataObj, label) {
+function renderTable(tableId, dataObj, label, totalProdutos) {
     const tbody = document.querySelector(`#${tableId} tbody`);
     if (!tbody) return;
     
@@ -45,6 +54,17 @@ function renderTable(tableId, dataObj, label) {
         tr.appendChild(tdV);
         tbody.appendChild(tr);
     }
+    // Catálogo grande: o snapshot traz só os top N, o restante fica em /api/produtos
+    const omitidos = (totalProdutos ?? entries.length) - entries.length;
+    if (omitidos > 0) {
+        const tr = document.createElement('tr');
+        const td = document.createElement('td');
+        td.colSpan = 2;
+        td.textContent = `+${omitidos} produtos (ver /api/produtos)`;
+        td.style.textAlign = 'center';
+        tr.appendChild(td);
+        tbody.appendChild(tr);
+    }
 }
 
 function ensureChart(id, label, yTitle) {
@@ -130,7 +150,7 @@ function ensureChart(id, label, yTitle) {
     }
 }
 
-function buildPieChart(vendas_por_produto) {
+function buildPieChart(vendas_por_produto, totalVendas, totalProdutos) {
     console.log('🥧 Construindo gráfico de pizza:', vendas_por_produto);
     
     if (!vendas_por_produto || Object.keys(vendas_por_produto).length === 0) {
@@ -147,6 +167,14 @@ function buildPieChart(vendas_por_produto) {
     const entries = Object.entries(vendas_por_produto);
     const labels = entries.map(([produto]) => produto);
     const data = entries.map(([, vendas]) => vendas);
+    // Só os mais vendidos vêm no snapshot: o restante vira uma fatia "Outros"
+    if ((totalProdutos ?? entries.length) > entries.length && totalVendas != null) {
+        const outros = totalVendas - data.reduce((a, b) => a + b, 0);
+        if (outros > 0) {
+            labels.push('Outros');
+            data.push(outros);
+        }
+    }
     
     console.log('📊 Dados do gráfico de pizza:', { labels, data });
     
@@ -230,10 +258,23 @@ function buildCharts(rows) {
     console.log('✅ Gráficos de linha atualizados!');
 }
 
+function chartProdutos(snap) {
+    return Object.entries(snap?.vendas_por_produto || {})
+        .sort((a, b) => b[1] - a[1])
+        .slice(0, CHART_MAX_PRODUTOS)
+        .map(([produto]) => produto);
+}
+
 async function loadHistorico() {
+    state.historicoEm = Date.now();
+    const produtos = chartProdutos(state.snapshot);
+    if (produtos.length === 0) return;
     try {
         console.log('📊 Carregando dados históricos...');
-        const r = await fetch('/api/historico?limit=120');
+        // Rollups por minuto do servidor, filtrados pelos produtos exibidos (limit vale por produto)
+        const params = new URLSearchParams({ bucket: '1m', limit: '120' });
+        produtos.forEach(p => params.append('produto', p));
+        const r = await fetch(`/api/series?${params}`);
         if (!r.ok) return;
         const rows = await r.json();
         buildCharts(rows);
@@ -242,6 +283,16 @@ async function loadHistorico() {
     }
 }
 
+function scheduleHistorico() {
+    // Já agendada: quando rodar, usa o snapshot mais recente
+    if (state.historicoTimer) return;
+    const espera = Math.max(0, state.historicoEm + HISTORICO_INTERVALO_MS - Date.now());
+    state.historicoTimer = setTimeout(() => {
+        state.historicoTimer = null;
+        loadHistorico();
+    }, espera);
+}
+
 function updateSnapshot(snap) {
     if (!snap) {
         console.error('❌ Snapshot vazio recebido');
@@ -249,23 +300,57 @@ function updateSnapshot(snap) {
     }
     
     console.log('📊 Atualizando snapshot:', snap);
+    state.snapshot = snap;
+    state.versao = snap.versao ?? null;
     
     $("totalVendas").textContent = snap.total_vendas ?? '--';
     $("ultimaAtualizacao").textContent = snap.ultimo_timestamp ?? '--';
     $("linhasCsv").textContent = snap.linhas ?? '--';
     $("atualizadoEm").textContent = snap.atualizado_em ?? '--';
     
-    renderTable("tabelaVendas", snap.vendas_por_produto, 'Vendas');
-    renderTable("tabelaEstoque", snap.estoque_por_produto, 'Estoque');
+    renderTable("tabelaVendas", snap.vendas_por_produto, 'Vendas', snap.total_produtos);
+    renderTable("tabelaEstoque", snap.estoque_por_produto, 'Estoque', snap.total_produtos);
     
-    buildPieChart(snap.vendas_por_produto);
-    loadHistorico();
+    buildPieChart(snap.vendas_por_produto, snap.total_vendas, snap.total_produtos);
+    scheduleHistorico();
+}
+
+const MAP_FIELDS = ['estoque_por_produto', 'vendas_por_produto'];
+// Janelas deslizantes (vendas_por_produto_5m, ...) também chegam por produto
+const isMapField = key => MAP_FIELDS.includes(key) || key.startsWith('vendas_por_produto_');
+
+function applyDelta(msg) {
+    // Delta só vale sobre a versão imediatamente anterior; senão pede resync
+    if (!state.snapshot || msg.base !== state.versao) {
+        console.log(`🔁 Delta fora de sequência (base ${msg.base}, local ${state.versao}), pedindo resync`);
+        state.ws.send(JSON.stringify({ type: 'resume', versao: state.versao }));
+        return;
+    }
+    const snap = { ...state.snapshot };
+    for (const [key, value] of Object.entries(msg.data || {})) {
+        snap[key] = isMapField(key) ? { ...(snap[key] || {}), ...value } : value;
+    }
+    for (const [key, produtos] of Object.entries(msg.removidos || {})) {
+        snap[key] = { ...(snap[key] || {}) };
+        produtos.forEach(p => delete snap[key][p]);
+    }
+    snap.versao = msg.versao;
+    updateSnapshot(snap);
 }
 
 async function fetchSnapshot() {
     try {
         console.log('🔄 Buscando dados...');
         const r = await fetch('/api/data');
+        if (r.status === 503) {
+            // Servidor ainda na carga inicial: o snapshot chega pelo WS ou na próxima tentativa
+            if (!state.ws || state.ws.readyState !== WebSocket.OPEN) {
+                setStatus('Carregando dados...', '');
+                const espera = Number(r.headers.get('Retry-After') || 1) * 1000;
+                setTimeout(fetchSnapshot, espera);
+            }
+            return;
+        }
         if (!r.ok) throw new Error('HTTP ' + r.status);
         const data = await r.json();
         updateSnapshot(data);
@@ -278,7 +363,8 @@ async function fetchSnapshot() {
 
 function initWS() {
     const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
-    const url = `${protocol}://${location.host}/ws`;
+    const resume = state.versao !== null ? `?versao=${state.versao}` : '';
+    const url = `${protocol}://${location.host}/ws${resume}`;
     const ws = new WebSocket(url);
     state.ws = ws;
     
@@ -292,7 +378,8 @@ function initWS() {
     ws.onmessage = (ev) => {
         try {
             const msg = JSON.parse(ev.data);
-            if (msg.type === 'snapshot') updateSnapshot(msg.data);
+            if (msg.type === 'snapshot') updateSnapshot({ ...msg.data, versao: msg.versao });
+            else if (msg.type === 'delta') applyDelta(msg);
         } catch {}
         
         if (ws.readyState === WebSocket.OPEN) {
@@ -351,5 +438,5 @@ document.addEventListener('DOMContentLoaded', () => {
     fetchSnapshot();
     
     // Atualizar histórico periodicamente
-    setInterval(loadHistorico, 15000);
+    setInterval(scheduleHistorico, 15000);
 });
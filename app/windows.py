@@ -0,0 +1,178 @@
+"""Agregados de janela deslizante por produto (ex: últimos 5m, 1h, 24h).
+
+Um único anel de buckets (largura = ``granularidade``, o menor rollup, 1m por
+padrão) cobre a maior janela; cada janela mantém seus próprios totais por
+produto. Quando o bucket mais recente avança, os buckets que saem de cada
+janela são subtraídos dos totais dela — cada bucket entra e sai uma vez por
+janela, então o custo por linha é constante e ler uma janela não custa nada.
+
+O "agora" é o tempo dos eventos (maior timestamp visto no CSV), não o
+relógio: dados históricos continuam com janelas significativas e o
+resultado é o mesmo em qualquer worker. Sem linhas novas a janela não anda.
+A precisão é de um bucket: a janela de 5m cobre os 5 buckets de 1m mais
+recentes, incluindo o corrente.
+
+Com ``top_n`` cada janela publica só seus ``top_n`` mais vendidos, a partir
+de um ``Ranking`` atualizado apenas com os produtos que mudaram desde a
+publicação anterior.
+"""
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.product_index import Ranking
+from app.rollups import TimeRollups, parse_timestamp
+
+WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+# Prefixos dos campos publicados no snapshot (ex: vendas_por_produto_5m)
+TOTAL_PREFIX = 'total_vendas_'
+MAP_PREFIX = 'vendas_por_produto_'
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(spec: str) -> Dict[str, int]:
+    """``"5m,1h,24h"`` -> ``{'5m': 300, '1h': 3600, '24h': 86400}``."""
+    windows = {}
+    for name in (part.strip() for part in spec.split(',')):
+        if not name:
+            continue
+        match = re.fullmatch(r'(\d+)([smhd])', name)
+        if match is None:
+            raise ValueError(f"janela inválida: {name!r} (use ex: 5m, 1h, 24h)")
+        windows[name] = int(match.group(1)) * _UNITS[match.group(2)]
+    return windows
+
+
+class _Window:
+    __slots__ = ('size', 'totals', 'total', 'dirty', 'ranking')
+
+    def __init__(self, size: int, ranked: bool = False):
+        self.size = size  # em buckets
+        self.totals: Dict[str, int] = {}
+        self.total = 0
+        # Só com top_n: produtos alterados desde o último top()
+        self.dirty: Optional[set] = set() if ranked else None
+        self.ranking = Ranking() if ranked else None
+
+    def add(self, produto: str, vendas: int):
+        self.totals[produto] = self.totals.get(produto, 0) + vendas
+        self.total += vendas
+        if self.dirty is not None:
+            self.dirty.add(produto)
+
+    def subtract(self, cell: Dict[str, int]):
+        totals = self.totals
+        for produto, vendas in cell.items():
+            restante = totals.get(produto, 0) - vendas
+            if restante:
+                totals[produto] = restante
+            else:
+                totals.pop(produto, None)
+            self.total -= vendas
+        if self.dirty is not None:
+            self.dirty.update(cell)
+
+    def clear(self):
+        self.totals = {}
+        self.total = 0
+        if self.ranking is not None:
+            self.ranking.replace({})
+            self.dirty = set()
+
+    def top(self, n: int) -> Dict[str, int]:
+        totals = self.totals
+        self.ranking.update({p: totals.get(p) for p in self.dirty})
+        self.dirty = set()
+        return dict(self.ranking.top(n, desc=True))
+
+
+class SlidingWindows:
+    def __init__(self, windows: Optional[Dict[str, int]] = None, granularity: int = 60, top_n: Optional[int] = None):
+        self.granularity = granularity
+        self.windows = dict(WINDOWS if windows is None else windows)
+        self.top_n = top_n
+        # Janela menor que a granularidade vira um bucket
+        self._windows = {
+            name: _Window(max(1, -(-seconds // granularity)), ranked=bool(top_n))
+            for name, seconds in self.windows.items()
+        }
+        self._ring_size = max((w.size for w in self._windows.values()), default=1)
+        self._ring: List[Optional[Tuple[int, Dict[str, int]]]] = [None] * self._ring_size
+        self._head: Optional[int] = None  # índice (epoch // granularidade) do bucket mais recente
+        self._lock = threading.Lock()
+
+    def extend(self, rows: Iterable[Tuple[str, str, int, int]]):
+        """Sink de linhas (timestamp, produto, vendas, estoque) — ver Aggregates.fold."""
+        g = self.granularity
+        with self._lock:
+            for ts, produto, vendas, _ in rows:
+                epoch = parse_timestamp(ts)
+                if epoch is not None:
+                    self._add(int(epoch) // g, produto, vendas)
+
+    def load_rollups(self, rollups: TimeRollups):
+        """Reconstrói as janelas a partir dos rollups na resolução da granularidade.
+
+        Usado após carga completa (pandas), restauração do cache e no
+        modo diretório, onde as linhas não passam por ``extend``.
+        """
+        res = next((r for r, s in rollups.resolutions.items() if s == self.granularity), None)
+        if res is None:
+            return
+        span = (self._ring_size - 1) * self.granularity
+        g = self.granularity
+        with self._lock:
+            self._reset()
+            for bucket, produto, vendas in rollups.recent_buckets(res, span):
+                self._add(bucket // g, produto, vendas)
+
+    def _reset(self):
+        self._ring = [None] * self._ring_size
+        self._head = None
+        for window in self._windows.values():
+            window.clear()
+
+    def _add(self, idx: int, produto: str, vendas: int):
+        head = self._head
+        if head is None or idx > head:
+            self._advance(idx)
+            head = idx
+        elif idx <= head - self._ring_size:
+            return  # mais antigo que a maior janela
+        pos = idx % self._ring_size
+        slot = self._ring[pos]
+        if slot is None or slot[0] != idx:
+            slot = self._ring[pos] = (idx, {})
+        cell = slot[1]
+        cell[produto] = cell.get(produto, 0) + vendas
+        for window in self._windows.values():
+            if idx > head - window.size:
+                window.add(produto, vendas)
+
+    def _advance(self, new_head: int):
+        old = self._head
+        self._head = new_head
+        if old is None:
+            return
+        for window in self._windows.values():
+            if new_head - old >= window.size:
+                window.clear()
+                continue
+            # Buckets (old - size, new_head - size] saem desta janela
+            for idx in range(old - window.size + 1, new_head - window.size + 1):
+                slot = self._ring[idx % self._ring_size]
+                if slot is not None and slot[0] == idx:
+                    window.subtract(slot[1])
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Campos ``total_vendas_<janela>`` e ``vendas_por_produto_<janela>``."""
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for name, window in self._windows.items():
+                out[TOTAL_PREFIX + name] = window.total
+                out[MAP_PREFIX + name] = window.top(self.top_n) if self.top_n else dict(window.totals)
+        return out
+
+
+__all__ = ["SlidingWindows", "WINDOWS", "parse_windows", "TOTAL_PREFIX", "MAP_PREFIX"]
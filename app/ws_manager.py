@@ -0,0 +1,394 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+from app import metrics
+from app.serialization import dumps_text
+from app.snapshot_delta import DeltaLog, diff_snapshots
+
+logger = logging.getLogger("ws")
+
+
+class _ClientConnection:
+    """Fila de saída limitada de um cliente, drenada por uma task própria.
+
+    Quando a fila enche, as mensagens pendentes são descartadas e trocadas
+    por um único snapshot completo (o valor mais recente vence): deltas não
+    podem ser pulados, mas um snapshot substitui todos eles. As mensagens já
+    chegam serializadas (texto JSON), codificadas uma vez para todos os clientes.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self._pending: deque = deque()  # (enfileirado_em, mensagem, escrita do CSV em epoch)
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.conflated = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.closed = False
+        # Assinaturas: None = recebe o stream completo (padrão); senão só estes produtos/campos
+        self.produtos: Optional[Set[str]] = None
+        self.campos: Set[str] = set()
+
+    @property
+    def filtered(self) -> bool:
+        return self.produtos is not None
+
+    def start(self):
+        self.task = asyncio.create_task(self._drain())
+
+    def enqueue(
+        self,
+        message: str,
+        full_message: Callable[[], str],
+        origem: Optional[float] = None,
+    ):
+        if len(self._pending) >= self.queue_size:
+            self._pending.clear()
+            self.conflated += 1
+            message = full_message()
+        self._pending.append((time.perf_counter(), message, origem))
+        self._wakeup.set()
+
+    def lag_seconds(self) -> float:
+        """Idade da mensagem pendente mais antiga (0 se a fila está vazia)."""
+        if not self._pending:
+            return 0.0
+        return time.perf_counter() - self._pending[0][0]
+
+    async def _drain(self):
+        try:
+            while True:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                enqueued_at, message, origem = self._pending.popleft()
+                await self.websocket.send_text(message)
+                if origem is not None:
+                    # Ponta a ponta: escrita no CSV -> mensagem entregue a este cliente
+                    metrics.WS_DELIVERY_LATENCY.observe(max(0.0, time.time() - origem))
+                latency_ms = (time.perf_counter() - enqueued_at) * 1000
+                self.last_latency_ms = latency_ms
+                self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("ws_send_failed", extra={"client": str(self.websocket.client), "erro": str(e)})
+        finally:
+            self.closed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "client": str(self.websocket.client),
+            "fila": len(self._pending),
+            "atraso_ms": round(self.lag_seconds() * 1000, 2),
+            "ultima_latencia_ms": round(self.last_latency_ms, 2),
+            "max_latencia_ms": round(self.max_latency_ms, 2),
+            "enviadas": self.sent,
+            "conflacoes": self.conflated,
+            "assinaturas": None if self.produtos is None else len(self.produtos) + len(self.campos),
+        }
+
+
+class WSConnectionManager:
+    """Conexões /ws com protocolo de deltas versionados (ver app.snapshot_delta).
+
+    O broadcast apenas enfileira a mensagem em cada cliente; o envio é feito
+    em paralelo pelas tasks de cada conexão, de modo que um cliente lento não
+    atrasa os demais. Clientes com mensagem pendente há mais de
+    ``max_lag_seconds`` são desconectados.
+
+    Assinaturas: um cliente que envia
+    ``{"type": "subscribe", "produtos": [...], "campos": [...]}`` deixa de
+    receber o stream completo e passa a receber só mensagens
+    ``{"type": "update", "versao", "data", "removidos", "produtos"}`` com os
+    campos do snapshot e os produtos do catálogo (vendas e estoque, via
+    ``product_lookup``) que pediu e que mudaram. ``unsubscribe`` remove itens
+    (sem listas, todos) e ``{"type": "subscribe", "todos": true}`` volta ao
+    stream completo. Índices produto -> clientes e campo -> clientes fazem o
+    trabalho de cada publicação crescer com os assinantes interessados, não
+    com o total de conexões.
+    """
+
+    def __init__(
+        self,
+        snapshot_provider: Callable[[], Dict[str, Any]],
+        delta_log_size: int = 256,
+        queue_size: int = 32,
+        max_lag_seconds: float = 10.0,
+        product_lookup: Optional[Callable[[Iterable[str]], Dict[str, Dict[str, int]]]] = None,
+        max_subscriptions: int = 1000,
+    ):
+        self._snapshot_provider = snapshot_provider
+        self._product_lookup = product_lookup or self._lookup_in_snapshot
+        self.max_subscriptions = max_subscriptions
+        self._by_product: Dict[str, Set[_ClientConnection]] = {}
+        self._by_field: Dict[str, Set[_ClientConnection]] = {}
+        # Último valor roteado de cada produto assinado (só mudanças são enviadas)
+        self._product_values: Dict[str, Dict[str, int]] = {}
+        self._clients: Dict[WebSocket, _ClientConnection] = {}
+        self._snapshot: dict = {}
+        self._full_text: Optional[str] = None  # snapshot completo já serializado
+        self._deltas = DeltaLog(delta_log_size)
+        self.queue_size = queue_size
+        self.max_lag_seconds = max_lag_seconds
+        self.evicted = 0
+        self.last_broadcast_ms = 0.0
+
+    @property
+    def active(self) -> list:
+        return list(self._clients)
+
+    @property
+    def versao(self) -> int:
+        return int(self._snapshot.get('versao') or 0)
+
+    @property
+    def subscribed_products(self) -> int:
+        return len(self._by_product)
+
+    async def connect(self, websocket: WebSocket, versao: Optional[int] = None):
+        await websocket.accept()
+        latest = self._snapshot_provider()
+        if latest and int(latest.get('versao') or 0) != self.versao:
+            await self.publish(latest)
+        client = _ClientConnection(websocket, self.queue_size)
+        self._clients[websocket] = client
+        client.start()
+        logger.info("ws_connected", extra={"total_active": len(self._clients), "client": str(websocket.client)})
+        # Cliente que reconecta recebe só o que perdeu; os demais, snapshot inicial
+        await self.resume(websocket, versao)
+
+    async def disconnect(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
+        if client:
+            self._drop_subscriptions(client)
+        if client and client.task:
+            client.task.cancel()
+        logger.info("ws_disconnected", extra={"total_active": len(self._clients), "client": str(websocket.client)})
+
+    async def publish(self, snapshot: dict):
+        """Registra um novo snapshot e difunde o delta em relação ao anterior."""
+        previous = self._snapshot
+        versao = int(snapshot.get('versao') or 0)
+        if previous and versao == self.versao:
+            return
+        self._snapshot = snapshot
+        self._full_text = None
+        base = int(previous.get('versao') or 0) if previous else 0
+        origem = snapshot.get('csv_modificado_em')
+        if not previous or versao < base:
+            # Sem base (primeiro snapshot ou carregador reiniciado): resync completo
+            self._deltas.clear()
+            await self.broadcast(self._full_message())
+            for client in self._filtered_clients():
+                client.enqueue(self._filtered_full(client), partial(self._filtered_full, client))
+            return
+        # Versões intermediárias podem ter sido conflacionadas: o delta vale sobre ``base``
+        delta = diff_snapshots(previous, snapshot)
+        self._deltas.append(versao, delta, base)
+        await self.broadcast({'type': 'delta', 'base': base, 'versao': versao, **delta}, origem=origem)
+        self._route(versao, delta, origem)
+
+    def _filtered_clients(self):
+        return [c for c in self._clients.values() if c.filtered]
+
+    def _route(self, versao: int, delta: Dict[str, Any], origem: Optional[float]):
+        """Enfileira para cada assinante só os campos e produtos que ele pediu e que mudaram."""
+        if not self._by_field and not self._by_product:
+            return
+        updates: Dict[_ClientConnection, Dict[str, Any]] = {}
+
+        def update_for(client):
+            msg = updates.get(client)
+            if msg is None:
+                msg = updates[client] = {'type': 'update', 'versao': versao, 'data': {}, 'removidos': {}, 'produtos': {}}
+            return msg
+
+        for part in ('data', 'removidos'):
+            for field, value in delta[part].items():
+                for client in self._by_field.get(field, ()):
+                    update_for(client)[part][field] = value
+        if self._by_product:
+            last = self._product_values
+            for produto, valores in self._product_lookup(list(self._by_product)).items():
+                if last.get(produto) == valores:
+                    continue
+                last[produto] = valores
+                for client in self._by_product[produto]:
+                    update_for(client)['produtos'][produto] = valores
+        for client, msg in updates.items():
+            if client.closed:
+                continue
+            client.enqueue(dumps_text(msg), partial(self._filtered_full, client), origem)
+        metrics.WS_ROUTED.inc(len(updates))
+
+    async def subscribe(self, websocket: WebSocket, produtos: Iterable = (), campos: Iterable = (), todos: bool = False):
+        """Assina produtos/campos (ou volta ao stream completo com ``todos``) e envia o estado atual deles."""
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        if todos:
+            self._drop_subscriptions(client)
+            client.produtos = None
+            await self.send_personal(websocket, self._full_message())
+            return
+        novos_produtos = {p for p in produtos if isinstance(p, str)} - (client.produtos or set())
+        novos_campos = {c for c in campos if isinstance(c, str)} - client.campos
+        total = len(client.produtos or ()) + len(client.campos) + len(novos_produtos) + len(novos_campos)
+        if total > self.max_subscriptions:
+            await self.send_personal(
+                websocket, {'type': 'erro', 'erro': f"limite de {self.max_subscriptions} assinaturas por conexão"}
+            )
+            return
+        if client.produtos is None:
+            client.produtos = set()
+        novos_rastreados = [p for p in novos_produtos if p not in self._by_product]
+        for produto in novos_produtos:
+            self._by_product.setdefault(produto, set()).add(client)
+        for campo in novos_campos:
+            self._by_field.setdefault(campo, set()).add(client)
+        client.produtos |= novos_produtos
+        client.campos |= novos_campos
+        # Produto recém-rastreado: a próxima publicação só envia se o valor mudar depois daqui
+        self._product_values.update(self._product_lookup(novos_rastreados))
+        await self.send_personal(websocket, self._filtered_full(client))
+
+    async def unsubscribe(self, websocket: WebSocket, produtos: Optional[Iterable] = None, campos: Optional[Iterable] = None):
+        """Remove assinaturas; sem ``produtos`` nem ``campos``, remove todas (o cliente fica sem mensagens)."""
+        client = self._clients.get(websocket)
+        if client is None or not client.filtered:
+            return
+        if produtos is None and campos is None:
+            produtos, campos = list(client.produtos), list(client.campos)
+        for produto in set(produtos or ()) & client.produtos:
+            self._unindex(self._by_product, produto, client)
+            client.produtos.discard(produto)
+        for campo in set(campos or ()) & client.campos:
+            self._unindex(self._by_field, campo, client)
+            client.campos.discard(campo)
+
+    def _unindex(self, index: Dict[str, Set[_ClientConnection]], key: str, client: _ClientConnection):
+        subscribers = index.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(client)
+        if not subscribers:
+            del index[key]
+            if index is self._by_product:
+                self._product_values.pop(key, None)
+
+    def _drop_subscriptions(self, client: _ClientConnection):
+        for produto in client.produtos or ():
+            self._unindex(self._by_product, produto, client)
+        for campo in client.campos:
+            self._unindex(self._by_field, campo, client)
+        client.campos = set()
+        if client.produtos:
+            client.produtos = set()
+
+    def _filtered_full(self, client: _ClientConnection) -> str:
+        """Estado atual de tudo o que o cliente assina (substitui o que ele tem)."""
+        snapshot = self._snapshot
+        return dumps_text({
+            'type': 'snapshot',
+            'versao': self.versao,
+            'data': {campo: snapshot[campo] for campo in client.campos if campo in snapshot},
+            'produtos': self._product_lookup(client.produtos or ()),
+        })
+
+    def _lookup_in_snapshot(self, produtos: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        # Sem índice do catálogo: só produtos presentes nos mapas do snapshot
+        vendas = self._snapshot.get('vendas_por_produto') or {}
+        estoque = self._snapshot.get('estoque_por_produto') or {}
+        return {
+            p: {'vendas': vendas.get(p, 0), 'estoque': estoque.get(p, 0)}
+            for p in produtos if p in vendas or p in estoque
+        }
+
+    async def resume(self, websocket: WebSocket, versao: Optional[int]):
+        """Envia delta acumulado desde ``versao`` ou snapshot completo."""
+        client = self._clients.get(websocket)
+        if client is not None and client.filtered:
+            await self.send_personal(websocket, self._filtered_full(client))
+            return
+        delta = self._deltas.since(versao, self.versao) if versao is not None else None
+        if delta is None:
+            await self.send_personal(websocket, self._full_message())
+        elif delta['data'] or delta['removidos']:
+            await self.send_personal(websocket, {'type': 'delta', 'base': versao, 'versao': self.versao, **delta})
+
+    def _full_message(self) -> str:
+        if self._full_text is None:
+            self._full_text = dumps_text({'type': 'snapshot', 'versao': self.versao, 'data': self._snapshot})
+        return self._full_text
+
+    async def broadcast(self, data, origem: Optional[float] = None):
+        start = time.perf_counter()
+        # Serializa uma vez; cada cliente recebe o mesmo frame de texto
+        data = data if isinstance(data, str) else dumps_text(data)
+        dead = []
+        for ws, client in list(self._clients.items()):
+            if client.closed or client.lag_seconds() > self.max_lag_seconds:
+                dead.append(ws)
+                continue
+            if client.filtered:
+                continue  # recebe só o que assinou (ver _route)
+            client.enqueue(data, self._full_message, origem)
+        elapsed = time.perf_counter() - start
+        self.last_broadcast_ms = elapsed * 1000
+        metrics.WS_BROADCAST_DURATION.observe(elapsed)
+        for ws in dead:
+            await self._evict(ws)
+
+    async def send_personal(self, websocket: WebSocket, data):
+        client = self._clients.get(websocket)
+        if client is not None:
+            full = partial(self._filtered_full, client) if client.filtered else self._full_message
+            client.enqueue(data if isinstance(data, str) else dumps_text(data), full)
+
+    async def _evict(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        self._drop_subscriptions(client)
+        if not client.closed:
+            self.evicted += 1
+            metrics.WS_DROPPED.inc(motivo='lento')
+            logger.warning("ws_slow_client_evicted", extra=client.stats())
+        else:
+            metrics.WS_DROPPED.inc(motivo='erro_envio')
+        if client.task:
+            client.task.cancel()
+        # Fechamento em segundo plano: um cliente travado não pode bloquear o broadcast
+        asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=1.0)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conexoes": len(self._clients),
+            "versao": self.versao,
+            "produtos_assinados": len(self._by_product),
+            "ultimo_broadcast_ms": round(self.last_broadcast_ms, 3),
+            "evictados": self.evicted,
+            "clientes": [c.stats() for c in self._clients.values()],
+        }
+
+
+__all__ = ["WSConnectionManager"]
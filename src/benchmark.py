@@ -0,0 +1,279 @@
+"""Benchmark do pipeline: carga do CSV, leitura incremental e latência da API.
+
+Gera CSVs sintéticos com ``gerar_dados`` (10 mil a 10 milhões de linhas),
+mede o tempo de ``DataManager._load_if_changed`` nos caminhos pandas e
+stdlib, o pico de memória alocada (tracemalloc), a latência de
+``/api/data`` e ``/api/historico`` via TestClient e, num processo novo, o
+tempo de import de ``app.main``, até o servidor aceitar requisições (fim do
+startup) e até ``/ready`` responder 200. O resultado é gravado em
+JSON com chaves estáveis, para comparar execuções de commits diferentes.
+
+Uso básico:
+  python src/benchmark.py
+
+Opções:
+  --linhas 10000,100000,1000000   (tamanhos de massa; 10000000 também é aceito)
+  --produtos 10                   (quantidade de produtos por massa, aceita lista: 10,1000)
+  --caminhos pandas,stdlib        (caminhos de parsing medidos)
+  --repeticoes 3                  (execuções por medida; vale a mediana)
+  --requisicoes 200               (requisições por endpoint)
+  --dados-dir /tmp/cara-bench     (CSVs gerados são reaproveitados entre execuções)
+  --saida bench_results.json
+  --comparar bench_anterior.json  (imprime a variação em relação a outra execução)
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.generate_batch_data import gerar_dados  # noqa: E402
+from app import data_loader  # noqa: E402
+from app.data_loader import DataManager  # noqa: E402
+
+# Linhas acrescentadas ao CSV para medir a leitura incremental
+LINHAS_TAIL = 1000
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[idx]
+
+
+def _resumo_ms(amostras):
+    ms = [s * 1000 for s in amostras]
+    return {
+        'mediana_ms': round(statistics.median(ms), 3),
+        'p95_ms': round(_percentil(ms, 95), 3),
+        'min_ms': round(min(ms), 3),
+        'max_ms': round(max(ms), 3),
+    }
+
+
+def preparar_csv(dados_dir: Path, linhas: int, produtos: int) -> Path:
+    """Gera (ou reaproveita) um CSV com ~``linhas`` linhas e ``produtos`` produtos."""
+    saida = dados_dir / f'vendas_{linhas}_{produtos}.csv'
+    if saida.exists():
+        return saida
+    nomes = [f'Produto {i:05d}' for i in range(produtos)]
+    passos = max(1, -(-linhas // produtos))
+    gerar_dados(saida, duracao_min=passos - 1, intervalo_min=1, produtos=nomes, estoque_inicial=10_000, seed=42)
+    return saida
+
+
+def _com_caminho(caminho: str):
+    """Força o caminho de parsing trocando ``data_loader.pd`` (None = stdlib)."""
+    original = data_loader.pd
+    if caminho == 'stdlib':
+        data_loader.pd = None
+    elif original is None:
+        raise RuntimeError('pandas não instalado')
+    return original
+
+
+def medir_carga(csv_path: Path, caminho: str, repeticoes: int) -> dict:
+    original = _com_caminho(caminho)
+    try:
+        tempos = []
+        for _ in range(repeticoes):
+            dm = DataManager(csv_path)
+            gc.collect()
+            start = time.perf_counter()
+            dm._load_if_changed(force=True)
+            tempos.append(time.perf_counter() - start)
+        linhas = dm.get_snapshot().get('linhas', 0)
+
+        # Pico de memória em execução separada: tracemalloc distorce o tempo
+        dm = DataManager(csv_path)
+        gc.collect()
+        tracemalloc.start()
+        dm._load_if_changed(force=True)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Leitura incremental: acrescenta linhas e relê só o final do arquivo
+        tempos_tail = []
+        tamanho = csv_path.stat().st_size
+        try:
+            for _ in range(repeticoes):
+                with csv_path.open('a', encoding='utf-8', newline='') as f:
+                    f.writelines(f'2099-01-01T00:00,Produto 00000,1,{i}\n' for i in range(LINHAS_TAIL))
+                start = time.perf_counter()
+                dm._load_if_changed()
+                tempos_tail.append(time.perf_counter() - start)
+        finally:
+            with csv_path.open('r+b') as f:
+                f.truncate(tamanho)
+    finally:
+        data_loader.pd = original
+    return {
+        'linhas': linhas,
+        'carga': _resumo_ms(tempos),
+        'linhas_por_s': round(linhas / statistics.median(tempos)) if linhas else 0,
+        'pico_memoria_mb': round(pico / 1024 / 1024, 2),
+        'tail': {'linhas': LINHAS_TAIL, **_resumo_ms(tempos_tail)},
+    }
+
+
+def medir_api(csv_path: Path, requisicoes: int) -> dict:
+    from fastapi.testclient import TestClient
+    import app.main as main
+
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    anterior = main.data_manager
+    main.data_manager = dm
+    try:
+        client = TestClient(main.app)
+        resultado = {}
+        for nome, url in (('api_data', '/api/data'), ('api_historico', '/api/historico?limit=500')):
+            client.get(url)  # aquecimento
+            amostras = []
+            for _ in range(requisicoes):
+                start = time.perf_counter()
+                resp = client.get(url)
+                amostras.append(time.perf_counter() - start)
+                resp.raise_for_status()
+            resultado[nome] = {'bytes': len(resp.content), **_resumo_ms(amostras)}
+        return resultado
+    finally:
+        main.data_manager = anterior
+
+
+# Executado num processo novo (import a frio) com CSV_PATH apontando para a massa
+_PARTIDA = r'''
+import json, sys, time
+inicio = time.perf_counter()
+import app.main as main
+importado = time.perf_counter()
+pandas_no_import = 'pandas' in sys.modules
+from fastapi.testclient import TestClient
+partida = time.perf_counter()
+with TestClient(main.app) as client:
+    aceitando = time.perf_counter()
+    while client.get('/ready').status_code != 200:
+        time.sleep(0.002)
+    pronto = time.perf_counter()
+print(json.dumps({
+    'import': importado - inicio, 'aceitando': aceitando - partida, 'pronto': pronto - partida,
+    'pandas_no_import': pandas_no_import,
+}))
+'''
+
+
+def medir_partida(csv_path: Path, repeticoes: int) -> dict:
+    env = dict(os.environ, CSV_PATH=str(csv_path), LOG_DIR=tempfile.mkdtemp(prefix='cara-bench-logs-'))
+    env.pop('SNAPSHOT_SOCKET', None)
+    env.pop('CSV_CACHE_DIR', None)
+    amostras = []
+    for _ in range(repeticoes):
+        proc = subprocess.run(
+            [sys.executable, '-c', _PARTIDA], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        )
+        amostras.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        'import_ms': round(statistics.median(a['import'] for a in amostras) * 1000, 1),
+        'aceitando_ms': round(statistics.median(a['aceitando'] for a in amostras) * 1000, 1),
+        'pronto_ms': round(statistics.median(a['pronto'] for a in amostras) * 1000, 1),
+        'pandas_no_import': amostras[0]['pandas_no_import'],
+    }
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    pandas = getattr(data_loader.pd, '__version__', None)
+    return {
+        'commit': commit,
+        'executado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pandas,
+    }
+
+
+def comparar(atual: dict, anterior: dict):
+    """Imprime a variação das medianas entre duas execuções (mesma massa/caminho)."""
+    base = {(r['linhas_alvo'], r['produtos'], r['caminho']): r for r in anterior.get('resultados', [])}
+    print(f"\nComparação com {anterior.get('meta', {}).get('commit')}:")
+    for r in atual['resultados']:
+        old = base.get((r['linhas_alvo'], r['produtos'], r['caminho']))
+        if old is None:
+            continue
+        pares = [(medida, old[medida]['mediana_ms'], r[medida]['mediana_ms']) for medida in ('carga', 'tail')]
+        if 'partida' in old and 'partida' in r:
+            pares += [(medida, old['partida'][f'{medida}_ms'], r['partida'][f'{medida}_ms'])
+                      for medida in ('import', 'pronto')]
+        for medida, a, b in pares:
+            variacao = (b - a) / a * 100 if a else 0.0
+            print(f"  {r['linhas_alvo']:>9} linhas {r['produtos']:>5} prod {r['caminho']:<6} {medida:<6} "
+                  f"{a:10.1f} -> {b:10.1f} ms ({variacao:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga do CSV e latência da API.")
+    parser.add_argument('--linhas', type=str, default="10000,100000,1000000")
+    parser.add_argument('--produtos', type=str, default="10")
+    parser.add_argument('--caminhos', type=str, default="pandas,stdlib")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--dados-dir', type=str, default=str(Path(tempfile.gettempdir()) / 'cara-bench'))
+    parser.add_argument('--saida', type=str, default="bench_results.json")
+    parser.add_argument('--comparar', type=str, default=None)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    dados_dir = Path(args.dados_dir)
+    caminhos = [c.strip() for c in args.caminhos.split(',') if c.strip()]
+    if data_loader.pd is None and 'pandas' in caminhos:
+        print("pandas não instalado: medindo apenas o caminho stdlib")
+        caminhos = [c for c in caminhos if c != 'pandas']
+
+    resultados = []
+    for linhas in (int(x) for x in args.linhas.split(',')):
+        for produtos in (int(x) for x in args.produtos.split(',')):
+            csv_path = preparar_csv(dados_dir, linhas, produtos)
+            api = medir_api(csv_path, args.requisicoes)
+            partida = medir_partida(csv_path, args.repeticoes)
+            print(f"{linhas:>9} linhas {produtos:>5} prod partida: import {partida['import_ms']:.0f} ms  "
+                  f"aceitando {partida['aceitando_ms']:.0f} ms  pronto {partida['pronto_ms']:.0f} ms")
+            for caminho in caminhos:
+                r = {'linhas_alvo': linhas, 'produtos': produtos, 'caminho': caminho}
+                r.update(medir_carga(csv_path, caminho, args.repeticoes))
+                r['api'] = api
+                r['partida'] = partida
+                resultados.append(r)
+                print(f"{linhas:>9} linhas {produtos:>5} prod {caminho:<6} "
+                      f"carga {r['carga']['mediana_ms']:10.1f} ms  tail {r['tail']['mediana_ms']:7.2f} ms  "
+                      f"pico {r['pico_memoria_mb']:8.1f} MB  /api/data {api['api_data']['mediana_ms']:.2f} ms  "
+                      f"/api/historico {api['api_historico']['mediana_ms']:.2f} ms")
+
+    saida = {'meta': _meta(), 'resultados': resultados}
+    Path(args.saida).write_text(json.dumps(saida, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"Resultados gravados em {args.saida}")
+    if args.comparar:
+        comparar(saida, json.loads(Path(args.comparar).read_text(encoding='utf-8')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark do custo de logging por requisição HTTP.
+
+Mede, na thread do event loop, o tempo por requisição do app real
+(``app.main.app`` via ``httpx.ASGITransport``, passando pelo middleware
+``log_requests``) e o tempo de uma chamada isolada ao logger ``http``, com:
+
+- ``sem_log``: logging desativado (referência);
+- ``sincrono``: handlers de console e arquivo no root (padrão);
+- ``fila``: ``LOG_QUEUE=1``, formatação e escrita numa thread de fundo;
+- ``sincrono_1pct`` / ``fila_1pct``: idem com ``LOG_SAMPLE=http=0.01``.
+
+"fila cheia" conta registros descartados porque o listener não acompanhou
+(``LOG_QUEUE_SIZE``); com descartes, o tempo da fila fica subestimado.
+
+O console vai para ``/dev/null`` e o arquivo para uma pasta temporária, para
+medir o custo do app e não o do terminal.
+
+Uso básico:
+  python src/benchmark_logging.py
+
+Opções:
+  --requisicoes 2000   (requisições por medida)
+  --repeticoes 5       (vale a mediana)
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+CENARIOS = {
+    'sem_log': None,
+    'sincrono': (False, ''),
+    'fila': (True, ''),
+    'sincrono_1pct': (False, 'http=0.01'),
+    'fila_1pct': (True, 'http=0.01'),
+}
+
+
+def _configurar(cenario, logging_setup):
+    logging_setup.shutdown_logging()
+    logging.disable(logging.NOTSET)
+    if cenario is None:
+        logging_setup.configure_logging(use_queue=False, sampling='')
+        logging.disable(logging.CRITICAL)
+        return
+    use_queue, sampling = cenario
+    logging_setup.configure_logging(use_queue=use_queue, sampling=sampling)
+
+
+async def _requisicoes(app, n: int) -> float:
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await client.get('/api/ws/stats')
+        inicio = time.perf_counter()
+        for _ in range(n):
+            await client.get('/api/ws/stats')
+        return (time.perf_counter() - inicio) / n * 1e6
+
+
+def _chamadas(n: int) -> float:
+    logger = logging.getLogger('http')
+    extra = {"method": "GET", "path": "/api/data", "query": "", "status_code": 200, "duration_ms": 0.5, "client": "127.0.0.1"}
+    inicio = time.perf_counter()
+    for _ in range(n):
+        logger.log(logging.INFO, "request", extra=extra)
+    return (time.perf_counter() - inicio) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do custo de logging por requisição.")
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['LOG_DIR'] = tempfile.mkdtemp(prefix='cara-bench-logs-')
+    sys.stderr = open(os.devnull, 'w')  # o StreamHandler usa o sys.stderr do momento da configuração
+    from app import logging_setup, metrics
+    from app.main import app
+
+    print(f"{'cenário':<15} {'requisição (µs)':>16} {'chamada de log (µs)':>20} {'fila cheia':>11}")
+    for nome, cenario in CENARIOS.items():
+        _configurar(cenario, logging_setup)
+        descartados = metrics.LOG_DISCARDED.value(motivo='fila_cheia')
+        req = statistics.median(asyncio.run(_requisicoes(app, args.requisicoes)) for _ in range(args.repeticoes))
+        log = statistics.median(_chamadas(args.requisicoes) for _ in range(args.repeticoes))
+        logging_setup.shutdown_logging()  # esvazia a fila antes do próximo cenário
+        descartados = metrics.LOG_DISCARDED.value(motivo='fila_cheia') - descartados
+        print(f"{nome:<15} {req:>16.1f} {log:>20.2f} {descartados:>11.0f}")
+    logging.disable(logging.NOTSET)
+
+
+if __name__ == '__main__':
+    main()
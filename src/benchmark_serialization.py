@@ -0,0 +1,89 @@
+"""Benchmark da serialização de snapshots (REST e WebSocket).
+
+Compara o caminho antigo — ``make_json_safe`` percorrendo o objeto e depois
+``json.dumps`` como no ``JSONResponse``/``send_json`` do Starlette — com
+``app.serialization.dumps`` (orjson, se instalado), em snapshots com mapas
+de produtos de tamanhos crescentes e valores numpy, como os do caminho pandas.
+
+Uso básico:
+  python src/benchmark_serialization.py
+
+Opções:
+  --produtos 10,1000,10000,100000  (tamanhos do mapa de produtos)
+  --repeticoes 20                  (vale a mediana)
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+
+from app import serialization  # noqa: E402
+
+
+def make_json_safe(obj):
+    """Conversão usada antes da camada única de serialização."""
+    if hasattr(obj, 'item'):
+        return obj.item()
+    elif hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    elif isinstance(obj, dict):
+        return {k: make_json_safe(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [make_json_safe(item) for item in obj]
+    return obj
+
+
+def antigo(snapshot) -> bytes:
+    return json.dumps(
+        make_json_safe(snapshot), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def snapshot_sintetico(produtos: int) -> dict:
+    nomes = [f"Produto {i}" for i in range(produtos)]
+    return {
+        'versao': 1,
+        'total_vendas': np.int64(produtos * 10),
+        'estoque_por_produto': {n: np.int64(i % 500) for i, n in enumerate(nomes)},
+        'vendas_por_produto': {n: np.int64(i * 3) for i, n in enumerate(nomes)},
+        'linhas': produtos * 10,
+        'ultimo_timestamp': '2025-08-15T22:00:00',
+    }
+
+
+def _mediana_ms(fn, arg, repeticoes: int) -> float:
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn(arg)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(amostras)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da serialização de snapshots.")
+    parser.add_argument('--produtos', type=str, default="10,1000,10000,100000")
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"backend: {serialization.BACKEND}")
+    for produtos in (int(x) for x in args.produtos.split(',')):
+        snapshot = snapshot_sintetico(produtos)
+        assert json.loads(antigo(snapshot)) == json.loads(serialization.dumps(snapshot))
+        t_antigo = _mediana_ms(antigo, snapshot, args.repeticoes)
+        t_novo = _mediana_ms(serialization.dumps, snapshot, args.repeticoes)
+        print(f"{produtos:>8} produtos  antigo {t_antigo:9.2f} ms  novo {t_novo:8.2f} ms  "
+              f"({t_antigo / t_novo if t_novo else float('inf'):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compacta o CSV append-only: períodos fechados vão para segmentos de arquivo.
+
+As linhas anteriores ao corte saem do CSV vivo para
+``<stem>.archive/<stem>-NNNNN.csv`` e seus agregados para
+``<csv>.checkpoint.json`` (ver app.checkpoint). O dashboard parte do
+checkpoint e lê só o CSV vivo; pode rodar com o dashboard e o simulador no ar
+(a troca do CSV vivo usa a trava de ``app.checkpoint.open_live``, a mesma da
+ingestão e do simulador).
+Uma compactação interrompida antes da troca do CSV vivo é concluída na
+próxima execução.
+
+Uso básico:
+  python src/compact_csv.py                 (arquiva os dias completos)
+
+Opções:
+  --csv app/sample_data.csv
+  --ate 2025-08-15T00:00     (arquiva as linhas com timestamp anterior a este)
+  --history-size 1000        (linhas recentes guardadas no checkpoint para /api/historico)
+  --reconstruir              (recria o checkpoint a partir dos segmentos arquivados)
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app import checkpoint  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compactar o CSV em segmentos de arquivo + checkpoint.")
+    parser.add_argument('--csv', type=str, default=os.getenv('CSV_PATH', 'app/sample_data.csv'))
+    parser.add_argument('--ate', type=str, default=None)
+    parser.add_argument('--history-size', type=int, default=int(os.getenv('HISTORY_CAPACITY', '1000')))
+    parser.add_argument('--reconstruir', action='store_true')
+    args = parser.parse_args()
+    csv_path = Path(args.csv)
+
+    if args.reconstruir:
+        linhas = checkpoint.rebuild(csv_path, args.history_size)
+        print(f"Checkpoint reconstruído a partir de {checkpoint.archive_dir(csv_path)} ({linhas} linhas)")
+        return
+    try:
+        resumo = checkpoint.compact(csv_path, args.ate, args.history_size)
+    except (RuntimeError, ValueError) as e:
+        sys.exit(f"Erro: {e}")
+    if not resumo['arquivadas']:
+        print(f"Nada a arquivar ({resumo['mantidas']} linhas no CSV vivo)")
+        return
+    print(f"{resumo['arquivadas']} linhas anteriores a {resumo['ate']} arquivadas em {resumo['segmento']}; "
+          f"{resumo['mantidas']} linhas permanecem em {csv_path}")
+
+
+if __name__ == '__main__':
+    main()
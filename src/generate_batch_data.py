@@ -37,27 +37,23 @@ def gerar_dados(
     inicio = agora - timedelta(minutes=duracao_min)
     passos = int(duracao_min / intervalo_min) + 1
     estoque = {p: estoque_inicial for p in produtos}
-    rows: list[dict[str, str | int]] = []
-    for i in range(passos):
-        ts = inicio + timedelta(minutes=i * intervalo_min)
-        # Para cada produto, gerar vendas aleatórias (podem ser zero)
-        for p in produtos:
-            vendas = random.randint(0, 10)
-            estoque[p] = max(0, estoque[p] - vendas)
-            rows.append(
-                {
-                    'timestamp': ts.replace(tzinfo=None).isoformat(timespec='minutes'),
-                    'produto': p,
-                    'vendas': vendas,
-                    'estoque': estoque[p],
-                }
-            )
     saida.parent.mkdir(parents=True, exist_ok=True)
+    total = 0
+    # Escreve passo a passo para suportar massas grandes (milhões de linhas) sem acumular em memória
     with saida.open('w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=['timestamp', 'produto', 'vendas', 'estoque'])
-        writer.writeheader()
-        writer.writerows(rows)
-    return saida, len(rows)
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'produto', 'vendas', 'estoque'])
+        for i in range(passos):
+            ts = (inicio + timedelta(minutes=i * intervalo_min)).replace(tzinfo=None).isoformat(timespec='minutes')
+            # Para cada produto, gerar vendas aleatórias (podem ser zero)
+            rows = []
+            for p in produtos:
+                vendas = random.randint(0, 10)
+                estoque[p] = max(0, estoque[p] - vendas)
+                rows.append((ts, p, vendas, estoque[p]))
+            writer.writerows(rows)
+            total += len(rows)
+    return saida, total
 
 
 def main():
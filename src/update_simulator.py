@@ -1,67 +1,426 @@
-"""Gera linhas aleatórias no CSV para demonstrar atualização em tempo quase real.
+"""Gera linhas aleatórias para demonstrar atualização em tempo quase real,
+ou carga alta com vários produtores para medir o pipeline ponta a ponta.
 
 Uso:
-  python update_simulator.py
+  python update_simulator.py                                  (demo: 1 linha a cada 3-8 s no CSV)
+  python update_simulator.py --api http://127.0.0.1:8000      (demo via POST /api/events)
+  python update_simulator.py --taxa 5000 --produtos 100000 --processos 4 --lote 100 --duracao 60 --sonda
+
+Opções:
+  --csv app/sample_data.csv  (padrão: $CSV_PATH)
+  --api URL         envia lotes para POST /api/events em vez de escrever no arquivo;
+                    o dashboard aplica as linhas sem esperar o watchdog
+  --lote 1          linhas por envio/gravação
+  --taxa 0          linhas por segundo somando todos os produtores (0 = modo demo)
+  --produtos 4      quantidade de produtos (SKUs), até 100000
+  --processos 1     processos produtores em paralelo (com --taxa)
+  --duracao 30      segundos de carga (com --taxa)
+  --sonda           cliente WebSocket que mede escrita -> chegada em /ws (p50/p95/p99)
+  --ws-url URL      padrão: derivado de --api, ou ws://127.0.0.1:8000/ws
+  --saida arq.json  grava o relatório em JSON
 Parar com Ctrl+C.
 """
 from __future__ import annotations
+import argparse
+import http.client
+import io
+import json
+import multiprocessing as mp
+import os
 import random
+import statistics
+import threading
 import time
+import urllib.parse
+import urllib.request
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime
 import csv
 
-CSV_PATH = Path(__file__).parent / 'app' / 'sample_data.csv'
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock
+    fcntl = None  # type: ignore
+
+try:
+    from websockets.sync.client import connect as ws_connect  # type: ignore
+except Exception:  # websockets opcional (vem com uvicorn[standard])
+    ws_connect = None  # type: ignore
+
+CSV_PATH = Path(os.getenv('CSV_PATH', str(Path(__file__).resolve().parent.parent / 'app' / 'sample_data.csv')))
 PRODUTOS = ["Produto A", "Produto B", "Produto C", "Produto D"]
+HEADER = ['timestamp', 'produto', 'vendas', 'estoque']
+# Leitura do fim do arquivo em blocos, até achar o último estoque de cada produto
+BLOCO_BYTES = 64 * 1024
+MAX_PRODUTOS = 100_000
+# Produto usado pela sonda: o estoque carrega o número de sequência da medida, negativo
+# para que a sonda esteja sempre entre os menores estoques publicados no snapshot (top N)
+SONDA = '__sonda__'
+INTERVALO_SONDA = 0.2
+
 
+def nomes_produtos(n: int) -> list[str]:
+    if n <= len(PRODUTOS):
+        return PRODUTOS[:n]
+    return [f"Produto {i:05d}" for i in range(n)]
 
-def ler_estoques_existentes():
-    estoque = {p: 100 for p in PRODUTOS}
-    if not CSV_PATH.exists():
+
+def ler_estoques_existentes(produtos=PRODUTOS, csv_path: Path = CSV_PATH):
+    """Último estoque de cada produto, lendo o CSV de trás para frente."""
+    estoque = {p: 100 for p in produtos}
+    if not csv_path.exists():
         return estoque
     try:
-        with CSV_PATH.open('r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                p = row.get('produto')
-                try:
-                    est = int(row.get('estoque', '') or 0)
-                except ValueError:
-                    continue
-                if p:
-                    estoque[p] = est
+        with csv_path.open('rb') as f:
+            header = next(csv.reader([f.readline().decode('utf-8')]))
+            inicio_dados = f.tell()
+            fim = f.seek(0, os.SEEK_END)
+            pendentes = set(produtos)
+            resto = b''
+            while pendentes and fim > inicio_dados:
+                pos = max(inicio_dados, fim - BLOCO_BYTES)
+                f.seek(pos)
+                bloco = f.read(fim - pos) + resto
+                fim = pos
+                linhas = bloco.split(b'\n')
+                # A primeira linha pode estar cortada; fica para o próximo bloco
+                resto = linhas.pop(0) if pos > inicio_dados else b''
+                for row in reversed(list(csv.DictReader((x.decode('utf-8') for x in linhas if x), fieldnames=header))):
+                    p = row.get('produto')
+                    if p in pendentes:
+                        try:
+                            estoque[p] = int(row.get('estoque', '') or 0)
+                        except ValueError:
+                            continue
+                        pendentes.discard(p)
     except Exception:
         pass
     return estoque
 
 
-def append_linha(produto: str, vendas: int, estoque: int):
-    header = ['timestamp', 'produto', 'vendas', 'estoque']
-    file_exists = CSV_PATH.exists()
-    with CSV_PATH.open('a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow({
-            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
-            'produto': produto,
-            'vendas': vendas,
-            'estoque': estoque,
-        })
+def ler_estoques_api(api: str, produtos=PRODUTOS):
+    """Último estoque de cada produto, paginando o catálogo em /api/produtos."""
+    estoque = {p: 100 for p in produtos}
+    cursor = None
+    try:
+        while True:
+            query = {'limit': 1000, **({'cursor': cursor} if cursor else {})}
+            with urllib.request.urlopen(f"{api}/api/produtos?{urllib.parse.urlencode(query)}", timeout=5) as r:
+                pagina = json.load(r)
+            estoque.update({i['produto']: i['estoque'] for i in pagina['itens'] if i['produto'] in estoque})
+            cursor = pagina.get('proximo')
+            if not cursor:
+                break
+    except Exception:
+        pass
+    return estoque
 
 
-def main():
-    estoque = ler_estoques_existentes()
-    print(f"Simulador escrevendo em {CSV_PATH}")
+class Escritor:
+    """Grava lotes no CSV (um write por lote) ou em POST /api/events (conexão reaproveitada)."""
+
+    def __init__(self, api: str | None, csv_path: Path = CSV_PATH):
+        self.api = api
+        self.csv_path = csv_path
+        self._conn = None
+
+    def enviar(self, linhas: list[dict]):
+        if self.api:
+            self._post(linhas)
+            return
+        buf = io.StringIO()
+        csv.DictWriter(buf, fieldnames=HEADER, lineterminator='\n').writerows(linhas)
+        # Reaberto a cada lote: a compactação (src/compact_csv.py) troca o CSV vivo por
+        # outro arquivo, e um handle mantido aberto gravaria no inode antigo, já sem nome
+        with self._abrir_vivo() as f:
+            f.write(buf.getvalue())
+
+    def _abrir_vivo(self):
+        # Mesma trava de app.checkpoint.open_live: a troca da compactação não engole o lote
+        while True:
+            f = self.csv_path.open('a', newline='', encoding='utf-8')
+            if fcntl is None:
+                return f
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.stat(self.csv_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def _post(self, linhas: list[dict]):
+        url = urllib.parse.urlsplit(self.api)
+        for tentativa in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            try:
+                self._conn.request('POST', url.path.rstrip('/') + '/api/events', json.dumps(linhas),
+                                   {'Content-Type': 'application/json'})
+                resposta = self._conn.getresponse()
+                resposta.read()
+                if resposta.status != 200:
+                    raise RuntimeError(f"POST /api/events respondeu {resposta.status}")
+                return
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if tentativa:
+                    raise
+
+    def fechar(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+def garantir_cabecalho(csv_path: Path = CSV_PATH):
+    if not csv_path.exists() or csv_path.stat().st_size == 0:
+        csv_path.parent.mkdir(parents=True, exist_ok=True)
+        with csv_path.open('a', newline='', encoding='utf-8') as f:
+            csv.writer(f, lineterminator='\n').writerow(HEADER)
+
+
+def gerar_lote(rng: random.Random, produtos: list[str], estoque: dict, tamanho: int) -> list[dict]:
+    agora = datetime.utcnow().isoformat(timespec='seconds')
+    linhas = []
+    for _ in range(tamanho):
+        produto = rng.choice(produtos)
+        vendas = rng.randint(1, 8)
+        atual = estoque.get(produto, 100) - vendas
+        # Reposição quando zera, para a carga não congelar o estoque em 0
+        estoque[produto] = atual if atual > 0 else 1000
+        linhas.append({'timestamp': agora, 'produto': produto, 'vendas': vendas, 'estoque': estoque[produto]})
+    return linhas
+
+
+def produtor(indice: int, api: str | None, csv_path: Path, produtos: list[str], taxa: float, lote: int,
+             fim: float, resultados, parar) -> None:
+    """Processo produtor: ``taxa`` linhas/s em lotes de ``lote``, até ``fim`` (epoch)."""
+    rng = random.Random(indice)
+    escritor = Escritor(api, csv_path)
+    estoque: dict = {}
+    intervalo = lote / taxa
+    proximo = time.monotonic()
+    enviadas = erros = 0
+    ultimo_erro = None
+    try:
+        while not parar.is_set() and time.time() < fim:
+            try:
+                escritor.enviar(gerar_lote(rng, produtos, estoque, lote))
+                enviadas += lote
+            except Exception as e:
+                erros += 1
+                ultimo_erro = repr(e)
+            proximo += intervalo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        escritor.fechar()
+        resultados.put({'produtor': indice, 'linhas': enviadas, 'erros': erros, 'ultimo_erro': ultimo_erro})
+
+
+class Sonda:
+    """Grava uma linha de ``SONDA`` a cada ``intervalo`` s e mede quando ela chega pelo /ws.
+
+    O estoque da linha é menos o número de sequência; snapshots conflacionados
+    entregam só a sequência mais recente, as anteriores contam como perdidas.
+    """
+
+    def __init__(self, api: str | None, csv_path: Path, ws_url: str, intervalo: float = INTERVALO_SONDA):
+        self.escritor = Escritor(api, csv_path)
+        self.ws_url = ws_url
+        self.intervalo = intervalo
+        self.enviadas: dict[int, float] = {}
+        self.latencias_ms: list[float] = []
+        self._parar = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._ws = None
+        self._conexao = ExitStack()
+
+    def iniciar(self):
+        self._ws = self._conexao.enter_context(ws_connect(self.ws_url, max_size=None))
+        self._ws.recv(timeout=10)  # snapshot inicial
+        for alvo in (self._receber, self._enviar):
+            t = threading.Thread(target=alvo, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _enviar(self):
+        seq = 0
+        while not self._parar.is_set():
+            seq += 1
+            self.enviadas[seq] = time.time()
+            try:
+                self.escritor.enviar([{
+                    'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+                    'produto': SONDA, 'vendas': 0, 'estoque': -seq,
+                }])
+            except Exception:
+                self.enviadas.pop(seq, None)
+            self._parar.wait(self.intervalo)
+
+    def _receber(self):
+        ultimo = 0
+        while not self._parar.is_set():
+            try:
+                msg = json.loads(self._ws.recv(timeout=0.5))
+            except TimeoutError:
+                continue
+            except Exception:
+                return
+            estoque = (msg.get('data') or {}).get('estoque_por_produto', {}).get(SONDA)
+            seq = -estoque if isinstance(estoque, int) else None
+            if seq is not None and seq > ultimo and seq in self.enviadas:
+                self.latencias_ms.append((time.time() - self.enviadas[seq]) * 1000)
+                ultimo = seq
+
+    def parar(self):
+        # Dá tempo para as últimas sondas chegarem
+        time.sleep(min(2.0, self.intervalo * 5))
+        self._parar.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        self._conexao.close()
+        self.escritor.fechar()
+
+    def resumo(self) -> dict:
+        lat = sorted(self.latencias_ms)
+        return {
+            'sondas_enviadas': len(self.enviadas),
+            'sondas_recebidas': len(lat),
+            'p50_ms': _percentil(lat, 50),
+            'p95_ms': _percentil(lat, 95),
+            'p99_ms': _percentil(lat, 99),
+            'max_ms': round(lat[-1], 2) if lat else None,
+        }
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    if len(valores) == 1:
+        return round(valores[0], 2)
+    return round(statistics.quantiles(valores, n=100, method='inclusive')[p - 1], 2)
+
+
+def _ws_url(api: str | None) -> str:
+    if not api:
+        return 'ws://127.0.0.1:8000/ws'
+    url = urllib.parse.urlsplit(api)
+    esquema = 'wss' if url.scheme == 'https' else 'ws'
+    return f"{esquema}://{url.netloc}{url.path.rstrip('/')}/ws"
+
+
+def modo_demo(api: str | None, csv_path: Path, lote: int, produtos: list[str]):
+    estoque = ler_estoques_api(api, produtos) if api else ler_estoques_existentes(produtos, csv_path)
+    escritor = Escritor(api, csv_path)
+    if not api:
+        garantir_cabecalho(csv_path)
+    print(f"Simulador escrevendo em {api + '/api/events' if api else csv_path}")
+    rng = random.Random()
     while True:
-        produto = random.choice(PRODUTOS)
-        vendas = random.randint(1, 8)
-        estoque[produto] = max(0, estoque.get(produto, 100) - vendas)
-        append_linha(produto, vendas, estoque[produto])
-        print(f"Linha adicionada: {produto} vendas={vendas} estoque={estoque[produto]}")
+        linhas = gerar_lote(rng, produtos, estoque, max(1, lote))
+        escritor.enviar(linhas)
+        for linha in linhas:
+            print(f"Linha adicionada: {linha['produto']} vendas={linha['vendas']} estoque={linha['estoque']}")
         time.sleep(random.uniform(3, 8))
 
 
+def modo_carga(args, produtos: list[str]) -> dict:
+    csv_path = Path(args.csv)
+    if not args.api:
+        garantir_cabecalho(csv_path)
+    sonda = None
+    if args.sonda:
+        if ws_connect is None:
+            raise SystemExit("--sonda requer o pacote websockets (pip install websockets)")
+        sonda = Sonda(args.api, csv_path, args.ws_url or _ws_url(args.api))
+        sonda.iniciar()
+    ctx = mp.get_context('spawn')
+    resultados, parar = ctx.Queue(), ctx.Event()
+    inicio = time.time()
+    fim = inicio + args.duracao
+    taxa = args.taxa / args.processos
+    processos = [
+        ctx.Process(target=produtor, args=(i, args.api, csv_path, produtos, taxa, args.lote, fim, resultados, parar))
+        for i in range(args.processos)
+    ]
+    for p in processos:
+        p.start()
+    print(f"{args.processos} produtor(es), {args.taxa:.0f} linhas/s alvo, lotes de {args.lote}, "
+          f"{len(produtos)} produtos, {args.duracao:.0f} s -> {args.api + '/api/events' if args.api else csv_path}")
+    try:
+        for p in processos:
+            p.join()
+    except KeyboardInterrupt:
+        parar.set()
+        for p in processos:
+            p.join()
+    decorrido = time.time() - inicio
+    por_produtor = [resultados.get() for _ in processos]
+    if sonda is not None:
+        sonda.parar()
+    linhas = sum(r['linhas'] for r in por_produtor)
+    relatorio = {
+        'alvo_linhas_s': args.taxa,
+        'linhas': linhas,
+        'erros': sum(r['erros'] for r in por_produtor),
+        'ultimo_erro': next((r['ultimo_erro'] for r in por_produtor if r['ultimo_erro']), None),
+        'duracao_s': round(decorrido, 2),
+        'vazao_linhas_s': round(linhas / decorrido, 1) if decorrido else 0.0,
+        'produtos': len(produtos),
+        'processos': args.processos,
+        'lote': args.lote,
+        'destino': 'api' if args.api else 'csv',
+    }
+    if sonda is not None:
+        relatorio['latencia_ponta_a_ponta'] = sonda.resumo()
+    return relatorio
+
+
+def imprimir(relatorio: dict):
+    print(f"Vazão: {relatorio['vazao_linhas_s']} linhas/s (alvo {relatorio['alvo_linhas_s']}), "
+          f"{relatorio['linhas']} linhas em {relatorio['duracao_s']} s, {relatorio['erros']} erro(s)")
+    if relatorio['ultimo_erro']:
+        print(f"Último erro: {relatorio['ultimo_erro']}")
+    lat = relatorio.get('latencia_ponta_a_ponta')
+    if lat:
+        print(f"Latência escrita -> /ws: p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  "
+              f"(max {lat['max_ms']} ms, {lat['sondas_recebidas']}/{lat['sondas_enviadas']} sondas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simular vendas em tempo quase real ou gerar carga.")
+    parser.add_argument('--csv', type=str, default=str(CSV_PATH))
+    parser.add_argument('--api', type=str, default=None)
+    parser.add_argument('--lote', type=int, default=1)
+    parser.add_argument('--taxa', type=float, default=0.0)
+    parser.add_argument('--produtos', type=int, default=len(PRODUTOS))
+    parser.add_argument('--processos', type=int, default=1)
+    parser.add_argument('--duracao', type=float, default=30.0)
+    parser.add_argument('--sonda', action='store_true')
+    parser.add_argument('--ws-url', type=str, default=None)
+    parser.add_argument('--saida', type=str, default=None)
+    args = parser.parse_args()
+    args.api = args.api.rstrip('/') if args.api else None
+    args.lote = max(1, args.lote)
+    args.processos = max(1, args.processos)
+    produtos = nomes_produtos(max(1, min(MAX_PRODUTOS, args.produtos)))
+
+    if args.taxa <= 0:
+        modo_demo(args.api, Path(args.csv), args.lote, produtos)
+        return
+    relatorio = modo_carga(args, produtos)
+    imprimir(relatorio)
+    if args.saida:
+        Path(args.saida).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"Relatório gravado em {args.saida}")
+
+
 if __name__ == '__main__':
     try:
         main()
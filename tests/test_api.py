@@ -1,10 +1,21 @@
+import time
+
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
-client = TestClient(app)
+
+@pytest.fixture(scope="module")
+def client():
+    # Com o startup rodando: a carga inicial é em segundo plano e /ready indica o fim
+    with TestClient(app) as c:
+        deadline = time.monotonic() + 10
+        while c.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        yield c
 
 
-def test_api_data_returns_snapshot():
+def test_api_data_returns_snapshot(client):
     r = client.get("/api/data")
     assert r.status_code == 200
     data = r.json()
@@ -12,9 +23,85 @@ def test_api_data_returns_snapshot():
     assert "linhas" in data
 
 
-def test_api_historico_limit():
+def test_api_historico_limit(client):
     r = client.get("/api/historico?limit=2")
     assert r.status_code == 200
     items = r.json()
     assert isinstance(items, list)
     assert len(items) <= 2
+
+
+def test_ws_sends_versioned_snapshot_on_connect(client):
+    with client.websocket_connect("/ws") as ws:
+        msg = ws.receive_json()
+    assert msg["type"] == "snapshot"
+    assert "versao" in msg
+
+
+def test_api_series_rejects_unknown_bucket(client):
+    assert client.get("/api/series?bucket=7m").status_code == 400
+    r = client.get("/api/series?bucket=5m&limit=3")
+    assert r.status_code == 200
+    assert isinstance(r.json(), list)
+
+
+def test_metrics_exposes_http_latency_per_route(client):
+    client.get("/api/historico?limit=1")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'dashboard_http_request_duration_seconds_count{method="GET",route="/api/historico"}' in r.text
+    assert "dashboard_ws_connections" in r.text
+
+
+def test_api_data_etag_and_conditional_get(client):
+    r = client.get("/api/data")
+    etag = r.headers["etag"]
+    assert r.headers["vary"] == "Accept-Encoding"
+    r2 = client.get("/api/data", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+
+
+def test_api_historico_gzip_reused_across_requests(client):
+    headers = {"Accept-Encoding": "gzip"}
+    r1 = client.get("/api/historico?limit=200", headers=headers)
+    r2 = client.get("/api/historico?limit=200", headers=headers)
+    assert r1.status_code == 200 and r1.json() == r2.json()
+    assert r1.headers["etag"] == r2.headers["etag"]
+    if len(r1.content) >= 512:
+        assert r1.headers["content-encoding"] == "gzip"
+
+
+def test_api_produtos_paginates_with_cursor(client):
+    assert client.get("/api/produtos?ordem=preco").status_code == 400
+    assert client.get("/api/produtos?cursor=invalido").status_code == 400
+    r = client.get("/api/produtos?ordem=vendas&desc=true&limit=1")
+    assert r.status_code == 200
+    page = r.json()
+    assert set(page) == {"itens", "total", "proximo"}
+    assert len(page["itens"]) <= 1
+
+
+def test_ready_and_api_data_report_warming_until_first_snapshot(tmp_path, monkeypatch):
+    import app.main as main
+    from app.data_loader import DataManager
+
+    dm = DataManager(tmp_path / "dados.csv")
+    monkeypatch.setattr(main, "data_manager", dm)
+    cold = TestClient(main.app)
+    r = cold.get("/api/data")
+    assert r.status_code == 503 and r.json() == {"estado": "sem_dados"}
+    assert r.headers["retry-after"] == "1"
+    assert cold.get("/ready").status_code == 503
+
+    (tmp_path / "dados.csv").write_text("timestamp,produto,vendas,estoque\n2025-08-15T20:00,A,5,90\n", encoding="utf-8")
+    dm.start(background=True)
+    try:
+        dm._warm_thread.join(5)
+        r = cold.get("/ready")
+        assert r.status_code == 200 and r.json()["estado"] == "pronto"
+        assert cold.get("/api/data").status_code == 200
+        assert dm.get_snapshot()["total_vendas"] == 5
+    finally:
+        dm.stop()
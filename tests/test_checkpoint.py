@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app import checkpoint, data_loader
+from app.data_loader import DataManager
+
+HEADER = "timestamp,produto,vendas,estoque\n"
+KEYS = ("linhas", "total_vendas", "vendas_por_produto", "estoque_por_produto", "ultimo_timestamp",
+        "vendas_por_produto_1h", "total_vendas_24h")
+
+
+@pytest.fixture(params=["pandas", "stdlib"])
+def loader_mode(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(data_loader, "pd", None)
+    elif data_loader.pd is None:
+        pytest.skip("pandas não instalado")
+    return request.param
+
+
+def _rows(dias):
+    linhas = []
+    for d in range(dias):
+        for h in range(0, 24, 3):
+            for i, produto in enumerate("ABC"):
+                linhas.append(f"2025-08-{10 + d:02d}T{h:02d}:{i * 7:02d},{produto},{d + h + i},{100 - d - i}\n")
+    return linhas
+
+
+def _load(csv_path, **kwargs):
+    dm = DataManager(csv_path, **kwargs)
+    dm._load_if_changed(force=True)
+    return dm
+
+
+def test_compaction_preserves_snapshot_and_loads_only_live_tail(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(4)), encoding="utf-8")
+    before = _load(csv_path)
+
+    resumo = checkpoint.compact(csv_path)
+    assert resumo["ate"] == "2025-08-13T00:00" and resumo["mantidas"] == 24
+    assert (tmp_path / "dados.archive" / "dados-00001.csv").exists()
+
+    after = _load(csv_path)
+    assert after._offset == csv_path.stat().st_size  # só o CSV vivo foi lido
+    for key in KEYS:
+        assert after.get_snapshot()[key] == before.get_snapshot()[key]
+    assert after.get_series("1h") == before.get_series("1h")
+    assert after.get_historico(50) == before.get_historico(50)
+
+
+def test_second_compaction_and_rebuild_agree(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(3)), encoding="utf-8")
+    checkpoint.compact(csv_path, "2025-08-11T00:00")
+    checkpoint.compact(csv_path, "2025-08-12T00:00")
+    state = json.loads(checkpoint.checkpoint_path(csv_path).read_text())
+    assert state["segmentos"] == ["dados-00001.csv", "dados-00002.csv"]
+    assert state["agregados"]["linhas"] == 48
+
+    checkpoint.rebuild(csv_path)
+    rebuilt = json.loads(checkpoint.checkpoint_path(csv_path).read_text())
+    for key in ("agregados", "rollups", "historico", "segmentos", "vivo"):
+        assert rebuilt[key] == state[key]
+
+
+def test_running_manager_picks_up_compaction_and_ignores_foreign_checkpoint(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(2)), encoding="utf-8")
+    dm = _load(csv_path)
+    total = dm.get_snapshot()["total_vendas"]
+    checkpoint.compact(csv_path)
+    dm._load_if_changed()
+    assert dm.get_snapshot()["total_vendas"] == total
+    assert dm._offset == csv_path.stat().st_size
+
+    # CSV substituído por outro: o checkpoint antigo não vale para ele
+    csv_path.write_text(HEADER + "2025-09-01T00:00,Z,1,1\n", encoding="utf-8")
+    dm._load_if_changed()
+    assert dm.get_snapshot()["total_vendas"] == 1
+
+
+def test_reload_during_compaction_never_publishes_partial_totals(tmp_path, monkeypatch):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(3)), encoding="utf-8")
+    dm = _load(csv_path)
+    total = dm.get_snapshot()["total_vendas"]
+    checkpoint.compact(csv_path, "2025-08-11T00:00")
+    dm._load_if_changed()
+
+    real_replace = checkpoint.os.replace
+    vistos = []
+
+    def replace(src, dst):
+        # Recarga entre cada troca atômica (segmento, checkpoint, CSV vivo)
+        real_replace(src, dst)
+        dm._load_if_changed(force=True)
+        vistos.append(dm.get_snapshot()["total_vendas"])
+
+    monkeypatch.setattr(checkpoint.os, "replace", replace)
+    checkpoint.compact(csv_path, "2025-08-12T00:00")
+    dm._load_if_changed()
+    assert vistos == [total] * 3
+    assert dm.get_snapshot()["total_vendas"] == total
+
+
+def test_append_during_swap_reaches_the_new_csv(tmp_path, monkeypatch):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(3)), encoding="utf-8")
+    dm = _load(csv_path)
+    total = dm.get_snapshot()["total_vendas"]
+    real_replace = checkpoint.os.replace
+    writers = []
+
+    def replace(src, dst):
+        if dst == csv_path:
+            # Ingestão chega entre a última cópia e a troca: espera a trava e grava no CSV novo
+            writer = threading.Thread(
+                target=dm.append_rows, args=([("2025-08-12T23:59", "A", 1000, 1)],)
+            )
+            writer.start()
+            writers.append(writer)
+            time.sleep(0.2)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(checkpoint.os, "replace", replace)
+    checkpoint.compact(csv_path, "2025-08-11T00:00")
+    writers[0].join(5)
+    assert "2025-08-12T23:59,A,1000,1\n" in csv_path.read_text(encoding="utf-8")
+    assert dm.get_snapshot()["total_vendas"] == total + 1000
+    dm._load_if_changed(force=True)
+    assert dm.get_snapshot()["total_vendas"] == total + 1000
+
+
+def test_interrupted_swap_is_completed_by_next_compaction(tmp_path, monkeypatch):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "".join(_rows(3)), encoding="utf-8")
+    total = _load(csv_path).get_snapshot()["total_vendas"]
+    real_replace = checkpoint.os.replace
+
+    def crash(src, dst):
+        if dst == csv_path:
+            raise KeyboardInterrupt
+        real_replace(src, dst)
+
+    monkeypatch.setattr(checkpoint.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoint.compact(csv_path, "2025-08-11T00:00")
+    monkeypatch.undo()
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("2025-08-12T23:59,A,1000,1\n")  # acrescentada depois da interrupção
+
+    assert _load(csv_path).get_snapshot() == {}  # carga adiada até a troca
+    assert checkpoint.compact(csv_path, "2025-08-11T00:00")["arquivadas"] == 0
+    after = _load(csv_path)
+    assert after.get_snapshot()["total_vendas"] == total + 1000
+    assert after._offset == csv_path.stat().st_size
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from app import data_loader
+from app.csv_columns import CsvSchema, iter_chunks
+from app.data_loader import DataManager
+
+HEADER = "timestamp,produto,vendas,estoque\n"
+
+# Dados "sujos": fora de ordem, células vazias/inválidas, produto vazio,
+# linha curta, linha em branco, aspas com vírgula e fuso explícito
+MESSY = HEADER + (
+    "2025-08-15T20:05,A,5,90\n"
+    "2025-08-15T20:00,B,,70\n"
+    "\n"
+    "2025-08-15T20:10,\"Produto, especial\",2,x\n"
+    "2025-08-15T20:03,,4,11\n"
+    "2025-08-15T20:15,A,3\n"
+    "2025-08-15T23:20+03:00,B,7,60\n"
+    ",C,1,5\n"
+    "2025-08-15T20:20,A,5.0,80\n"
+)
+
+
+def _load(csv_path, monkeypatch, mode, schema=None):
+    if mode == "stdlib":
+        monkeypatch.setattr(data_loader, "pd", None)
+    dm = DataManager(csv_path, history_size=5, schema=schema)
+    dm._load_if_changed(force=True)
+    monkeypatch.undo()
+    snap = dm.get_snapshot()
+    snap.pop("atualizado_em")
+    series = {res: dm.get_series(res) for res in dm.rollups.resolutions}
+    return snap, dm.get_historico(5), series
+
+
+def _random_csv(rows, produtos):
+    rnd = random.Random(7)
+    lines = [HEADER]
+    for i in range(rows):
+        minuto = i + rnd.randint(-3, 3)  # pequenos atrasos
+        lines.append(f"2025-08-15T{10 + minuto // 60:02d}:{minuto % 60:02d},P{rnd.randrange(produtos)},"
+                     f"{rnd.randint(0, 10)},{rnd.randint(0, 500)}\n")
+    return "".join(lines)
+
+
+@pytest.mark.skipif(data_loader.pd is None, reason="pandas não instalado")
+@pytest.mark.parametrize("content", [MESSY, _random_csv(600, 7)], ids=["sujo", "aleatorio"])
+@pytest.mark.parametrize("schema", [None, CsvSchema(chunk_threshold=0, chunk_rows=3)], ids=["inteiro", "blocos"])
+def test_pandas_and_stdlib_paths_produce_identical_state(tmp_path, monkeypatch, content, schema):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(content, encoding="utf-8")
+    assert _load(csv_path, monkeypatch, "pandas", schema) == _load(csv_path, monkeypatch, "stdlib")
+
+
+@pytest.mark.skipif(data_loader.pd is None, reason="pandas não instalado")
+@pytest.mark.parametrize("int_dtype", ["int8", "int32"])
+def test_counts_outside_int_dtype_are_not_truncated(tmp_path, monkeypatch, int_dtype):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "2025-08-15T20:00,A,3000000000,300\n2025-08-15T20:01,B,1,2\n", encoding="utf-8")
+    schema = CsvSchema(int_dtype=int_dtype, chunk_threshold=0)
+    snap = _load(csv_path, monkeypatch, "pandas", schema)
+    assert snap == _load(csv_path, monkeypatch, "stdlib")
+    assert snap[0]["total_vendas"] == 3000000001
+
+
+@pytest.mark.parametrize("mode", ["pandas", "stdlib"])
+def test_counts_outside_int64_count_as_invalid_cells(tmp_path, monkeypatch, mode):
+    if mode == "pandas" and data_loader.pd is None:
+        pytest.skip("pandas não instalado")
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:01,B,99999999999999999999,70\n",
+                        encoding="utf-8")
+    snap, _, _ = _load(csv_path, monkeypatch, mode)
+    assert snap["vendas_por_produto"] == {"A": 5, "B": 0}
+    assert snap["estoque_por_produto"] == {"A": 90, "B": 70}
+
+    # Leitura da cauda segue a mesma regra
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("2025-08-15T20:02,A,1,-99999999999999999999\n")
+    dm._load_if_changed()
+    assert dm.get_snapshot()["vendas_por_produto"] == {"A": 6, "B": 0}
+    assert dm.get_snapshot()["estoque_por_produto"]["A"] == 0
+
+
+@pytest.mark.skipif(data_loader.pd is None, reason="pandas não instalado")
+def test_chunked_load_stops_before_partial_last_line(tmp_path, monkeypatch):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:01,B,3", encoding="utf-8")
+    snap, historico, _ = _load(csv_path, monkeypatch, "pandas", CsvSchema(chunk_threshold=0, chunk_rows=1))
+    assert snap["linhas"] == 1
+    assert [r["produto"] for r in historico] == ["A"]
+
+
+def test_csv_schema_rejects_invalid_options():
+    with pytest.raises(ValueError):
+        CsvSchema(int_dtype="float32")
+    with pytest.raises(ValueError):
+        CsvSchema(chunk_rows=0)
+
+
+def test_iter_chunks_normalizes_and_splits_blocks():
+    data = MESSY.encode("utf-8")
+    chunks = list(iter_chunks(data, chunk_rows=3))
+    assert [len(c[0]) for c in chunks] == [2, 3, 3]  # linha em branco descartada
+    timestamps, produtos, vendas, estoque = (sum((list(c[i]) for c in chunks), []) for i in range(4))
+    assert produtos == ["A", "B", "Produto, especial", "N/A", "A", "B", "C", "A"]
+    assert vendas == [5, 0, 2, 4, 3, 7, 1, 0]
+    assert estoque == [90, 70, 0, 11, 0, 60, 5, 80]
+    assert timestamps[6] == ""
+
+
+def test_iter_chunks_with_missing_column_and_explicit_header():
+    chunks = list(iter_chunks(b"2025-08-15T20:00,A,1\n", fieldnames=["timestamp", "produto", "vendas"]))
+    assert [list(c) for c in chunks[0]] == [["2025-08-15T20:00"], ["A"], [1], [0]]
@@ -0,0 +1,309 @@
+import json
+
+import pytest
+
+from app import data_loader, directory_loader
+from app.data_loader import DataManager
+
+HEADER = "timestamp,produto,vendas,estoque\n"
+
+
+@pytest.fixture(params=["pandas", "stdlib"])
+def loader_mode(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(data_loader, "pd", None)
+    elif data_loader.pd is None:
+        pytest.skip("pandas não instalado")
+    return request.param
+
+
+def _write(path, text, mode="w"):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def test_incremental_append_matches_full_reload(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:00,B,3,70\n")
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    _write(csv_path, "2025-08-15T20:05,A,2,88\n2025-08-15T20:05,C,1,10\n", mode="a")
+    dm._load_if_changed()
+    snap = dm.get_snapshot()
+    assert snap["linhas"] == 4
+    assert snap["total_vendas"] == 11
+    assert snap["vendas_por_produto"] == {"A": 7, "B": 3, "C": 1}
+    assert snap["estoque_por_produto"] == {"A": 88, "B": 70, "C": 10}
+
+    full = DataManager(csv_path, incremental=False)
+    full._load_if_changed(force=True)
+    expected = full.get_snapshot()
+    for key in ("linhas", "total_vendas", "vendas_por_produto", "estoque_por_produto"):
+        assert snap[key] == expected[key]
+
+
+def test_incomplete_line_is_deferred(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n")
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    _write(csv_path, "2025-08-15T20:05,A,2", mode="a")
+    dm._load_if_changed()
+    assert dm.get_snapshot()["linhas"] == 1
+    _write(csv_path, ",88\n", mode="a")
+    dm._load_if_changed()
+    snap = dm.get_snapshot()
+    assert snap["linhas"] == 2
+    assert snap["estoque_por_produto"] == {"A": 88}
+
+
+def test_truncate_and_rewrite_trigger_full_rebuild(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:00,B,3,70\n")
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+
+    # Arquivo menor: truncamento
+    _write(csv_path, HEADER + "2025-08-16T08:00,Z,1,5\n")
+    dm._load_if_changed()
+    assert dm.get_snapshot()["vendas_por_produto"] == {"Z": 1}
+
+    # Reescrita com tamanho maior e mesmo cabeçalho
+    _write(csv_path, HEADER + "2025-08-17T08:00,Y,9,1\n2025-08-17T08:00,X,2,2\n")
+    dm._load_if_changed()
+    assert dm.get_snapshot()["vendas_por_produto"] == {"Y": 9, "X": 2}
+
+    # Mudança de cabeçalho (ordem das colunas)
+    _write(csv_path, "produto,timestamp,vendas,estoque\nW,2025-08-18T08:00,4,3\nW,2025-08-18T08:05,4,2\n")
+    dm._load_if_changed()
+    snap = dm.get_snapshot()
+    assert snap["vendas_por_produto"] == {"W": 8}
+    assert snap["estoque_por_produto"] == {"W": 2}
+
+
+def test_historico_served_from_memory(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:05,A,5,90\n2025-08-15T20:00,B,3,70\n")
+    dm = DataManager(csv_path, history_size=3)
+    dm._load_if_changed(force=True)
+    _write(csv_path, "2025-08-15T20:10,A,2,88\n2025-08-15T20:15,C,1,10\n", mode="a")
+    dm._load_if_changed()
+    rows = dm.get_historico(10)
+    assert [(r["produto"], r["vendas"]) for r in rows] == [("A", 5), ("A", 2), ("C", 1)]
+    assert dm.get_historico(1)[0]["estoque"] == 10
+
+
+def test_series_rollups_match_between_full_and_incremental(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:03,A,1,89\n")
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    _write(csv_path, "2025-08-15T20:04,A,2,87\n2025-08-15T20:05,A,4,83\n", mode="a")
+    dm._load_if_changed()
+    assert dm.get_series("5m") == [
+        {"timestamp": "2025-08-15T20:00", "produto": "A", "vendas": 8, "estoque": 87},
+        {"timestamp": "2025-08-15T20:05", "produto": "A", "vendas": 4, "estoque": 83},
+    ]
+
+
+def test_sidecar_cache_restores_state_and_parses_only_tail(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    cache_dir = tmp_path / "cache"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:01,B,3,70\n")
+    first = DataManager(csv_path, history_size=5, cache_dir=cache_dir)
+    first._load_if_changed(force=True)
+    first.stop()
+
+    _write(csv_path, "2025-08-15T20:02,A,2,88\n", mode="a")
+    restarted = DataManager(csv_path, history_size=5, cache_dir=cache_dir)
+    assert restarted._restore_cache()
+    assert restarted.get_snapshot()["linhas"] == 2
+    restarted._load_if_changed()
+
+    fresh = DataManager(csv_path, history_size=5)
+    fresh._load_if_changed(force=True)
+    snap, expected = restarted.get_snapshot(), fresh.get_snapshot()
+    for key in ("linhas", "total_vendas", "vendas_por_produto", "estoque_por_produto"):
+        assert snap[key] == expected[key]
+    assert restarted.get_historico(5) == fresh.get_historico(5)
+    assert restarted.get_series("1m") == fresh.get_series("1m")
+
+
+def test_sidecar_cache_written_outside_load_lock_and_dropped_after_reset(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    cache_dir = tmp_path / "cache"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n")
+    dm = DataManager(csv_path, cache_dir=cache_dir, cache_interval=0)
+    saves = []
+    original = dm._cache.save
+
+    def save(*args):
+        saves.append(dm._load_lock.locked())
+        return original(*args)
+
+    dm._cache.save = save
+    dm._load_if_changed(force=True)
+    assert saves == [False]
+    assert (cache_dir / "meta.json").exists()
+
+    with dm._load_lock:
+        stale = dm._cache_state(due=False)
+    dm._cache.reset()
+    assert not dm._cache.save(*stale)
+    assert not (cache_dir / "meta.json").exists()
+
+
+def test_sidecar_cache_saves_only_changed_buckets(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    cache_dir = tmp_path / "cache"
+    linhas = "".join(f"2025-08-{d:02d}T{h:02d}:00,P{h % 5},1,{h}\n" for d in range(1, 8) for h in range(24))
+    _write(csv_path, HEADER + linhas)
+    dm = DataManager(csv_path, history_size=5, cache_dir=cache_dir, cache_interval=0)
+    dm._load_if_changed(force=True)
+    base = cache_dir / "rollups-1.json"
+    base_bytes = base.read_bytes()
+
+    _write(csv_path, "2025-08-08T10:00,P1,2,50\n", mode="a")
+    dm._load_if_changed()
+    assert base.read_bytes() == base_bytes
+    diario = (cache_dir / "rollups-1.log").read_text(encoding="utf-8").splitlines()
+    assert len(diario) == 1 and len(diario[0]) < len(base_bytes) // 20
+    assert {res: list(by_product) for res, by_product in json.loads(diario[0]).items()} == {
+        "1m": ["P1"], "5m": ["P1"], "1h": ["P1"],
+    }
+    dm.stop()
+
+    restarted = DataManager(csv_path, history_size=5, cache_dir=cache_dir)
+    assert restarted._restore_cache()
+    fresh = DataManager(csv_path, history_size=5)
+    fresh._load_if_changed(force=True)
+    for res in ("1m", "1h"):
+        assert restarted.get_series(res) == fresh.get_series(res)
+    assert restarted.get_historico(5) == fresh.get_historico(5)
+
+
+def test_sidecar_cache_rejected_after_rewrite(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    cache_dir = tmp_path / "cache"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n")
+    dm = DataManager(csv_path, cache_dir=cache_dir)
+    dm._load_if_changed(force=True)
+    dm.stop()
+    _write(csv_path, HEADER + "2025-08-16T20:00,Z,1,10\n2025-08-16T20:00,Y,1,10\n")
+    assert not DataManager(csv_path, cache_dir=cache_dir)._restore_cache()
+
+
+def test_directory_mode_merges_partials_and_rereads_only_changed(tmp_path, monkeypatch):
+    day1 = tmp_path / "loja1_2025-08-15.csv"
+    day2 = tmp_path / "loja2_2025-08-15.csv"
+    _write(day1, HEADER + "2025-08-15T20:10,A,5,90\n2025-08-15T20:00,B,1,9\n")
+    _write(day2, HEADER + "2025-08-15T20:05,A,2,70\n2025-08-15T20:06,B,1,8\n")
+    (tmp_path / "ignorado.txt").write_text("x")
+    dm = DataManager(tmp_path, pattern="*.csv", workers=2, history_size=3)
+    try:
+        dm._load_if_changed(force=True)
+        snap = dm.get_snapshot()
+        assert snap["linhas"] == 4
+        assert snap["vendas_por_produto"] == {"A": 7, "B": 2}
+        # Estoque do timestamp mais recente, independente do arquivo
+        assert snap["estoque_por_produto"] == {"A": 90, "B": 8}
+        assert [r["timestamp"] for r in dm.get_historico(3)] == [
+            "2025-08-15T20:05", "2025-08-15T20:06", "2025-08-15T20:10",
+        ]
+
+        parsed = []
+        original = directory_loader.parse_csv_file
+        monkeypatch.setattr(
+            directory_loader, "parse_csv_file", lambda path, *a: parsed.append(path) or original(path, *a)
+        )
+        _write(day2, "2025-08-15T20:20,A,1,60\n", mode="a")
+        dm._load_if_changed()
+        assert parsed == [str(day2)]
+        snap = dm.get_snapshot()
+        assert snap["vendas_por_produto"] == {"A": 8, "B": 2}
+        assert snap["estoque_por_produto"]["A"] == 60
+    finally:
+        dm.stop()
+
+
+def test_directory_mode_updates_only_buckets_of_changed_files(tmp_path):
+    day1 = tmp_path / "loja1.csv"
+    day2 = tmp_path / "loja2.csv"
+    _write(day1, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T21:00,B,1,9\n")
+    _write(day2, HEADER + "2025-08-15T20:00,A,2,70\n")
+    dm = DataManager(tmp_path, pattern="*.csv", workers=1)
+    try:
+        dm._load_if_changed(force=True)
+        rollups = dm.rollups
+        rollups.drain_changes()
+
+        _write(day2, "2025-08-15T20:00,A,1,60\n", mode="a")
+        dm._load_if_changed()
+        assert dm.rollups is rollups
+        changes = rollups.drain_changes()
+        assert {res: sorted(by_product) for res, by_product in changes.items()} == {"1m": ["A"], "5m": ["A"], "1h": ["A"]}
+        assert [cell[:3] for cell in changes["1m"]["A"]] == [[1755288000, 8, 60]]
+
+        # Reescrita (estoque do bucket recua) e remoção: mesmo resultado da combinação completa
+        _write(day2, HEADER + "2025-08-15T19:59,A,4,10\n")
+        dm._load_if_changed()
+        full = DataManager(tmp_path, pattern="*.csv", workers=1)
+        full._load_if_changed(force=True)
+        for res in ("1m", "1h"):
+            assert dm.get_series(res) == full.get_series(res)
+        assert dm.get_series("1h")[0] == {"timestamp": "2025-08-15T19:00", "produto": "A", "vendas": 4, "estoque": 10}
+        full.stop()
+
+        day2.unlink()
+        dm._load_if_changed()
+        assert rollups.drain_changes() is None
+        assert dm.get_series("1h") == [
+            {"timestamp": "2025-08-15T20:00", "produto": "A", "vendas": 5, "estoque": 90},
+            {"timestamp": "2025-08-15T21:00", "produto": "B", "vendas": 1, "estoque": 9},
+        ]
+        assert dm.get_snapshot()["vendas_por_produto"] == {"A": 5, "B": 1}
+    finally:
+        dm.stop()
+
+
+def test_sliding_windows_in_snapshot_full_and_incremental(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T18:00,A,5,90\n2025-08-15T20:00,A,3,80\n2025-08-15T20:58,B,2,70\n")
+    dm = DataManager(csv_path, windows={"5m": 300, "1h": 3600})
+    dm._load_if_changed(force=True)
+    snap = dm.get_snapshot()
+    assert snap["vendas_por_produto_1h"] == {"A": 3, "B": 2}
+    assert snap["vendas_por_produto_5m"] == {"B": 2}
+    _write(csv_path, "2025-08-15T21:01,A,4,60\n", mode="a")
+    dm._load_if_changed()
+    snap = dm.get_snapshot()
+    assert snap["vendas_por_produto_5m"] == {"A": 4, "B": 2}
+    assert snap["total_vendas_1h"] == 6  # 20:00 saiu da janela de 1h
+
+    full = DataManager(csv_path, incremental=False, windows={"5m": 300, "1h": 3600})
+    full._load_if_changed(force=True)
+    expected = full.get_snapshot()
+    for key in ("total_vendas_5m", "vendas_por_produto_5m", "total_vendas_1h", "vendas_por_produto_1h"):
+        assert snap[key] == expected[key]
+
+
+def test_snapshot_carries_top_n_and_catalog_is_paginated(tmp_path, loader_mode):
+    csv_path = tmp_path / "dados.csv"
+    _write(csv_path, HEADER + "2025-08-15T20:00,A,5,90\n2025-08-15T20:00,B,9,70\n2025-08-15T20:00,C,1,10\n")
+    dm = DataManager(csv_path, top_n=2)
+    dm._load_if_changed(force=True)
+    snap = dm.get_snapshot()
+    assert snap["vendas_por_produto"] == {"B": 9, "A": 5}
+    assert snap["estoque_por_produto"] == {"C": 10, "B": 70}
+    assert snap["total_produtos"] == 3
+    _write(csv_path, "2025-08-15T20:05,C,20,5\n2025-08-15T20:05,D,2,200\n", mode="a")
+    dm._load_if_changed()
+    snap = dm.get_snapshot()
+    assert snap["vendas_por_produto"] == {"C": 21, "B": 9}
+    assert snap["vendas_por_produto_5m"] == {"C": 20, "D": 2}
+    assert snap["total_produtos"] == 4
+    page = dm.get_produtos(ordem="estoque", desc=True, limit=3)
+    assert [i["produto"] for i in page["itens"]] == ["D", "A", "B"]
+    assert dm.get_produtos(ordem="estoque", desc=True, cursor=page["proximo"])["itens"] == [
+        {"produto": "C", "vendas": 21, "estoque": 5}
+    ]
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import threading
+import time
+
+from app.event_bus import SnapshotBus
+from app.snapshot_delta import DeltaLog
+from app.ws_manager import WSConnectionManager
+
+
+def test_snapshots_from_loader_thread_reach_the_loop_with_conflation():
+    delivered = []
+
+    async def consumer(snapshot):
+        delivered.append(snapshot["versao"])
+        await asyncio.sleep(0.02)  # broadcast lento
+
+    async def scenario():
+        bus = SnapshotBus(consumer)
+        await bus.start()
+
+        def loader():
+            for v in range(1, 51):
+                bus.publish_threadsafe({"versao": v})
+                time.sleep(0.001)
+
+        thread = threading.Thread(target=loader)
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        await bus.stop()
+        return bus
+
+    bus = asyncio.run(scenario())
+    # O mais recente sempre chega; os intermediários podem ser conflacionados
+    assert delivered[-1] == 50
+    assert delivered == sorted(delivered)
+    assert bus.received == 50
+    assert bus.conflated == 50 - len(delivered) and bus.conflated > 0
+
+
+def test_skipped_versions_still_produce_deltas_over_last_broadcast():
+    class FakeWebSocket:
+        client = "fake"
+
+        def __init__(self):
+            self.sent = []
+
+        async def accept(self):
+            pass
+
+        async def send_text(self, data):
+            self.sent.append(json.loads(data))
+
+    async def scenario():
+        manager = WSConnectionManager(lambda: {})
+        ws = FakeWebSocket()
+        await manager.publish({"versao": 1, "total_vendas": 1})
+        await manager.connect(ws)
+        await manager.publish({"versao": 4, "total_vendas": 9, "csv_modificado_em": time.time()})
+        await asyncio.sleep(0.01)
+        await manager.disconnect(ws)
+        return ws.sent
+
+    sent = asyncio.run(scenario())
+    assert sent[0]["type"] == "snapshot"
+    assert sent[1]["type"] == "delta" and sent[1]["base"] == 1 and sent[1]["versao"] == 4
+    assert sent[1]["data"]["total_vendas"] == 9
+
+
+def test_delta_log_follows_bases_across_gaps():
+    log = DeltaLog()
+    log.append(2, {"data": {"total_vendas": 2}, "removidos": {}})
+    log.append(5, {"data": {"total_vendas": 5}, "removidos": {}}, base=2)
+    assert log.since(1, 5)["data"] == {"total_vendas": 5}
+    assert log.since(2, 5)["data"] == {"total_vendas": 5}
+    # Versão conflacionada (nunca difundida): sem base comum
+    assert log.since(3, 5) is None
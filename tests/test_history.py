@@ -0,0 +1,37 @@
+from app.history import HistoryBuffer
+
+
+def test_history_keeps_latest_rows_in_timestamp_order():
+    h = HistoryBuffer(capacity=3)
+    h.extend([
+        ("2025-08-15T20:00", "A", 1, 10),
+        ("2025-08-15T20:10", "A", 2, 8),
+        ("2025-08-15T20:05", "B", 3, 7),  # fora de ordem
+        ("2025-08-15T20:15", "B", 4, 3),
+        ("2025-08-15T19:00", "C", 9, 9),  # mais antiga que tudo: descartada
+    ])
+    assert [r["timestamp"] for r in h.tail(10)] == [
+        "2025-08-15T20:05",
+        "2025-08-15T20:10",
+        "2025-08-15T20:15",
+    ]
+    assert h.tail(1) == [{"timestamp": "2025-08-15T20:15", "produto": "B", "vendas": 4, "estoque": 3}]
+    stats = h.stats()
+    assert stats["linhas"] == 3 and stats["capacidade"] == 3
+    assert stats["bytes_aprox"] > 0
+
+
+def test_replica_applies_only_rows_it_does_not_have():
+    origem = HistoryBuffer(3)
+    origem.extend([("t1", "A", 1, 1), ("t3", "B", 1, 1)])
+    assert origem.drain_changes()["linhas"] == [["t1", "A", 1, 1], ["t3", "B", 1, 1]]
+    origem.append(("t2", "C", 1, 1))  # ainda não drenada
+
+    replica = HistoryBuffer(3)
+    replica.apply_state(origem.to_state(), replace=True)  # já inclui t2
+    origem.extend([("t4", "D", 1, 1), ("t0", "E", 1, 1)])  # t0: mais antiga que todas, descartada
+    replica.apply_state(origem.drain_changes())
+    assert replica.rows() == origem.rows() == [("t2", "C", 1, 1), ("t3", "B", 1, 1), ("t4", "D", 1, 1)]
+
+    origem.extend((f"t{i}", "F", 1, 1) for i in range(5, 9))  # mais que a capacidade
+    assert origem.drain_changes() is None
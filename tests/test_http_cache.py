@@ -0,0 +1,52 @@
+import gzip
+
+from app import http_cache, metrics
+from app.http_cache import EncodedBody, VersionedBodies, choose_encoding
+
+
+def test_choose_encoding_respects_q_values_and_size(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert choose_encoding("gzip, deflate", 10_000) == "gzip"
+    assert choose_encoding("gzip;q=0, deflate", 10_000) is None
+    assert choose_encoding("br, gzip", 10_000) == "gzip"  # sem brotli instalado
+    assert choose_encoding("gzip", 100) is None  # pequeno demais
+
+
+def test_versioned_bodies_build_once_per_version_and_compress_once():
+    calls = []
+    bodies = VersionedBodies()
+
+    def build():
+        calls.append(1)
+        return {"itens": list(range(500))}
+
+    a = bodies.get(1, ("data",), build)
+    b = bodies.get(1, ("data",), build)
+    assert a is b and len(calls) == 1
+    compressed = a.variant("gzip")
+    assert a.variant("gzip") is compressed
+    assert gzip.decompress(compressed) == a.identity
+    c = bodies.get(2, ("data",), build)
+    assert c is not a and len(calls) == 2
+    assert c.etag == a.etag  # mesmo conteúdo, mesmo ETag
+
+
+def test_versioned_bodies_lru_counts_and_invalidation():
+    hits = metrics.RESPONSE_CACHE.value(rota="historico", resultado="hit")
+    bodies = VersionedBodies(maxsize=2)
+    for limit in (10, 20, 10):
+        bodies.get(5, ("historico", limit), lambda: [limit])
+    bodies.get(5, ("historico", 30), lambda: [30])  # expulsa o limit=20 (menos recente)
+    bodies.get(5, ("historico", 20), lambda: [20])
+    assert bodies.stats() == {"entradas": 2, "capacidade": 2, "hits": 1, "misses": 4}
+    assert metrics.RESPONSE_CACHE.value(rota="historico", resultado="hit") == hits + 1
+
+    bodies.get(6, ("historico", 10), lambda: [10])
+    bodies.invalidate({"versao": 6})  # publicação da versão 6 libera as anteriores
+    assert bodies.stats()["entradas"] == 1
+    bodies.invalidate()
+    assert bodies.stats()["entradas"] == 0
+
+
+def test_etag_changes_with_content():
+    assert EncodedBody(b'{"a":1}').etag != EncodedBody(b'{"a":2}').etag
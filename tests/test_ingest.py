@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from app import main, metrics
+from app.data_loader import DataManager
+from app.ingest import GroupCommitter, append_to_csv, quarantine_path
+
+HEADER = "timestamp,produto,vendas,estoque\n"
+
+
+def test_group_committer_batches_concurrent_submissions():
+    commits = []
+    gate = threading.Event()
+
+    def commit(rows):
+        gate.wait(1)
+        commits.append(list(rows))
+        return len(commits)
+
+    committer = GroupCommitter(commit)
+    committer.start()
+    first = committer.submit([("t", "A", 1, 1)])
+    time.sleep(0.05)  # primeiro commit em andamento; os próximos se acumulam
+    rest = [committer.submit([("t", p, 1, 1)]) for p in "BCD"]
+    gate.set()
+    assert first.result(1) == 1
+    assert {f.result(1) for f in rest} == {2}
+    committer.stop()
+    assert [len(c) for c in commits] == [1, 3]
+
+
+def test_append_rows_applies_directly_and_watchdog_sees_no_change(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "2025-08-15T20:00,A,5,90\n", encoding="utf-8")
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    versao = dm.append_rows([("2025-08-15T20:01", "B", 2, 50), ("2025-08-15T20:02", "A", 1, 89)])
+    snap = dm.get_snapshot()
+    assert snap["versao"] == versao
+    assert snap["vendas_por_produto"] == {"A": 6, "B": 2}
+    assert snap["estoque_por_produto"] == {"A": 89, "B": 50}
+    assert dm._offset == csv_path.stat().st_size
+    dm._load_if_changed()
+    assert dm.get_snapshot()["versao"] == versao  # nada a reler
+
+    # Linha de outro produtor ainda não lida entra junto, pela cauda
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("2025-08-15T20:03,C,4,10\n")
+    dm.append_rows([("2025-08-15T20:04", "C", 1, 9)])
+    assert dm.get_snapshot()["vendas_por_produto"]["C"] == 5
+
+
+def test_append_to_csv_respects_header_order_and_waits_for_partial_line(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text("produto,timestamp,estoque,vendas\nA,2025-08-15T20:00,", encoding="utf-8")
+
+    def finish_line():
+        # Outro produtor termina a própria linha enquanto esperamos
+        time.sleep(0.1)
+        with open(csv_path, "a", encoding="utf-8") as f:
+            f.write("90,5\n")
+
+    threading.Thread(target=finish_line).start()
+    append_to_csv(csv_path, [("2025-08-15T20:01", "Café, moído", 2, 50)])
+    assert csv_path.read_text(encoding="utf-8").splitlines()[-2:] == [
+        "A,2025-08-15T20:00,90,5",
+        '"Café, moído",2025-08-15T20:01,50,2',
+    ]
+
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.write("B,2025-08-15T20:02")  # abandonada no meio por um produtor que caiu
+    dm = DataManager(csv_path)
+    dm._load_if_changed(force=True)
+    before = metrics.INGEST_QUARANTINED.value()
+    append_to_csv(csv_path, [("2025-08-15T20:03", "C", 1, 1)], tail_wait=0.05)
+    assert csv_path.read_text(encoding="utf-8").splitlines()[-1] == "C,2025-08-15T20:03,1,1"
+    assert quarantine_path(csv_path).read_text(encoding="utf-8") == "B,2025-08-15T20:02\n"
+    assert metrics.INGEST_QUARANTINED.value() == before + 1
+    # A ingestão segue normal e o leitor continua pela cauda
+    append_to_csv(csv_path, [("2025-08-15T20:04", "C", 1, 1)], tail_wait=0.05)
+    dm._load_if_changed()
+    assert dm.get_snapshot()["vendas_por_produto"] == {"A": 5, "Café, moído": 2, "C": 2}
+
+
+def test_post_events_endpoint(tmp_path, monkeypatch):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text(HEADER + "2025-08-15T20:00,A,5,90\n", encoding="utf-8")
+    monkeypatch.setattr(main, "data_manager", DataManager(csv_path))
+    with TestClient(main.app) as client:
+        r = client.post("/api/events", json=[{"produto": "B", "vendas": 3, "estoque": 7}])
+        assert r.status_code == 200 and r.json()["aceitos"] == 1
+        assert main.data_manager.get_snapshot()["vendas_por_produto"]["B"] == 3
+        assert client.post("/api/events", json=[{"produto": "B", "timestamp": "ontem"}]).status_code == 422
+        assert client.post("/api/events", json=[{"vendas": 1}]).status_code == 422
+        assert client.post("/api/events", json=[{"produto": "B\n2025-08-15T20:00,C"}]).status_code == 422
+        # Contagem fora de int64: recusada sem tocar no CSV, ingestões seguintes seguem normais
+        before = csv_path.read_bytes()
+        assert client.post("/api/events", json=[{"produto": "C", "vendas": 10**20}]).status_code == 422
+        assert client.post("/api/events", json=[{"produto": "C", "estoque": -(2**63) - 1}]).status_code == 422
+        with pytest.raises(ValueError):
+            main.data_manager.append_rows([("2025-08-15T20:01", "C", 1, 1), ("2025-08-15T20:01", "C", 10**20, 1)])
+        assert csv_path.read_bytes() == before
+        r = client.post("/api/events", json=[{"produto": "C", "vendas": 2**63 - 1}])
+        assert r.status_code == 200
+        assert main.data_manager.get_snapshot()["vendas_por_produto"]["C"] == 2**63 - 1
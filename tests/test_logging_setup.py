@@ -0,0 +1,85 @@
+import logging
+import queue
+
+import pytest
+
+from app.logging_setup import SamplingFilter, _QueueHandler, _QueueListener, parse_sampling
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _record(name, msg="request", level=logging.INFO):
+    return logging.LogRecord(name, level, __file__, 1, msg, None, None)
+
+
+def test_parse_sampling():
+    assert parse_sampling("http=0.01, api:snapshot_served=0.5,") == {"http": 0.01, "api:snapshot_served": 0.5}
+    assert parse_sampling("") == {}
+    for spec in ("http", "http=2", "=0.1", "http=x"):
+        with pytest.raises(ValueError):
+            parse_sampling(spec)
+
+
+def test_sampling_keeps_errors_and_applies_to_children_and_messages():
+    sampler = SamplingFilter({"http": 0.0, "api:snapshot_served": 0.0, "app": 1.0})
+    assert not sampler.filter(_record("http"))
+    assert not sampler.filter(_record("http.access"))
+    assert sampler.filter(_record("http", level=logging.ERROR))
+    assert not sampler.filter(_record("api", "snapshot_served"))
+    assert sampler.filter(_record("api", "outra"))
+    assert sampler.filter(_record("app.main"))
+    assert sampler.filter(_record("httpx"))  # prefixo de nome não é hierarquia
+
+
+def test_sampling_decision_is_shared_between_handlers():
+    sampler = SamplingFilter({"http": 0.5})
+    kept = []
+    for _ in range(200):
+        record = _record("http")
+        decisions = {sampler.filter(record), sampler.filter(record)}
+        assert len(decisions) == 1
+        if decisions.pop():
+            kept.append(record)
+    assert 0 < len(kept) < 200
+    assert all(r.amostra == 0.5 for r in kept)
+
+
+def test_sampling_decision_survives_interleaved_records():
+    # Outra thread filtra um registro entre os handlers do primeiro
+    sampler = SamplingFilter({"http": 0.5})
+    for _ in range(200):
+        first, other = _record("http"), _record("http")
+        decision = sampler.filter(first)
+        sampler.filter(other)
+        assert sampler.filter(first) == decision
+
+
+def test_queue_handler_defers_formatting_to_listener():
+    target = ListHandler()
+    target.setFormatter(logging.Formatter("%(name)s %(message)s"))
+    handler = _QueueHandler(queue.Queue(1))
+    listener = _QueueListener(handler.queue, target)
+    logger = logging.getLogger("test_queue_handler")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        logger.info("linha %d", 1)
+        try:
+            raise RuntimeError("falhou")
+        except RuntimeError:
+            logger.exception("erro")  # fila cheia: descartado sem bloquear
+        listener.start()
+        logger.info("linha %d", 2)
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    messages = [target.format(r) for r in target.records]
+    assert messages == ["test_queue_handler linha 1", "test_queue_handler linha 2"]
@@ -0,0 +1,25 @@
+from app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_registry_renders_prometheus_text_format():
+    registry = Registry()
+    reloads = registry.register(Counter('reloads_total', 'Recargas.', ('resultado',)))
+    latency = registry.register(Histogram('latency_seconds', 'Latência.', ('route',), buckets=(0.1, 1.0)))
+    age = registry.register(Gauge('age_seconds', 'Idade.'))
+    reloads.inc(resultado='sem_mudanca')
+    reloads.inc(2, resultado='incremental')
+    latency.observe(0.05, route='/api/data')
+    latency.observe(0.5, route='/api/data')
+    latency.observe(3.0, route='/api/data')
+    age.set_function(lambda: None)  # sem snapshot ainda
+
+    text = registry.render()
+    assert '# TYPE reloads_total counter' in text
+    assert 'reloads_total{resultado="incremental"} 2' in text
+    assert 'reloads_total{resultado="sem_mudanca"} 1' in text
+    # Buckets cumulativos
+    assert 'latency_seconds_bucket{route="/api/data",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/api/data",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/api/data",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/api/data"} 3' in text
+    assert 'age_seconds NaN' in text
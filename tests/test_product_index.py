@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from app.product_index import ProductIndex
+
+
+def _random_updates(rng, index, vendas, estoque, rounds=40):
+    for _ in range(rounds):
+        rows = []
+        for _ in range(rng.randint(1, 30)):
+            produto = f"P{rng.randint(0, 299):03d}"
+            vendas[produto] = vendas.get(produto, 0) + rng.randint(0, 9)
+            estoque[produto] = rng.randint(-5, 500)
+            rows.append(("2025-08-15T20:00", produto, 0, 0))
+        index.extend(rows)
+        index.refresh(vendas, estoque)
+
+
+def _all_pages(index, **kwargs):
+    itens, cursor = [], None
+    while True:
+        page = index.page(cursor=cursor, limit=7, **kwargs)
+        itens.extend(page["itens"])
+        cursor = page["proximo"]
+        if cursor is None:
+            return itens, page["total"]
+
+
+@pytest.mark.parametrize("ordem", ["produto", "vendas", "estoque"])
+@pytest.mark.parametrize("desc", [False, True])
+@pytest.mark.parametrize("prefixo", [None, "P1"])
+def test_pages_match_sorted_catalog(ordem, desc, prefixo):
+    rng = random.Random(3)
+    index, vendas, estoque = ProductIndex(), {}, {}
+    _random_updates(rng, index, vendas, estoque)
+    rows = [
+        {"produto": p, "vendas": vendas[p], "estoque": estoque[p]}
+        for p in vendas if prefixo is None or p.startswith(prefixo)
+    ]
+    key = (lambda r: r["produto"]) if ordem == "produto" else (lambda r: (r[ordem], r["produto"]))
+    expected = sorted(rows, key=key, reverse=desc)
+    itens, total = _all_pages(index, ordem=ordem, desc=desc, prefixo=prefixo)
+    assert itens == expected
+    assert total == len(expected)
+
+
+def test_top_follows_incremental_updates():
+    rng = random.Random(11)
+    index, vendas, estoque = ProductIndex(), {}, {}
+    _random_updates(rng, index, vendas, estoque)
+    assert index.top("vendas", 5, desc=True) == sorted(
+        vendas.items(), key=lambda kv: (kv[1], kv[0]), reverse=True
+    )[:5]
+    assert index.top("estoque", 5) == sorted(estoque.items(), key=lambda kv: (kv[1], kv[0]))[:5]
+    assert len(index) == len(vendas)
+
+
+def test_cursor_from_other_ordering_is_rejected():
+    index = ProductIndex()
+    index.refresh({"A": 1, "B": 2}, {"A": 5, "B": 3})
+    cursor = index.page(ordem="vendas", limit=1)["proximo"]
+    with pytest.raises(ValueError):
+        index.page(ordem="estoque", cursor=cursor)
+    with pytest.raises(ValueError):
+        index.page(cursor="nao-e-cursor")
+
+
+def test_replica_follows_drained_changes():
+    rng = random.Random(5)
+    index, vendas, estoque = ProductIndex(), {}, {}
+    replica = ProductIndex()
+    for _ in range(10):
+        _random_updates(rng, index, vendas, estoque, rounds=3)
+        changes = index.drain_changes()
+        if changes is None:
+            replica.apply_state(index.to_state(), replace=True)
+        else:
+            replica.apply_state(changes)
+        assert replica.to_state() == index.to_state()
+    index.invalidate()
+    index.refresh(vendas, estoque)
+    assert index.drain_changes() is None
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from app.reload_scheduler import ReloadScheduler
+
+
+def test_burst_of_triggers_is_coalesced_into_one_reload():
+    calls = []
+    scheduler = ReloadScheduler(lambda: calls.append(time.monotonic()), debounce=0.05, max_staleness=1.0)
+    scheduler.start()
+    try:
+        for _ in range(50):
+            scheduler.trigger()
+        assert scheduler.wait_idle(timeout=2)
+    finally:
+        scheduler.stop()
+    assert len(calls) == 1
+    stats = scheduler.stats()
+    assert stats["gatilhos"] == 50 and stats["agrupados"] == 49 and stats["recargas"] == 1
+
+
+def test_max_staleness_bounds_wait_under_continuous_triggers():
+    calls = []
+    scheduler = ReloadScheduler(lambda: calls.append(time.monotonic()), debounce=0.1, max_staleness=0.2)
+    scheduler.start()
+    try:
+        start = time.monotonic()
+        # Gatilhos a cada 20 ms: sem o limite, o debounce nunca venceria
+        while time.monotonic() - start < 0.7:
+            scheduler.trigger('polling')
+            time.sleep(0.02)
+        assert scheduler.wait_idle(timeout=2)
+    finally:
+        scheduler.stop()
+    assert len(calls) >= 3
+    assert calls[0] - start < 0.4
+
+
+def test_at_most_one_reload_in_flight():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def load():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    scheduler = ReloadScheduler(load, debounce=0.0, max_staleness=0.0)
+    scheduler.start()
+    try:
+        def burst():
+            for _ in range(10):
+                scheduler.trigger()
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=burst) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert scheduler.wait_idle(timeout=5)
+    finally:
+        scheduler.stop()
+    assert peak == 1
+    # Gatilhos durante uma recarga em andamento viram uma única próxima recarga
+    assert scheduler.stats()["recargas"] < 40
@@ -0,0 +1,38 @@
+from app.rollups import TimeRollups
+
+
+def test_rollups_bucket_and_range_query():
+    r = TimeRollups({"1m": 60, "5m": 300})
+    r.extend([
+        ("2025-08-15T20:00:10", "A", 2, 50),
+        ("2025-08-15T20:00:50", "A", 3, 47),
+        ("2025-08-15T20:04:00", "A", 1, 46),
+        ("2025-08-15T20:06:00", "A", 4, 42),
+        ("2025-08-15T20:01:00", "B", 5, 10),
+    ])
+    assert r.series("5m", ["A"]) == [
+        {"timestamp": "2025-08-15T20:00", "produto": "A", "vendas": 6, "estoque": 46},
+        {"timestamp": "2025-08-15T20:05", "produto": "A", "vendas": 4, "estoque": 42},
+    ]
+    minute = r.series("1m", ["A"])
+    assert [(x["timestamp"], x["vendas"]) for x in minute] == [
+        ("2025-08-15T20:00", 5),
+        ("2025-08-15T20:04", 1),
+        ("2025-08-15T20:06", 4),
+    ]
+    inicio = r.series("1m")[0]  # todos os produtos, em ordem de tempo
+    assert inicio["produto"] == "A"
+    assert len(r.series("1m", limit=1)) == 2  # último bucket de cada produto
+    recentes = r.series("1m", max_points=2)  # teto da resposta inteira, não por produto
+    assert [(x["timestamp"], x["produto"]) for x in recentes] == [("2025-08-15T20:04", "A"), ("2025-08-15T20:06", "A")]
+
+
+def test_rollups_state_roundtrip():
+    src = TimeRollups({"1m": 60})
+    src.extend([("2025-08-15T20:00", "A", 2, 50)])
+    dst = TimeRollups({"1m": 60})
+    dst.apply_state(src.to_state(), replace=True)
+    src.drain_changes()
+    src.extend([("2025-08-15T20:00:30", "A", 1, 49), ("2025-08-15T20:01", "A", 1, 48)])
+    dst.apply_state(src.drain_changes())
+    assert dst.series("1m") == src.series("1m")
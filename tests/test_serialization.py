@@ -0,0 +1,31 @@
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+from app import serialization
+
+
+def test_dumps_handles_numpy_pandas_and_datetimes():
+    payload = {
+        "total": np.int64(42),
+        "media": np.float32(1.5),
+        "quando": pd.Timestamp("2025-08-15T20:00:00"),
+        "dia": datetime.date(2025, 8, 15),
+        "produtos": {"Café": np.int32(3)},
+    }
+    assert json.loads(serialization.dumps(payload)) == {
+        "total": 42,
+        "media": 1.5,
+        "quando": "2025-08-15T20:00:00",
+        "dia": "2025-08-15",
+        "produtos": {"Café": 3},
+    }
+
+
+def test_dumps_matches_stdlib_compact_utf8():
+    obj = {"produto": "Pão de Açúcar", "vendas": [1, 2, 3], "ok": True, "nada": None}
+    expected = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert serialization.dumps(obj) == expected
+    assert serialization.loads(serialization.dumps_text(obj)) == obj
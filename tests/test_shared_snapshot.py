@@ -0,0 +1,80 @@
+import threading
+import time
+
+from app.data_loader import DataManager
+from app.shared_snapshot import SharedDataManager, SnapshotPublisher
+
+
+def _wait_for(predicate, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_worker_reads_snapshot_published_by_loader(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text("timestamp,produto,vendas,estoque\n2025-08-15T20:00,A,5,90\n", encoding="utf-8")
+    sock = str(tmp_path / "snap.sock")
+
+    loader = DataManager(csv_path, history_size=10)
+    publisher = SnapshotPublisher(loader, sock)
+    publisher.start()
+    loader._load_if_changed(force=True)
+
+    worker = SharedDataManager(sock, history_size=10, reconnect_interval=0.05)
+    received = []
+    worker.subscribe(received.append)
+    worker.start()
+    try:
+        assert _wait_for(lambda: worker.get_snapshot().get("linhas") == 1)
+
+        with csv_path.open("a", encoding="utf-8") as f:
+            f.write("2025-08-15T20:05,B,2,40\n")
+        loader._load_if_changed()
+        assert _wait_for(lambda: worker.get_snapshot().get("linhas") == 2)
+        assert worker.get_snapshot()["vendas_por_produto"] == {"A": 5, "B": 2}
+        assert worker.get_snapshot()["versao"] == loader.get_snapshot()["versao"]
+        assert [r["produto"] for r in worker.get_historico(5)] == ["A", "B"]
+        assert worker.get_series("1m") == loader.get_series("1m")
+        assert worker.get_produtos(ordem="vendas") == loader.get_produtos(ordem="vendas")
+        assert received
+    finally:
+        worker.stop()
+        publisher.stop()
+
+
+def test_changes_published_while_a_worker_attaches_reach_it(tmp_path):
+    csv_path = tmp_path / "dados.csv"
+    csv_path.write_text("timestamp,produto,vendas,estoque\n2025-08-15T20:00,A,5,90\n", encoding="utf-8")
+    sock = str(tmp_path / "snap.sock")
+    loader = DataManager(csv_path, history_size=10)
+    publisher = SnapshotPublisher(loader, sock)
+    publisher.start()
+    loader._load_if_changed(force=True)
+    loader._load_if_changed(force=True)  # drena o estado inicial, como um carregador já em uso
+
+    full_frame = publisher._full_frame
+
+    def slow_full_frame():
+        # Nova recarga (e publish) enquanto o estado completo vai para o worker
+        frame = full_frame()
+        with csv_path.open("a", encoding="utf-8") as f:
+            f.write("2025-08-15T20:05,B,2,40\n")
+        threading.Thread(target=loader._load_if_changed).start()
+        time.sleep(0.2)
+        return frame
+
+    publisher._full_frame = slow_full_frame
+    worker = SharedDataManager(sock, history_size=10, reconnect_interval=0.05)
+    worker.start()
+    try:
+        assert _wait_for(lambda: worker.get_snapshot().get("linhas") == 2)
+        assert worker.get_series("1m") == loader.get_series("1m")
+        assert worker.get_produtos(ordem="vendas") == loader.get_produtos(ordem="vendas")
+        assert worker.get_historico(10) == loader.get_historico(10)
+    finally:
+        worker.stop()
+        publisher.stop()
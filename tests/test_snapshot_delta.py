@@ -0,0 +1,52 @@
+from app.snapshot_delta import DeltaLog, diff_snapshots
+
+
+def _snap(versao, vendas, estoque, total):
+    return {
+        "versao": versao,
+        "total_vendas": total,
+        "vendas_por_produto": vendas,
+        "estoque_por_produto": estoque,
+        "linhas": versao,
+    }
+
+
+def test_diff_contains_only_changed_products():
+    old = _snap(1, {"A": 5, "B": 3}, {"A": 90, "B": 70}, 8)
+    new = _snap(2, {"A": 7, "B": 3}, {"A": 88}, 10)
+    delta = diff_snapshots(old, new)
+    assert delta["data"] == {
+        "total_vendas": 10,
+        "vendas_por_produto": {"A": 7},
+        "estoque_por_produto": {"A": 88},
+        "linhas": 2,
+    }
+    assert delta["removidos"] == {"estoque_por_produto": ["B"]}
+
+
+def test_delta_log_catch_up_and_resync():
+    snaps = [
+        _snap(1, {"A": 1}, {"A": 9}, 1),
+        _snap(2, {"A": 2}, {"A": 8}, 2),
+        _snap(3, {"A": 2}, {"A": 8, "B": 1}, 2),
+        _snap(4, {"A": 3}, {"A": 7}, 3),
+    ]
+    log = DeltaLog(maxlen=2)
+    for old, new in zip(snaps, snaps[1:]):
+        log.append(new["versao"], diff_snapshots(old, new))
+
+    catch_up = log.since(2, 4)
+    assert catch_up["data"]["vendas_por_produto"] == {"A": 3}
+    assert catch_up["data"]["estoque_por_produto"] == {"A": 7}
+    # B apareceu e sumiu dentro da janela: só a remoção importa
+    assert catch_up["removidos"] == {"estoque_por_produto": ["B"]}
+    assert log.since(4, 4) == {"data": {}, "removidos": {}}
+    # Versão 1 já saiu do log (maxlen=2): exige snapshot completo
+    assert log.since(1, 4) is None
+
+
+def test_window_maps_are_diffed_per_product():
+    old = {"versao": 1, "vendas_por_produto_5m": {"A": 1, "B": 2}}
+    new = {"versao": 2, "vendas_por_produto_5m": {"A": 1, "C": 3}}
+    delta = diff_snapshots(old, new)
+    assert delta == {"data": {"vendas_por_produto_5m": {"C": 3}}, "removidos": {"vendas_por_produto_5m": ["B"]}}
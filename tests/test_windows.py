@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.rollups import TimeRollups
+from app.windows import SlidingWindows, parse_windows
+
+
+def _brute_force(rows, seconds, granularity=60):
+    head = max(int(datetime.fromisoformat(ts).timestamp()) // granularity for ts, *_ in rows)
+    size = -(-seconds // granularity)
+    totals = {}
+    for ts, produto, vendas, _ in rows:
+        if int(datetime.fromisoformat(ts).timestamp()) // granularity > head - size:
+            totals[produto] = totals.get(produto, 0) + vendas
+    return totals
+
+
+def test_windows_match_brute_force_in_any_arrival_order():
+    rng = random.Random(7)
+    base = datetime(2025, 8, 15, 0, 0)
+    rows = []
+    for _ in range(3000):
+        base += timedelta(seconds=rng.randint(0, 90))
+        ts = (base - timedelta(seconds=rng.randint(0, 600))).isoformat()  # algumas linhas atrasadas
+        rows.append((ts, rng.choice("ABCDE"), rng.randint(1, 9), 0))
+    windows = SlidingWindows({"5m": 300, "1h": 3600, "24h": 86400})
+    for i in range(0, len(rows), 250):
+        windows.extend(rows[i:i + 250])
+        snap = windows.to_snapshot()
+        for name, seconds in windows.windows.items():
+            expected = _brute_force(rows[:i + 250], seconds)
+            assert {p: v for p, v in snap["vendas_por_produto_" + name].items() if v} == expected
+            assert snap["total_vendas_" + name] == sum(expected.values())
+
+
+def test_windows_rebuilt_from_rollups_match_row_by_row():
+    rows = [(f"2025-08-15T{h:02d}:{m:02d}", "AB"[m % 2], m + 1, 0) for h in range(20, 23) for m in range(0, 60, 7)]
+    rollups = TimeRollups()
+    rollups.extend(rows)
+    from_rows = SlidingWindows()
+    from_rows.extend(rows)
+    from_rollups = SlidingWindows()
+    from_rollups.load_rollups(rollups)
+    assert from_rollups.to_snapshot() == from_rows.to_snapshot()
+
+
+def test_gap_longer_than_window_clears_it():
+    windows = SlidingWindows({"5m": 300})
+    windows.extend([("2025-08-15T20:00", "A", 5, 0)])
+    windows.extend([("2025-08-15T21:00", "B", 1, 0)])
+    assert windows.to_snapshot() == {"total_vendas_5m": 1, "vendas_por_produto_5m": {"B": 1}}
+
+
+def test_parse_windows():
+    assert parse_windows("5m, 1h,24h") == {"5m": 300, "1h": 3600, "24h": 86400}
+    with pytest.raises(ValueError):
+        parse_windows("5 minutos")
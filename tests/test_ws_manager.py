@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+from app.ws_manager import WSConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.client = "fake"
+        self.sent = []
+        self.closed = False
+        self._gate = asyncio.Event()
+        if not stalled:
+            self._gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        await self._gate.wait()
+        self.sent.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def _snap(versao, vendas):
+    return {"versao": versao, "vendas_por_produto": {"A": vendas}, "total_vendas": vendas}
+
+
+def test_slow_client_does_not_block_others_and_is_evicted():
+    async def scenario():
+        manager = WSConnectionManager(lambda: {}, queue_size=2, max_lag_seconds=0.05)
+        fast, slow = FakeWebSocket(), FakeWebSocket(stalled=True)
+        await manager.connect(fast)
+        await manager.connect(slow)
+        for v in range(1, 6):
+            await manager.publish(_snap(v, v))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        # Cliente rápido recebeu tudo em ordem; o lento teve a fila conflacionada
+        assert fast.sent[-1]["versao"] == 5
+        slow_stats = [c for c in manager.stats()["clientes"] if c["fila"]][0]
+        assert slow_stats["fila"] <= 2 and slow_stats["conflacoes"] >= 1
+
+        await asyncio.sleep(0.06)
+        await manager.publish(_snap(6, 6))
+        await asyncio.sleep(0)
+        assert manager.stats()["conexoes"] == 1
+        assert manager.evicted == 1
+        await manager.disconnect(fast)
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_serializes_once_for_all_clients():
+    async def scenario():
+        manager = WSConnectionManager(lambda: {})
+        await manager.publish(_snap(1, 1))
+        clients = [FakeWebSocket() for _ in range(3)]
+        for ws in clients:
+            await manager.connect(ws)
+        await manager.publish(_snap(2, 7))
+        frames = [c._pending[-1][1] for c in manager._clients.values()]
+        await asyncio.sleep(0.01)
+        for ws in clients:
+            await manager.disconnect(ws)
+        return frames, clients
+
+    frames, clients = asyncio.run(scenario())
+    assert isinstance(frames[0], str) and all(f is frames[0] for f in frames)
+    assert all(c.sent[-1]["data"]["total_vendas"] == 7 for c in clients)
+
+
+def test_subscribed_client_receives_only_its_products_and_fields():
+    catalogo = {"A": {"vendas": 1, "estoque": 10}, "B": {"vendas": 2, "estoque": 20}}
+
+    def lookup(produtos):
+        return {p: dict(catalogo[p]) for p in produtos if p in catalogo}
+
+    async def scenario():
+        manager = WSConnectionManager(lambda: {}, product_lookup=lookup, max_subscriptions=3)
+        await manager.publish(_snap(1, 1))
+        full, sub = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(full)
+        await manager.connect(sub)
+        await manager.subscribe(sub, produtos=["A"], campos=["total_vendas"])
+        await asyncio.sleep(0.01)
+        assert sub.sent[-1] == {
+            "type": "snapshot", "versao": 1, "data": {"total_vendas": 1},
+            "produtos": {"A": {"vendas": 1, "estoque": 10}},
+        }
+
+        # Só B muda: nenhum produto roteado, apenas o campo assinado
+        catalogo["B"]["vendas"] = 5
+        await manager.publish(_snap(2, 2))
+        catalogo["A"]["estoque"] = 9
+        await manager.publish(_snap(3, 3))
+        await asyncio.sleep(0.01)
+        assert [m["type"] for m in full.sent[-2:]] == ["delta", "delta"]
+        assert sub.sent[-2:] == [
+            {"type": "update", "versao": 2, "data": {"total_vendas": 2}, "removidos": {}, "produtos": {}},
+            {"type": "update", "versao": 3, "data": {"total_vendas": 3}, "removidos": {},
+             "produtos": {"A": {"vendas": 1, "estoque": 9}}},
+        ]
+        assert manager.stats()["produtos_assinados"] == 1
+
+        # Limite por conexão rejeita a mensagem inteira
+        await manager.subscribe(sub, produtos=["B", "C"])
+        await asyncio.sleep(0.01)
+        assert sub.sent[-1]["type"] == "erro"
+
+        await manager.unsubscribe(sub)
+        assert manager.stats()["produtos_assinados"] == 0
+        catalogo["A"]["estoque"] = 8
+        await manager.publish(_snap(4, 4))
+        await asyncio.sleep(0.01)
+        assert sub.sent[-1]["type"] == "erro"
+
+        # "todos" volta ao stream completo
+        await manager.subscribe(sub, todos=True)
+        await manager.publish(_snap(5, 5))
+        await asyncio.sleep(0.01)
+        assert sub.sent[-1]["type"] == "delta" and sub.sent[-1]["versao"] == 5
+        for ws in (full, sub):
+            await manager.disconnect(ws)
+
+    asyncio.run(scenario())